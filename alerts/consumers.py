@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from users.models import User
+from .events import overlay_token, streamer_group
+from .queue import AlertQueue
+
+logger = logging.getLogger('emoterush.alerts')
+
+class OverlayConsumer(AsyncJsonWebsocketConsumer):
+    """ Websocket for a streamer's overlay; receives donation and unlocked-emote alerts. Requires the streamer's overlay token. """
+
+    async def connect(self):
+        username = self.scope['url_route']['kwargs']['username'].lstrip('@')
+        self.streamer_id = await self.get_streamer_id(username)
+        if self.streamer_id is None:
+            await self.close(code=4404)
+            return
+        token = parse_qs(self.scope.get('query_string', b'').decode()).get('token', [''])[0]
+        if not constant_time_compare(token, overlay_token(self.streamer_id)):
+            await self.close(code=4403)
+            return
+        self.queue = AlertQueue(
+            max_depth=settings.ALERTS_MAX_QUEUE_DEPTH,
+            priority_rarities=settings.ALERTS_PRIORITY_RARITIES,
+            max_emotes_per_alert=settings.ALERTS_MAX_EMOTES_PER_ALERT,
+        )
+        self.wakeup = asyncio.Event()
+        self.group_name = streamer_group(self.streamer_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        self.flusher = asyncio.create_task(self.flush_loop())
+
+    async def disconnect(self, code):
+        if getattr(self, 'group_name', None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, 'flusher', None):
+            self.flusher.cancel()
+
+    async def receive_json(self, content, **kwargs):
+        # Overlays are receive-only; answer pings so clients can detect dead sockets
+        if content.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
+
+    async def alert_donation(self, event):
+        self.enqueue(event['payload'])
+
+    async def alert_emotes(self, event):
+        self.enqueue(event['payload'])
+
+    def enqueue(self, payload):
+        if self.queue.push(payload):
+            self.wakeup.set()  # Priority lane skips the coalescing window
+
+    async def flush_loop(self):
+        """ Send coalesced alerts once per window; a slow socket only delays, never grows, the queue. """
+        window = max(settings.ALERTS_COALESCE_WINDOW, 0.01)
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=window)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                for alert in self.queue.drain():
+                    await self.send_json(alert)
+            except Exception:
+                # Without the flusher nothing drains the queue; drop the socket so the overlay reconnects
+                logger.exception("Could not send alerts to overlay of streamer %s", self.streamer_id)
+                await self.close(code=1011)
+                return
+
+    @database_sync_to_async
+    def get_streamer_id(self, username):
+        return User.objects.filter(username=username).values_list('id', flat=True).first()
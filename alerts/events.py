@@ -0,0 +1,63 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils.crypto import salted_hmac
+
+logger = logging.getLogger('emoterush.alerts')
+
+def streamer_group(streamer_id):
+    """ Channel layer group every overlay of a streamer joins. """
+    return f"alerts.streamer.{streamer_id}"
+
+def overlay_token(streamer_id):
+    """ Secret an overlay must present (?token=) to receive a streamer's alerts; derived from SECRET_KEY, so nothing is stored. """
+    return salted_hmac('emoterush.alerts.overlay', str(streamer_id), algorithm='sha256').hexdigest()[:32]
+
+def send_to_streamer(streamer_id, event_type, payload):
+    """ Push one event to all overlays of a streamer. """
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    async_to_sync(layer.group_send)(streamer_group(streamer_id), {'type': event_type, 'payload': payload})
+
+def donation_payloads(donation, unlocked_emotes):
+    """ Build the donation and unlocked-emote events for a completed donation. """
+    from emotes.catalog import get_catalog
+    by_name = get_catalog().by_name
+    donor = (donation.donor.display_name or donation.donor.username) if donation.donor else None
+    donation_event = {
+        'event': 'donation',
+        'donation_id': donation.id,
+        'donor': donor,
+        'amount': f"{donation.amount:.2f}",
+        'timestamp': donation.timestamp.isoformat() if donation.timestamp else None,
+    }
+    emotes_event = {
+        'event': 'emotes_unlocked',
+        'donation_id': donation.id,
+        'donor': donor,
+        'emotes': [
+            {'name': name, 'chat_display_name': f"ER:{name}", 'rarity': by_name[name].rarity if name in by_name else None}
+            for name in unlocked_emotes
+        ],
+    }
+    return donation_event, emotes_event
+
+def publish_donation(donation, unlocked_emotes=None):
+    """ Queue donation alerts to be sent once the surrounding transaction commits. """
+    if not donation.streamer_id:
+        return
+    unlocked_emotes = list(unlocked_emotes or [])
+
+    def send():
+        try:
+            donation_event, emotes_event = donation_payloads(donation, unlocked_emotes)
+            send_to_streamer(donation.streamer_id, 'alert.donation', donation_event)
+            if unlocked_emotes:
+                send_to_streamer(donation.streamer_id, 'alert.emotes', emotes_event)
+        except Exception:
+            # The donation has committed; a channel layer outage only costs the overlay its alert
+            logger.exception("Could not send alerts for donation %s", donation.id)
+
+    transaction.on_commit(send, robust=True)
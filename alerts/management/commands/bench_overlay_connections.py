@@ -0,0 +1,71 @@
+import asyncio
+import resource
+import time
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from users.models import User
+from alerts.events import overlay_token, streamer_group
+from alerts.routing import websocket_urlpatterns
+
+def rss_kb():
+    """ Peak resident set size of this process in KB (Linux reports KB). """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class Command(BaseCommand):
+    help = 'Benchmark how many concurrent overlay websocket connections one process can hold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default=None, help='Streamer to connect overlays to (default: first user).')
+        parser.add_argument('--connections', type=int, default=1000, help='Concurrent overlay connections to open.')
+        parser.add_argument('--batch', type=int, default=200, help='Connections opened concurrently per batch.')
+        parser.add_argument('--broadcasts', type=int, default=10, help='Alerts fanned out to every connection.')
+        parser.add_argument('--window', type=float, default=0.05, help='Alert coalescing window in seconds during the run.')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(username=options['username']) if options['username'] else User.objects.order_by('id')
+        streamer = user.first()
+        if streamer is None:
+            raise CommandError("No streamer found; create a user or pass --username.")
+        if options['broadcasts'] < 1 or options['connections'] < 1 or options['batch'] < 1:
+            raise CommandError("--connections, --batch and --broadcasts must be at least 1.")
+        with override_settings(ALERTS_COALESCE_WINDOW=options['window']):
+            asyncio.run(self.run(streamer, options))
+
+    async def run(self, streamer, options):
+        app = URLRouter(websocket_urlpatterns)
+        path = f"/ws/alerts/{streamer.username}/?token={overlay_token(streamer.id)}"
+        total, batch = options['connections'], options['batch']
+        communicators = []
+
+        rss_before = rss_kb()
+        started = time.perf_counter()
+        for offset in range(0, total, batch):
+            group = [WebsocketCommunicator(app, path) for _ in range(min(batch, total - offset))]
+            results = await asyncio.gather(*(c.connect() for c in group))
+            failed = sum(1 for connected, _ in results if not connected)
+            if failed:
+                raise CommandError(f"{failed} connection(s) rejected at offset {offset}.")
+            communicators += group
+        connect_time = time.perf_counter() - started
+        rss_after = rss_kb()
+
+        layer = get_channel_layer()
+        fanout_times = []
+        for i in range(options['broadcasts']):
+            sent = time.perf_counter()
+            await layer.group_send(streamer_group(streamer.id), {'type': 'alert.donation', 'payload': {'event': 'donation', 'seq': i}})
+            await asyncio.gather(*(c.receive_json_from(timeout=30) for c in communicators))
+            fanout_times.append(time.perf_counter() - sent)
+
+        await asyncio.gather(*(c.disconnect() for c in communicators))
+
+        per_conn = (rss_after - rss_before) / total
+        fanout_times.sort()
+        self.stdout.write(f"Connections:          {total}")
+        self.stdout.write(f"Connect rate:         {total / connect_time:,.0f} conn/s")
+        self.stdout.write(f"Memory per conn:      {per_conn:.1f} KB (peak RSS {rss_after / 1024:.0f} MB)")
+        self.stdout.write(f"Fan-out p50 / max:    {fanout_times[len(fanout_times) // 2] * 1000:.1f} ms / {fanout_times[-1] * 1000:.1f} ms")
+        self.stdout.write(f"Delivered alerts/s:   {total * len(fanout_times) / sum(fanout_times):,.0f}")
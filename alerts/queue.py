@@ -0,0 +1,86 @@
+from collections import deque
+from decimal import Decimal
+
+class AlertQueue:
+    """
+    Bounded, coalescing alert buffer for one overlay connection.
+
+    Priority events (emotes of a priority rarity) go to their own lane and are never
+    merged or dropped before normal events. Unlocked-emote events are merged per donor
+    within a window ("X unlocked 37 emotes"). Once a lane is full, its oldest alerts are
+    folded into a single summary, so memory stays bounded however slow or stalled the
+    overlay is, and every dropped alert is still counted.
+    """
+
+    def __init__(self, max_depth=50, priority_rarities=('mythic', 'novelty'), max_emotes_per_alert=10):
+        self.max_depth = max_depth
+        self.priority_rarities = set(priority_rarities)
+        self.max_emotes_per_alert = max_emotes_per_alert
+        self.priority = deque()
+        self.normal = deque()
+        self.unlocks = {}  # donor -> merged emotes_unlocked alert
+        self.dropped_count = 0
+        self.dropped_amount = Decimal('0.00')
+
+    def __len__(self):
+        return len(self.priority) + len(self.normal) + len(self.unlocks) + (1 if self.dropped_count else 0)
+
+    @property
+    def has_priority(self):
+        return bool(self.priority)
+
+    def push(self, payload):
+        """ Add an alert payload; returns True if it landed in the priority lane. """
+        if payload.get('event') == 'emotes_unlocked':
+            return self.push_unlocks(payload)
+        self.normal.append(payload)
+        while len(self.normal) > self.max_depth:
+            self.drop(self.normal.popleft())
+        return False
+
+    def push_unlocks(self, payload):
+        emotes = payload.get('emotes', [])
+        rare = [e for e in emotes if e.get('rarity') in self.priority_rarities]
+        regular = [e for e in emotes if e.get('rarity') not in self.priority_rarities]
+        for emote in rare:
+            self.priority.append({**payload, 'event': 'rare_unlock', 'emotes': [emote], 'count': 1})
+        while len(self.priority) > self.max_depth:
+            self.drop(self.priority.popleft())
+        if regular:
+            self.merge_unlocks(payload.get('donor'), regular)
+        return bool(rare)
+
+    def merge_unlocks(self, donor, emotes):
+        alert = self.unlocks.get(donor)
+        if alert is None:
+            if len(self.unlocks) >= self.max_depth:
+                # Too many distinct donors in one window; count them in the summary instead
+                self.dropped_count += 1
+                return
+            alert = self.unlocks[donor] = {'event': 'emotes_unlocked', 'donor': donor, 'count': 0, 'by_rarity': {}, 'emotes': []}
+        alert['count'] += len(emotes)
+        for emote in emotes:
+            alert['by_rarity'][emote.get('rarity')] = alert['by_rarity'].get(emote.get('rarity'), 0) + 1
+            if len(alert['emotes']) < self.max_emotes_per_alert:
+                alert['emotes'].append(emote)
+
+    def drop(self, payload):
+        self.dropped_count += 1
+        try:
+            self.dropped_amount += Decimal(payload.get('amount') or '0')
+        except ArithmeticError:
+            pass
+
+    def drain(self):
+        """ Remove and return everything ready to send, priority lane first. """
+        alerts = list(self.priority)
+        alerts += list(self.normal)
+        alerts += list(self.unlocks.values())
+        if self.dropped_count:
+            alerts.append({'event': 'summary', 'count': self.dropped_count, 'amount': f"{self.dropped_amount:.2f}"})
+        self.priority.clear()
+        self.normal.clear()
+        self.unlocks = {}
+        self.dropped_count = 0
+        self.dropped_amount = Decimal('0.00')
+        return alerts
@@ -0,0 +1,6 @@
+from django.urls import re_path
+from . import consumers
+
+websocket_urlpatterns = [
+    re_path(r'^ws/alerts/(?P<username>@?[\w.@+-]+)/$', consumers.OverlayConsumer.as_asgi()),
+]
@@ -1,3 +1,83 @@
-from django.test import TestCase
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from users.models import User
+from .events import overlay_token
+from .queue import AlertQueue
+from .routing import websocket_urlpatterns
 
-# Create your tests here.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+IN_MEMORY_LAYER = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+@override_settings(CACHES=LOCAL_CACHE, CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class OverlayAuthTests(TestCase):
+    """ Only an overlay presenting the streamer's token joins their alert group. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.streamer = User.objects.create(username='streamer', email='streamer@example.com', twitch_id='1', twitch_channel_url='https://twitch.tv/streamer')
+        cls.other = User.objects.create(username='other', email='other@example.com', twitch_id='2', twitch_channel_url='https://twitch.tv/other')
+
+    def setUp(self):
+        cache.clear()
+
+    async def connect(self, path):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        connected, code = await communicator.connect()
+        if connected:
+            await communicator.disconnect()
+        return connected, code
+
+    async def test_token_required(self):
+        self.assertEqual(await self.connect('/ws/alerts/streamer/'), (False, 4403))
+        self.assertEqual(await self.connect(f"/ws/alerts/streamer/?token={overlay_token(self.other.id)}"), (False, 4403))
+        self.assertEqual(await self.connect('/ws/alerts/nobody/?token=x'), (False, 4404))
+        connected, _ = await self.connect(f"/ws/alerts/@streamer/?token={overlay_token(self.streamer.id)}")
+        self.assertTrue(connected)
+
+    def test_overlay_link(self):
+        self.client.force_login(self.streamer)
+        url = self.client.get('/alerts/overlay-link/').json()['overlay_url']
+        self.assertEqual(url, f"ws://testserver/ws/alerts/streamer/?token={overlay_token(self.streamer.id)}")
+
+class AlertQueueTests(SimpleTestCase):
+    """ Unlocks merge per donor, priority rarities jump the queue, and overflow becomes one summary. """
+
+    def unlock(self, donor, *rarities):
+        return {'event': 'emotes_unlocked', 'donor': donor, 'emotes': [{'name': f"{r}{i}", 'rarity': r} for i, r in enumerate(rarities)]}
+
+    def test_unlocks_coalesce_per_donor(self):
+        queue = AlertQueue(max_emotes_per_alert=3)
+        self.assertFalse(queue.push(self.unlock('ann', 'common', 'common', 'rare')))
+        queue.push(self.unlock('ann', 'common', 'epic'))
+        queue.push(self.unlock('bob', 'rare'))
+        self.assertEqual(len(queue), 2)
+        ann, bob = queue.drain()
+        self.assertEqual((ann['donor'], ann['count'], ann['by_rarity']), ('ann', 5, {'common': 3, 'rare': 1, 'epic': 1}))
+        self.assertEqual(len(ann['emotes']), 3)
+        self.assertEqual(bob['count'], 1)
+        self.assertEqual(len(queue), 0)
+
+    def test_priority_rarities_are_sent_first(self):
+        queue = AlertQueue()
+        queue.push({'event': 'donation', 'amount': '5.00'})
+        self.assertTrue(queue.push(self.unlock('ann', 'common', 'mythic')))
+        self.assertTrue(queue.has_priority)
+        events = [alert['event'] for alert in queue.drain()]
+        self.assertEqual(events, ['rare_unlock', 'donation', 'emotes_unlocked'])
+
+    def test_overflow_is_summarised(self):
+        queue = AlertQueue(max_depth=2)
+        for amount in ('1.00', '2.50', '3.00', '4.00'):
+            queue.push({'event': 'donation', 'amount': amount})
+        for donor in ('ann', 'bob', 'cat'):
+            queue.push(self.unlock(donor, 'common'))
+        queue.push(self.unlock('dan', 'mythic', 'mythic', 'novelty'))
+        self.assertEqual(len(queue), 7)
+        alerts = queue.drain()
+        self.assertEqual([a['amount'] for a in alerts if a['event'] == 'donation'], ['3.00', '4.00'])
+        self.assertEqual(sorted(a['donor'] for a in alerts if a['event'] == 'emotes_unlocked'), ['ann', 'bob'])
+        self.assertEqual([a['emotes'][0]['rarity'] for a in alerts if a['event'] == 'rare_unlock'], ['mythic', 'novelty'])
+        self.assertEqual(alerts[-1], {'event': 'summary', 'count': 4, 'amount': '3.50'})  # Two donations, cat, one mythic
+        self.assertEqual(queue.drain(), [])
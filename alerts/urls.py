@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+app_name = 'alerts'
+
+urlpatterns = [
+    path('overlay-link/', views.overlay_link, name='overlay_link'),
+]
@@ -1,3 +1,15 @@
-from django.shortcuts import render
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from users.models import User
+from .events import overlay_token
 
-# Create your views here.
+@login_required
+@require_GET
+def overlay_link(request):
+    """ The websocket URL, token included, for the signed-in streamer's alert overlay (e.g., an OBS browser source). """
+    if not isinstance(request.user, User):
+        return JsonResponse({'error': 'Only streamers have overlays'}, status=403)
+    scheme = 'wss' if request.is_secure() else 'ws'
+    url = f"{scheme}://{request.get_host()}/ws/alerts/{request.user.username}/?token={overlay_token(request.user.id)}"
+    return JsonResponse({'overlay_url': url})
@@ -1,3 +1,29 @@
 from django.contrib import admin
+from .models import LeaderboardEntry, RollRollup
 
-# Register your models here.
+@admin.register(RollRollup)
+class RollRollupAdmin(admin.ModelAdmin):
+    list_display = ('period', 'bucket', 'dimension', 'key', 'rolls', 'grants')
+    list_filter = ('period', 'dimension')
+    search_fields = ('key',)
+    date_hierarchy = 'bucket'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ('board', 'period', 'bucket', 'user', 'score')
+    list_filter = ('board', 'period')
+    list_select_related = ('user',)
+    date_hierarchy = 'bucket'
+    ordering = ('board', 'period', '-bucket', '-score')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .leaderboards import record_scores
+from .models import DailyEarnings
+
+CENT = Decimal('0.01')
+
+def stored_amount(amount):
+    """ The amount as its DecimalField(decimal_places=2) column holds it; Django rounds half-even on save. """
+    return Decimal(amount).quantize(CENT)
+
+def ledger_deltas(rows):
+    """ Sum (user_id, transaction_type, timestamp, amount) rows per user, type and local day, each amount rounded as stored. """
+    deltas = defaultdict(lambda: [Decimal('0.00'), 0])
+    for user_id, transaction_type, timestamp, amount in rows:
+        if user_id is None:
+            continue  # EmoteRush cut has no user dashboard
+        day = timezone.localdate(timestamp) if timestamp else timezone.localdate()
+        delta = deltas[(user_id, transaction_type, day)]
+        delta[0] += stored_amount(amount)
+        delta[1] += 1
+    return deltas
+
+def cumulative_before(user_id, transaction_type, day):
+    previous = (
+        DailyEarnings.objects.filter(user_id=user_id, transaction_type=transaction_type, day__lt=day)
+        .order_by('-day').values_list('cumulative_amount', flat=True).first()
+    )
+    return previous or Decimal('0.00')
+
+@transaction.atomic
+def apply_ledger_rows(transactions):
+    """ Fold newly inserted BalanceTransactions into the daily aggregates and the streamer leaderboard. """
+    rows = [(tx.user_id, tx.transaction_type, tx.timestamp, tx.amount) for tx in transactions]
+    streamers = defaultdict(Decimal)
+    for user_id, transaction_type, _, amount in rows:
+        if transaction_type == 'donation_streamer':
+            streamers[user_id] += stored_amount(amount)
+    record_scores('streamers', streamers)
+    for (user_id, transaction_type, day), (amount, count) in sorted(ledger_deltas(rows).items(), key=lambda item: item[0][2]):
+        DailyEarnings.objects.get_or_create(
+            user_id=user_id, transaction_type=transaction_type, day=day,
+            defaults={'cumulative_amount': cumulative_before(user_id, transaction_type, day)},
+        )
+        DailyEarnings.objects.filter(user_id=user_id, transaction_type=transaction_type, day=day).update(
+            amount=F('amount') + amount, count=F('count') + count,
+        )
+        # Ledger rows land on today, so this normally touches a single row
+        DailyEarnings.objects.filter(user_id=user_id, transaction_type=transaction_type, day__gte=day).update(
+            cumulative_amount=F('cumulative_amount') + amount,
+        )
+
+def rebuild_earnings(ledger, chunk_size=10000):
+    """
+    Recompute every DailyEarnings row from the ledger, reading it in ID-ordered chunks.
+    Args:
+        ledger (QuerySet): BalanceTransaction queryset to aggregate.
+    Returns:
+        int: Number of ledger rows read.
+    """
+    deltas = defaultdict(lambda: [Decimal('0.00'), 0])
+    last_id, read = 0, 0
+    while True:
+        chunk = list(
+            ledger.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'user_id', 'transaction_type', 'timestamp', 'amount')[:chunk_size]
+        )
+        if not chunk:
+            break
+        for key, (amount, count) in ledger_deltas(row[1:] for row in chunk).items():
+            deltas[key][0] += amount
+            deltas[key][1] += count
+        last_id = chunk[-1][0]
+        read += len(chunk)
+
+    running = defaultdict(lambda: Decimal('0.00'))
+    rows = []
+    for (user_id, transaction_type, day), (amount, count) in sorted(deltas.items(), key=lambda item: item[0][2]):
+        running[(user_id, transaction_type)] += amount
+        rows.append(DailyEarnings(
+            user_id=user_id, transaction_type=transaction_type, day=day,
+            amount=amount, count=count, cumulative_amount=running[(user_id, transaction_type)],
+        ))
+    with transaction.atomic():
+        DailyEarnings.objects.all().delete()
+        DailyEarnings.objects.bulk_create(rows, batch_size=chunk_size)
+    return read
+
+def earnings_total(user_id, transaction_type, start=None, end=None):
+    """ Sum for a date range from two running-total lookups, independent of range length. """
+    rows = DailyEarnings.objects.filter(user_id=user_id, transaction_type=transaction_type)
+    upto_end = rows.filter(day__lte=end) if end else rows
+    total = upto_end.order_by('-day').values_list('cumulative_amount', flat=True).first() or Decimal('0.00')
+    if start:
+        total -= cumulative_before(user_id, transaction_type, start)
+    return total
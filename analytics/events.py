@@ -0,0 +1,76 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Value
+from django.utils import timezone
+from .leaderboards import record_holdings
+from .models import RollEvent
+
+class RollEventBuffer:
+    """
+    Collects RollEvents and writes them with bulk_create.
+
+    Use as a context manager around a batch of rolls (e.g., one donation); events are
+    flushed on exit, or early once ANALYTICS_EVENT_BUFFER_SIZE is reached. Flushing inside
+    the caller's transaction keeps the log consistent with inventories on rollback.
+    """
+
+    def __init__(self, donation=None, kind='roll'):
+        self.donation = donation
+        self.kind = kind
+        self.events = []
+        self.max_size = settings.ANALYTICS_EVENT_BUFFER_SIZE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.events = []
+
+    def add(self, user, emote, kind=None):
+        donation = self.donation
+        self.events.append(RollEvent(
+            user_id=user.pk if user else None,
+            emote_id=emote.id,
+            rarity=emote.rarity,
+            donation_id=donation.pk if donation else None,
+            streamer_id=donation.streamer_id if donation else None,
+            kind=kind or self.kind,
+            timestamp=timezone.now(),
+        ))
+        if len(self.events) >= self.max_size:
+            self.flush()
+
+    def flush(self):
+        if self.events:
+            RollEvent.objects.bulk_create(self.events, batch_size=self.max_size)
+            holdings = defaultdict(lambda: defaultdict(int))
+            for event in self.events:
+                holdings[event.user_id][event.rarity] += 1
+            record_holdings(holdings)
+            self.events = []
+
+def record_roll(user, emote, kind='roll', buffer=None):
+    """ Log one roll/grant, through a buffer when the caller has one. """
+    if buffer is not None:
+        buffer.add(user, emote, kind)
+        return
+    with RollEventBuffer(kind=kind) as single:
+        single.add(user, emote)
+
+def record_grants(users, emote):
+    """ Log one grant of `emote` per user in the `users` queryset with a single INSERT ... SELECT. """
+    rows = users.order_by().annotate(
+        grant_emote=Value(emote.id),
+        grant_rarity=Value(emote.rarity),
+        grant_kind=Value('grant'),
+        grant_timestamp=Value(timezone.now(), output_field=models.DateTimeField()),
+    ).values_list('id', 'grant_emote', 'grant_rarity', 'grant_kind', 'grant_timestamp')
+    select, params = rows.query.sql_with_params()
+    meta = RollEvent._meta
+    columns = ', '.join(connection.ops.quote_name(meta.get_field(name).column) for name in ('user', 'emote', 'rarity', 'kind', 'timestamp'))
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {connection.ops.quote_name(meta.db_table)} ({columns}) {select}", params)
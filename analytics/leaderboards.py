@@ -0,0 +1,227 @@
+"""
+Incrementally maintained leaderboards: top donors, top-earning streamers and top collectors.
+
+Scores live in LeaderboardEntry rows, one per user, board and period bucket, bumped with F()
+updates once the donation, earning or grant that moved them has committed, in a short
+transaction of their own. Each bucket's top list is cached and merged with changed scores after
+commit, so reads never aggregate the source tables. A rank is the count of higher scores in the
+bucket, read with the user's own score in one statement over idx_leaderboard_top.
+"""
+import json
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import Case, Count, DecimalField, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import LeaderboardEntry
+
+BOARDS = tuple(dict(LeaderboardEntry.BOARD_CHOICES))
+PERIODS = tuple(dict(LeaderboardEntry.PERIOD_CHOICES))
+ALL_TIME = date.min
+
+def period_bucket(period, day=None):
+    """ Bucket date holding `day` (default today): the day, the Monday of its week, or ALL_TIME. """
+    day = day or timezone.localdate()
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return ALL_TIME
+
+def rarity_weight(rarity):
+    return settings.LEADERBOARD_RARITY_WEIGHTS.get(rarity, 0)
+
+def top_key(board, period, bucket):
+    return f"leaderboard:{board}:{period}:{bucket.isoformat()}"
+
+def bucket_rows(board, buckets):
+    """ Entries of one board in any of the (period, bucket) pairs. """
+    pairs = Q()
+    for period, bucket in buckets:
+        pairs |= Q(period=period, bucket=bucket)
+    return LeaderboardEntry.objects.filter(pairs, board=board)
+
+def record_scores(board, deltas, day=None, periods=PERIODS):
+    """
+    Add score deltas for one board to each period's bucket once the caller's transaction commits.
+    The leaderboard rows are then locked for a few statements, not for the whole donation, trade or
+    grant; if the update fails, rebuild_leaderboards recovers the lost increment.
+    Args:
+        board (str): One of BOARDS.
+        deltas (dict): user_id -> Decimal or int change; zero deltas are ignored.
+        day (date): Day the change belongs to (default today).
+        periods (tuple): Periods to update; trades and revokes only move all-time holdings.
+    """
+    deltas = {user_id: Decimal(delta) for user_id, delta in deltas.items() if user_id and delta}
+    if not deltas:
+        return
+    buckets = sorted((period, period_bucket(period, day)) for period in periods)
+    transaction.on_commit(lambda: apply_scores(board, deltas, buckets), robust=True)
+
+def apply_scores(board, deltas, buckets):
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        by_delta[delta].append(user_id)
+    # Writers insert and lock rows in (period, bucket, user) order, so overlapping batches queue instead of deadlocking
+    with transaction.atomic():
+        # Create missing rows at zero first so concurrent writers never lose an increment
+        LeaderboardEntry.objects.bulk_create(
+            [
+                LeaderboardEntry(board=board, period=period, bucket=bucket, user_id=user_id)
+                for period, bucket in buckets for user_id in sorted(deltas)
+            ],
+            ignore_conflicts=True,
+        )
+        rows = bucket_rows(board, buckets).filter(user_id__in=list(deltas))
+        locked = list(rows.select_for_update().order_by('period', 'bucket', 'user_id').values_list('id', flat=True))
+        # One UPDATE for every bucket; bulk grants and roll batches share a handful of weights
+        LeaderboardEntry.objects.filter(id__in=locked).update(score=F('score') + Case(
+            *[When(user_id__in=user_ids, then=Value(delta)) for delta, user_ids in by_delta.items()],
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ))
+        transaction.on_commit(lambda: merge_top_lists(board, buckets, list(deltas)))
+
+def record_holdings(deltas, periods=PERIODS):
+    """
+    Collector scores from emote changes: user_id -> {rarity: count change}. All-time scores track
+    what users hold; daily and weekly scores count what they rolled or were granted in the period.
+    """
+    record_scores('collectors', {
+        user_id: sum(rarity_weight(rarity) * count for rarity, count in counts.items())
+        for user_id, counts in deltas.items()
+    }, periods=periods)
+
+def load_top(board, period, bucket):
+    rows = (
+        LeaderboardEntry.objects.using(DEFAULT_DB_ALIAS).filter(board=board, period=period, bucket=bucket, score__gt=0)
+        .order_by('-score', 'user_id').values_list('user_id', 'score')[:settings.LEADERBOARD_SIZE]
+    )
+    return [(user_id, score) for user_id, score in rows]
+
+def merge_top_lists(board, buckets, user_ids):
+    """ Fold the changed users' new scores into each cached top list. """
+    keys = {top_key(board, period, bucket): (period, bucket) for period, bucket in buckets}
+    cached = cache.get_many(list(keys))  # Missing lists are built on the next read
+    if not cached:
+        return
+    changed = defaultdict(dict)
+    rows = bucket_rows(board, [keys[key] for key in cached]).filter(user_id__in=user_ids)
+    for period, bucket, user_id, score in rows.values_list('period', 'bucket', 'user_id', 'score'):
+        changed[(period, bucket)][user_id] = score
+    for key, listed in cached.items():
+        scores = changed[keys[key]]
+        full = len(listed) >= settings.LEADERBOARD_SIZE
+        floor = listed[-1][1] if listed else Decimal('0')
+        entries = dict(listed)
+        for user_id, score in scores.items():
+            if user_id in entries and full and score < floor:
+                # A listed user dropped below the floor; someone unlisted may now outrank them
+                cache.delete(key)
+                break
+            if user_id in entries or not full or score > floor:
+                entries[user_id] = score
+        else:
+            ranked = sorted(((u, s) for u, s in entries.items() if s > 0), key=lambda entry: (-entry[1], entry[0]))
+            cache.set(key, ranked[:settings.LEADERBOARD_SIZE], settings.LEADERBOARD_CACHE_TIMEOUT)
+
+def top(board, period='all', limit=None, day=None):
+    """ [(user_id, score)] best first, at most LEADERBOARD_SIZE. """
+    bucket = period_bucket(period, day)
+    key = top_key(board, period, bucket)
+    entries = cache.get(key)
+    if entries is None:
+        entries = load_top(board, period, bucket)
+        cache.set(key, entries, settings.LEADERBOARD_CACHE_TIMEOUT)
+    return entries[:limit] if limit else entries
+
+def rank(board, user_id, period='all', day=None):
+    """ (rank, score) for the user, 1 being best, or None if they have no positive score. """
+    bucket = period_bucket(period, day)
+    rows = LeaderboardEntry.objects.filter(board=board, period=period, bucket=bucket)
+    # Counted in the same statement that reads the score, so both come from one snapshot
+    higher = rows.filter(score__gt=OuterRef('score')).order_by().values('board').annotate(n=Count('id')).values('n')
+    entry = (
+        rows.filter(user_id=user_id, score__gt=0).annotate(higher=Coalesce(Subquery(higher), 0))
+        .values_list('higher', 'score').first()
+    )
+    if entry is None:
+        return None
+    return entry[0] + 1, entry[1]
+
+def prune(before=None):
+    """ Drop daily and weekly buckets older than LEADERBOARD_RETENTION_DAYS. """
+    before = before or timezone.localdate() - timedelta(days=settings.LEADERBOARD_RETENTION_DAYS)
+    deleted, _ = LeaderboardEntry.objects.filter(period__in=('day', 'week'), bucket__lt=before).delete()
+    return deleted
+
+def holdings_score(emotes_json, rarities):
+    """ Collector score of one inventory; `rarities` maps emote name to rarity. """
+    return sum(rarity_weight(rarities.get(name)) * count for name, count in json.loads(emotes_json or '{}').items() if count > 0)
+
+def rebuild(chunk_size=5000):
+    """
+    Recompute every board from the source tables: completed donations, streamer ledger rows,
+    inventories (all-time collectors) and roll events (daily and weekly collectors). Score
+    writers wait until the rebuilt rows commit; an increment whose source committed just before
+    the rebuild read it is applied on top, so run it when traffic is quiet.
+    Returns:
+        int: Number of entries written.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            # Block record_scores until the new rows commit: increments made while the sources are
+            # read would otherwise be deleted below. Readers are not blocked.
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {LeaderboardEntry._meta.db_table} IN EXCLUSIVE MODE')
+        # Elsewhere the delete takes the write lock before the sources are read
+        LeaderboardEntry.objects.all().delete()
+        entries = rebuilt_entries(chunk_size)
+        LeaderboardEntry.objects.bulk_create(entries, batch_size=chunk_size)
+        transaction.on_commit(clear_top_lists)
+    return len(entries)
+
+def rebuilt_entries(chunk_size):
+    """ LeaderboardEntry objects recomputed from the source tables. """
+    from emotes.models import Emote
+    from payments.models import BalanceTransaction, Donation
+    from users.models import User
+    from .models import RollEvent
+
+    since = period_bucket('week', timezone.localdate() - timedelta(days=settings.LEADERBOARD_RETENTION_DAYS))
+    scores = defaultdict(Decimal)
+
+    def add(board, user_id, day, amount):
+        for period in PERIODS:
+            if period == 'all' or day >= since:
+                scores[(board, period, period_bucket(period, day), user_id)] += amount
+
+    donations = Donation.objects.filter(status='completed', donor__isnull=False).values_list('donor_id', 'timestamp', 'amount')
+    for user_id, timestamp, amount in donations.iterator(chunk_size=chunk_size):
+        add('donors', user_id, timezone.localdate(timestamp), amount)
+    earnings = BalanceTransaction.objects.filter(transaction_type='donation_streamer', user__isnull=False).values_list('user_id', 'timestamp', 'amount')
+    for user_id, timestamp, amount in earnings.iterator(chunk_size=chunk_size):
+        add('streamers', user_id, timezone.localdate(timestamp), amount)
+
+    rarities = dict(Emote.objects.values_list('name', 'rarity'))
+    for user_id, emotes in User.objects.values_list('id', 'emotes').iterator(chunk_size=chunk_size):
+        score = holdings_score(emotes, rarities)
+        if score:
+            scores[('collectors', 'all', ALL_TIME, user_id)] = Decimal(score)
+    events = RollEvent.objects.filter(timestamp__date__gte=since, user__isnull=False).values_list('user_id', 'timestamp', 'rarity')
+    for user_id, timestamp, rarity in events.iterator(chunk_size=chunk_size):
+        day = timezone.localdate(timestamp)
+        for period in ('day', 'week'):
+            scores[('collectors', period, period_bucket(period, day), user_id)] += rarity_weight(rarity)
+
+    return [
+        LeaderboardEntry(board=board, period=period, bucket=bucket, user_id=user_id, score=score)
+        for (board, period, bucket, user_id), score in scores.items() if score
+    ]
+
+def clear_top_lists():
+    today = timezone.localdate()
+    cache.delete_many([top_key(board, period, period_bucket(period, today)) for board in BOARDS for period in PERIODS])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from analytics.earnings import rebuild_earnings
+from payments.models import BalanceTransaction
+
+class Command(BaseCommand):
+    help = 'Rebuild daily earnings aggregates from the BalanceTransaction ledger (run while payments are paused)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Ledger rows read per query.')
+
+    def handle(self, *args, **options):
+        read = rebuild_earnings(BalanceTransaction.objects.all(), chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Aggregated {read} ledger row(s)."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from analytics.leaderboards import prune, rebuild
+
+class Command(BaseCommand):
+    help = 'Recompute the leaderboards from donations, the ledger, inventories and roll events, or prune old buckets (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune-only', action='store_true', help='Only drop daily and weekly buckets past LEADERBOARD_RETENTION_DAYS.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read and written per batch.')
+
+    def handle(self, *args, **options):
+        if options['prune_only']:
+            self.stdout.write(self.style.SUCCESS(f"Pruned {prune()} leaderboard entries."))
+            return
+        written = rebuild(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt leaderboards with {written} entries."))
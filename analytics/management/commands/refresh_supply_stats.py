@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from analytics.rollups import run_rollups
+from analytics.supply import build_supply_snapshot
+
+class Command(BaseCommand):
+    help = 'Recompute the supply and scarcity snapshot (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-rollup', action='store_true', help='Do not fold pending roll events into the rollups first.')
+
+    def handle(self, *args, **options):
+        if not options['skip_rollup']:
+            run_rollups()
+        data = build_supply_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Supply snapshot for {len(data['rarities'])} rarities, {len(data['emotes'])} emotes."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from analytics.rollups import run_rollups
+
+class Command(BaseCommand):
+    help = 'Fold new roll events into the hourly and daily rollups (run from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Events aggregated per transaction.')
+
+    def handle(self, *args, **options):
+        processed = run_rollups(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {processed} event(s)."))
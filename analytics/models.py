@@ -1,3 +1,110 @@
+import json
 from django.db import models
+from django.conf import settings
+from django.utils import timezone
 
-# Create your models here.
+class RollEvent(models.Model):
+    """ Append-only record of every emote roll or grant. Never updated; rolled up by rollup_rolls. """
+    KIND_CHOICES = (('roll', 'Roll'), ('grant', 'Grant'))
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    emote = models.ForeignKey('emotes.Emote', on_delete=models.SET_NULL, null=True, related_name='+')
+    rarity = models.CharField(max_length=20)
+    donation = models.ForeignKey('payments.Donation', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    streamer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', help_text="Denormalized from the donation so rollups need no join")
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES, default='roll')
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.kind} {self.rarity} -> {self.user_id} at {self.timestamp}"
+
+class RollRollup(models.Model):
+    """ Hourly/daily roll counts per rarity, emote or streamer. Dashboards read only these. """
+    PERIOD_CHOICES = (('hour', 'Hour'), ('day', 'Day'))
+    DIMENSION_CHOICES = (('rarity', 'Rarity'), ('emote', 'Emote'), ('streamer', 'Streamer'))
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField(help_text="Start of the hour/day (UTC)")
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=50, help_text="Rarity name, emote ID or streamer ID")
+    rolls = models.PositiveBigIntegerField(default=0)
+    grants = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'dimension', 'key', 'bucket'], name='uniq_rollup_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} {self.bucket:%Y-%m-%d %H:%M} {self.dimension}={self.key}: {self.rolls}/{self.grants}"
+
+class RollupCursor(models.Model):
+    """ High-water mark of RollEvent IDs already folded into the rollups, and the IDs below it not seen yet. """
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    gaps = models.TextField(default='{}', help_text="JSON: skipped event ID -> when first missed (ISO), until it commits or times out")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_gaps(self):
+        return {int(event_id): missed for event_id, missed in json.loads(self.gaps).items()}
+
+    def set_gaps(self, gaps):
+        self.gaps = json.dumps(gaps)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
+
+class DailyEarnings(models.Model):
+    """ Ledger totals per user, transaction type and day, with a running total for O(1) range sums. """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_earnings')
+    day = models.DateField()
+    transaction_type = models.CharField(max_length=20)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+    cumulative_amount = models.DecimalField(
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text="Running total for this user and type up to and including this day."
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'transaction_type', 'day'], name='uniq_daily_earnings'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.transaction_type} {self.day}: ${self.amount}"
+
+class LeaderboardEntry(models.Model):
+    """ One user's score on a board for a day, week or all time; incremented as donations, earnings and grants land. """
+    BOARD_CHOICES = (('donors', 'Top Donors'), ('streamers', 'Top Streamers'), ('collectors', 'Top Collectors'))
+    PERIOD_CHOICES = (('day', 'Day'), ('week', 'Week'), ('all', 'All Time'))
+
+    board = models.CharField(max_length=10, choices=BOARD_CHOICES)
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateField(help_text="Day, Monday of the week, or date.min for all time")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    score = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'period', 'bucket', 'user'], name='uniq_leaderboard_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['board', 'period', 'bucket', '-score', 'user'], name='idx_leaderboard_top'),
+        ]
+
+    def __str__(self):
+        return f"{self.board} {self.period} {self.bucket}: {self.user_id} {self.score}"
+
+class SupplySnapshot(models.Model):
+    """ Periodically computed minted/remaining supply, allocation rate and exhaustion ETA. """
+    data = models.TextField(default='{}', help_text="JSON with 'rarities' and 'emotes' supply statistics")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def get_data(self):
+        return json.loads(self.data)
+
+    def __str__(self):
+        return f"Supply snapshot {self.created_at}"
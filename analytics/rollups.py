@@ -0,0 +1,101 @@
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import RollEvent, RollRollup, RollupCursor
+
+CURSOR_NAME = 'roll_rollups'
+EVENT_FIELDS = ('id', 'timestamp', 'rarity', 'emote_id', 'streamer_id', 'kind')
+
+def bucket_start(timestamp, period):
+    ts = timestamp.astimezone(dt_timezone.utc)
+    if period == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def aggregate(events):
+    """ Count rolls and grants per (period, bucket, dimension, key) for a chunk of event rows. """
+    counts = Counter()
+    for _, timestamp, rarity, emote_id, streamer_id, kind in events:
+        for period in ('hour', 'day'):
+            bucket = bucket_start(timestamp, period)
+            counts[(period, bucket, 'rarity', rarity, kind)] += 1
+            if emote_id:
+                counts[(period, bucket, 'emote', str(emote_id), kind)] += 1
+            if streamer_id:
+                counts[(period, bucket, 'streamer', str(streamer_id), kind)] += 1
+    return counts
+
+def apply_counts(counts):
+    """ Add counts onto the rollup rows with INSERT ... ON CONFLICT DO UPDATE, so rows created meanwhile are incremented, not duplicated. """
+    merged = {}
+    for (period, bucket, dimension, key, kind), n in counts.items():
+        row = merged.setdefault((period, bucket, dimension, key), {'roll': 0, 'grant': 0})
+        row[kind] += n
+    if not merged:
+        return
+
+    meta = RollRollup._meta
+    quote = connection.ops.quote_name
+    fields = [meta.get_field(name) for name in ('period', 'bucket', 'dimension', 'key', 'rolls', 'grants')]
+    unique = ', '.join(quote(meta.get_field(name).column) for name in ('period', 'dimension', 'key', 'bucket'))
+    table = quote(meta.db_table)
+    increments = ', '.join(
+        f"{quote(column)} = {table}.{quote(column)} + EXCLUDED.{quote(column)}" for column in ('rolls', 'grants')
+    )
+    rows = [
+        [field.get_db_prep_save(value, connection) for field, value in zip(fields, (*ident, delta['roll'], delta['grant']))]
+        for ident, delta in merged.items()
+    ]
+    batch_size = connection.ops.bulk_batch_size(fields, rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            values = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(batch))
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(quote(field.column) for field in fields)}) VALUES {values} "
+                f"ON CONFLICT ({unique}) DO UPDATE SET {increments}",
+                [param for row in batch for param in row],
+            )
+
+def run_rollups(chunk_size=10000):
+    """
+    Fold new RollEvents into the hourly/daily rollups, advancing an ID cursor; the log itself is
+    never written to. IDs the cursor skips are remembered as gaps, because a transaction still in
+    flight can commit an event with a lower ID than one already counted. Each run counts the gaps
+    that have committed since and forgets those still missing after ANALYTICS_ROLLUP_GAP_TIMEOUT,
+    which were rolled back. Runs serialise on the cursor row.
+    Returns:
+        int: Number of events folded in.
+    """
+    processed = 0
+    while True:
+        with transaction.atomic():
+            cursor, _ = RollupCursor.objects.select_for_update().get_or_create(name=CURSOR_NAME)
+            gaps = cursor.get_gaps()
+            now = timezone.now()
+            events = list(RollEvent.objects.filter(id__in=gaps).values_list(*EVENT_FIELDS)) if gaps else []
+            for event in events:
+                del gaps[event[0]]
+            newer = list(
+                RollEvent.objects.filter(id__gt=cursor.last_event_id).order_by('id').values_list(*EVENT_FIELDS)[:chunk_size]
+            )
+            previous = cursor.last_event_id
+            if not previous and newer:
+                previous = newer[0][0] - 1  # First run: IDs below the oldest event were never logged, or were pruned
+            for event in newer:
+                gaps.update(dict.fromkeys(range(previous + 1, event[0]), now.isoformat()))
+                previous = event[0]
+            expired = now - settings.ANALYTICS_ROLLUP_GAP_TIMEOUT
+            gaps = {event_id: missed for event_id, missed in gaps.items() if datetime.fromisoformat(missed) > expired}
+            events += newer
+            if events:
+                apply_counts(aggregate(events))
+            if events or gaps != cursor.get_gaps():
+                cursor.last_event_id = previous
+                cursor.set_gaps(gaps)
+                cursor.save(update_fields=['last_event_id', 'gaps', 'updated_at'])
+        processed += len(events)
+        if len(newer) < chunk_size:
+            return processed
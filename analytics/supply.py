@@ -0,0 +1,83 @@
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Sum
+from django.utils import timezone
+from emotes.models import Emote
+from .models import RollRollup, SupplySnapshot
+
+CACHE_KEY = 'analytics:supply_snapshot'
+
+def exhaustion_eta(remaining, rate_per_hour, now):
+    """ When supply runs out at the current rate; None if unlimited or not being allocated. """
+    if remaining is None or rate_per_hour <= 0:
+        return None
+    return (now + timedelta(hours=remaining / rate_per_hour)).isoformat()
+
+def allocation_rates(dimension, since, hours):
+    """ Allocations per hour by key over the window, read from the hourly rollups. """
+    rows = (
+        RollRollup.objects.using(DEFAULT_DB_ALIAS).filter(period='hour', dimension=dimension, bucket__gte=since)
+        .values('key').annotate(rolls=Sum('rolls'), grants=Sum('grants'))
+    )
+    return {row['key']: (row['rolls'] + row['grants']) / hours for row in rows}
+
+def supply_stats(now):
+    """ Supply statistics as of `now`, read from the primary: the snapshot is shared with every reader until the next refresh. """
+    window = settings.ANALYTICS_SUPPLY_RATE_WINDOW
+    hours = window.total_seconds() / 3600
+    since = now - window
+    rarity_rates = allocation_rates('rarity', since, hours)
+    emote_rates = allocation_rates('emote', since, hours)
+
+    rarities = {}
+    per_rarity = Emote.objects.using(DEFAULT_DB_ALIAS).values('rarity').annotate(emotes=Count('id'), remaining=Sum('remaining_instances'))
+    for row in per_rarity:
+        rarity = row['rarity']
+        max_instances = Emote.RARITY_MAX_INSTANCES.get(rarity, 0)
+        unlimited = max_instances == 0
+        rate = rarity_rates.get(rarity, 0.0)
+        remaining = None if unlimited else row['remaining']
+        rarities[rarity] = {
+            'emotes': row['emotes'],
+            'supply': None if unlimited else max_instances * row['emotes'],
+            'minted': None if unlimited else max_instances * row['emotes'] - row['remaining'],
+            'remaining': remaining,
+            'rate_per_hour': round(rate, 4),
+            'exhaustion_eta': exhaustion_eta(remaining, rate, now),
+        }
+
+    emotes = {}
+    for emote_id, rarity, remaining in Emote.objects.using(DEFAULT_DB_ALIAS).values_list('id', 'rarity', 'remaining_instances'):
+        max_instances = Emote.RARITY_MAX_INSTANCES.get(rarity, 0)
+        if max_instances == 0:
+            continue
+        rate = emote_rates.get(str(emote_id), 0.0)
+        emotes[str(emote_id)] = {
+            'minted': max_instances - remaining,
+            'remaining': remaining,
+            'rate_per_hour': round(rate, 4),
+            'exhaustion_eta': exhaustion_eta(remaining, rate, now),
+        }
+
+    return {'generated_at': now.isoformat(), 'window_hours': hours, 'rarities': rarities, 'emotes': emotes}
+
+def build_supply_snapshot():
+    """ Compute supply statistics and store them as the latest SupplySnapshot. """
+    now = timezone.now()
+    data = supply_stats(now)
+    SupplySnapshot.objects.create(data=json.dumps(data))
+    SupplySnapshot.objects.filter(created_at__lt=now - timedelta(days=settings.ANALYTICS_SUPPLY_SNAPSHOT_RETENTION_DAYS)).delete()
+    cache.set(CACHE_KEY, data, settings.ANALYTICS_SUPPLY_CACHE_TIMEOUT)
+    return data
+
+def get_supply_snapshot():
+    """ Latest snapshot, from cache when possible; never scans Emote or inventories. """
+    data = cache.get(CACHE_KEY)
+    if data is None:
+        snapshot = SupplySnapshot.objects.using(DEFAULT_DB_ALIAS).order_by('-created_at').first()
+        data = snapshot.get_data() if snapshot else {}
+        cache.set(CACHE_KEY, data, settings.ANALYTICS_SUPPLY_CACHE_TIMEOUT)
+    return data
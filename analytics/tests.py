@@ -1,3 +1,97 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from emotes.catalog import clear_catalog
+from emotes.models import Emote
+from users.models import User
+from .leaderboards import rank, record_scores, top
+from .models import LeaderboardEntry, RollEvent, RollRollup, RollupCursor
+from .rollups import run_rollups
 
-# Create your tests here.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+NOON = datetime(2026, 1, 5, 12, 30, tzinfo=dt_timezone.utc)
+
+@override_settings(CACHES=LOCAL_CACHE)
+class RollupTests(TestCase):
+    """ run_rollups reads the append-only log by cursor and never counts an event twice. """
+
+    def setUp(self):
+        cache.clear()
+        clear_catalog()
+
+    def log(self, count, kind='roll', **fields):
+        RollEvent.objects.bulk_create([RollEvent(rarity='common', kind=kind, timestamp=NOON, **fields) for _ in range(count)])
+
+    def rarity_counts(self, period='hour'):
+        row = RollRollup.objects.get(period=period, dimension='rarity', key='common')
+        return row.rolls, row.grants
+
+    def test_counts_accumulate_across_runs(self):
+        self.log(3)
+        self.log(1, kind='grant')
+        self.assertEqual(run_rollups(), 4)
+        self.log(2)
+        self.assertEqual(run_rollups(chunk_size=1), 2)
+        self.assertEqual(run_rollups(), 0)
+        self.assertEqual(self.rarity_counts(), (5, 1))
+        self.assertEqual(self.rarity_counts('day'), (5, 1))
+        self.assertEqual(RollRollup.objects.filter(dimension='rarity').count(), 2)
+
+    def test_late_commit_below_cursor_is_counted(self):
+        first = RollEvent.objects.create(rarity='common', timestamp=NOON)
+        RollEvent.objects.create(id=first.id + 2, rarity='common', timestamp=NOON)
+        self.assertEqual(run_rollups(), 2)
+        self.assertEqual(list(RollupCursor.objects.get().get_gaps()), [first.id + 1])
+
+        RollEvent.objects.create(id=first.id + 1, rarity='common', timestamp=NOON)  # Its transaction commits late
+        self.assertEqual(run_rollups(), 1)
+        self.assertEqual(self.rarity_counts(), (3, 0))
+        self.assertEqual(RollupCursor.objects.get().get_gaps(), {})
+
+    @override_settings(ANALYTICS_ROLLUP_GAP_TIMEOUT=timedelta(0))
+    def test_rolled_back_ids_are_forgotten(self):
+        first = RollEvent.objects.create(rarity='common', timestamp=NOON)
+        RollEvent.objects.create(id=first.id + 5, rarity='common', timestamp=NOON)
+        run_rollups()
+        self.assertEqual(RollupCursor.objects.get().get_gaps(), {})
+
+    def test_new_user_grants_are_logged(self):
+        pity = Emote.objects.create(name='pity0', chat_display_name='ER:pity0', rarity='pity', remaining_instances=10)
+        clear_catalog()
+        user = User.objects.create(username='new', email='new@example.com', twitch_id='1', twitch_channel_url='https://twitch.tv/new')
+        self.assertEqual(User.objects.get(pk=user.pk).get_emotes(), {'pity0': 1})
+        self.assertEqual(list(RollEvent.objects.values_list('user_id', 'emote_id', 'kind')), [(user.id, pity.id, 'grant')])
+
+@override_settings(CACHES=LOCAL_CACHE)
+class LeaderboardTests(TestCase):
+    """ Scores land after the caller commits; ranks count higher scores in the database. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([
+            User(username=f"user{i}", email=f"user{i}@example.com", twitch_id=str(i), twitch_channel_url=f"https://twitch.tv/user{i}")
+            for i in range(4)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_scores_wait_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            record_scores('donors', {self.users[0].id: 5})
+            self.assertFalse(LeaderboardEntry.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(LeaderboardEntry.objects.filter(board='donors').count(), 3)  # Day, week and all time
+
+    def test_rank_counts_higher_scores(self):
+        a, b, c, d = (user.id for user in self.users)
+        with self.captureOnCommitCallbacks(execute=True):
+            record_scores('donors', {a: 10, b: 5, c: 5})
+        with self.captureOnCommitCallbacks(execute=True):
+            record_scores('donors', {b: 1})
+        self.assertEqual(rank('donors', a), (1, 10))
+        self.assertEqual(rank('donors', b), (2, 6))
+        self.assertEqual(rank('donors', c), (3, 5))
+        self.assertIsNone(rank('donors', d))
+        self.assertEqual(top('donors', limit=2), [(a, 10), (b, 6)])
@@ -0,0 +1,11 @@
+from django.urls import path
+from . import views
+
+app_name = 'analytics'
+
+urlpatterns = [
+    path('rolls/', views.roll_stats, name='roll_stats'),
+    path('earnings/', views.earnings, name='earnings'),
+    path('supply/', views.supply_stats, name='supply_stats'),
+    path('leaderboards/<str:board>/', views.leaderboard, name='leaderboard'),
+]
@@ -1,3 +1,110 @@
-from django.shortcuts import render
+from datetime import datetime
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.utils.dateparse import parse_datetime, parse_date
+from django.views.decorators.http import require_GET
+from users.models import User
+from . import leaderboards
+from .earnings import earnings_total
+from .models import DailyEarnings, LeaderboardEntry, RollRollup
+from .supply import get_supply_snapshot
 
-# Create your views here.
+EARNING_TYPES = ('donation_streamer', 'donation_artist', 'sale_seller', 'sale_artist')
+
+def parse_bound(value):
+    """ Accept an ISO date or datetime query parameter. """
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        parsed = datetime(day.year, day.month, day.day) if day else None
+    return parsed
+
+@staff_member_required
+@require_GET
+def roll_stats(request):
+    """ Roll/grant series from the rollup tables, e.g., ?period=day&dimension=rarity&key=mythic. """
+    period = request.GET.get('period', 'day')
+    dimension = request.GET.get('dimension', 'rarity')
+    if period not in dict(RollRollup.PERIOD_CHOICES) or dimension not in dict(RollRollup.DIMENSION_CHOICES):
+        return JsonResponse({'error': 'Invalid period or dimension'}, status=400)
+    try:
+        start, end = parse_bound(request.GET.get('start')), parse_bound(request.GET.get('end'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date'}, status=400)
+
+    rows = RollRollup.objects.filter(period=period, dimension=dimension)
+    if request.GET.get('key'):
+        rows = rows.filter(key=request.GET['key'])
+    if start:
+        rows = rows.filter(bucket__gte=start)
+    if end:
+        rows = rows.filter(bucket__lt=end)
+    series = [
+        {'bucket': bucket.isoformat(), 'key': key, 'rolls': rolls, 'grants': grants}
+        for bucket, key, rolls, grants in rows.order_by('bucket', 'key').values_list('bucket', 'key', 'rolls', 'grants')[:5000]
+    ]
+    return JsonResponse({'period': period, 'dimension': dimension, 'series': series})
+
+@login_required
+@require_GET
+def earnings(request):
+    """ The user's earnings per type for ?start=YYYY-MM-DD&end=YYYY-MM-DD; add &series=1 for daily points. """
+    try:
+        start, end = parse_bound(request.GET.get('start')), parse_bound(request.GET.get('end'))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date'}, status=400)
+    start, end = start.date() if start else None, end.date() if end else None
+    types = [t for t in request.GET.getlist('type') if t in EARNING_TYPES] or list(EARNING_TYPES)
+
+    totals = {t: f"{earnings_total(request.user.id, t, start, end):.2f}" for t in types}
+    data = {'start': start.isoformat() if start else None, 'end': end.isoformat() if end else None, 'totals': totals}
+    if request.GET.get('series'):
+        rows = DailyEarnings.objects.filter(user=request.user, transaction_type__in=types)
+        if start:
+            rows = rows.filter(day__gte=start)
+        if end:
+            rows = rows.filter(day__lte=end)
+        data['series'] = [
+            {'day': day.isoformat(), 'type': transaction_type, 'amount': f"{amount:.2f}", 'count': count}
+            for day, transaction_type, amount, count in rows.order_by('day').values_list('day', 'transaction_type', 'amount', 'count')[:5000]
+        ]
+    return JsonResponse(data)
+
+@staff_member_required
+@require_GET
+def supply_stats(request):
+    """ Minted vs remaining supply, allocation rate and exhaustion ETA from the latest snapshot. """
+    data = get_supply_snapshot()
+    if not request.GET.get('emotes'):
+        data = {k: v for k, v in data.items() if k != 'emotes'}
+    return JsonResponse(data)
+
+@require_GET
+def leaderboard(request, board):
+    """ Top users of a board for ?period=day|week|all (default all) and ?limit=N; adds the viewer's rank when signed in. """
+    period = request.GET.get('period', 'all')
+    if board not in leaderboards.BOARDS or period not in dict(LeaderboardEntry.PERIOD_CHOICES):
+        return JsonResponse({'error': 'Invalid board or period'}, status=400)
+    try:
+        limit = min(int(request.GET.get('limit', settings.LEADERBOARD_SIZE)), settings.LEADERBOARD_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    entries = leaderboards.top(board, period, max(limit, 1))
+    users = User.objects.only('id', 'username', 'display_name').in_bulk([user_id for user_id, _ in entries])
+    data = {
+        'board': board,
+        'period': period,
+        'entries': [
+            {'rank': position, 'username': users[user_id].username, 'display_name': users[user_id].display_name, 'score': f"{score:.2f}"}
+            for position, (user_id, score) in enumerate(entries, 1) if user_id in users
+        ],
+    }
+    if request.user.is_authenticated:
+        mine = leaderboards.rank(board, request.user.id, period)
+        data['me'] = {'rank': mine[0], 'score': f"{mine[1]:.2f}"} if mine else None
+    return JsonResponse(data)
@@ -0,0 +1,42 @@
+"""
+Pre-serialised emote catalog responses.
+
+Bodies are rendered once per (catalog version, supply epoch, rarity) and kept in the cache
+both plain and gzip-compressed. The catalog version changes on every emote edit; the supply
+epoch rolls over every API_CATALOG_SUPPLY_TTL seconds so remaining_instances, which changes on
+every roll without bumping the version, is never staler than that.
+"""
+import gzip
+import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+from emotes.catalog import catalog_version
+from emotes.models import Emote
+from .serializers import EmoteCatalogSerializer
+
+def catalog_etag(rarity=''):
+    """ The current (version, epoch, rarity) as a strong ETag. """
+    epoch = int(time.time() // settings.API_CATALOG_SUPPLY_TTL)
+    return f'"{catalog_version()}.{epoch}.{rarity or "all"}"'
+
+def render_catalog(rarity=''):
+    # From the primary: the body is cached under the current version, which a lagging replica may not have caught up to
+    emotes = Emote.objects.using(DEFAULT_DB_ALIAS).select_related('artist').order_by('id')
+    if rarity:
+        emotes = emotes.filter(rarity=rarity)
+    data = {'emotes': EmoteCatalogSerializer(emotes, many=True).data}
+    body = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    compressed = gzip.compress(body, mtime=0) if len(body) >= settings.API_CATALOG_GZIP_MIN_LENGTH else None
+    return body, compressed
+
+def get_catalog(etag, rarity=''):
+    """ (body, gzipped body or None) for `etag`, rendering on a miss. """
+    key = 'api:catalog:' + etag.strip('"')
+    cached = cache.get(key)
+    if cached is None:
+        cached = render_catalog(rarity)
+        cache.set(key, cached, settings.API_CATALOG_SUPPLY_TTL * 2)
+    return cached
@@ -0,0 +1,23 @@
+from rest_framework import serializers
+from emotes.models import Emote
+
+class EmoteCatalogSerializer(serializers.ModelSerializer):
+    artist = serializers.SlugRelatedField(slug_field='username', read_only=True)
+    image = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
+    max_instances = serializers.IntegerField(read_only=True)
+    remaining_instances = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Emote
+        fields = ('id', 'name', 'chat_display_name', 'rarity', 'artist', 'image', 'thumbnail', 'max_instances', 'remaining_instances')
+        read_only_fields = fields
+
+    def get_image(self, emote):
+        return emote.image.url if emote.image else None
+
+    def get_thumbnail(self, emote):
+        return emote.thumbnail.url if emote.thumbnail else None
+
+    def get_remaining_instances(self, emote):
+        return emote.remaining_instances if emote.max_instances else None  # None means unlimited
@@ -1,5 +1,7 @@
 from django.urls import path, include
+from . import views
 
 urlpatterns = [
-    
-]
\ No newline at end of file
+    path('emotes/', views.emote_catalog, name='emote_catalog'),
+    path('inventories/', views.inventories, name='inventories'),
+]
@@ -1,3 +1,103 @@
-from django.shortcuts import render
+import hashlib
+import json
+import re
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
+from emotes.catalog import catalog_version
+from emotes.models import Emote
+from users.inventory import get_many
+from users.models import User
+from .catalog import catalog_etag, get_catalog
 
-# Create your views here.
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+@require_GET
+def emote_catalog(request):
+    """ Read-only emote catalog, optionally ?rarity=; honours If-None-Match and Accept-Encoding: gzip. """
+    rarity = request.GET.get('rarity', '')
+    if rarity and rarity not in dict(Emote.RARITY_CHOICES):
+        return JsonResponse({'error': 'Unknown rarity'}, status=400)
+
+    etag = catalog_etag(rarity)
+    # The gzip body is a different representation, so it gets its own strong ETag
+    gzip_etag = f'{etag[:-1]}-gzip"'
+    accepts_gzip = ACCEPTS_GZIP_RE.search(request.headers.get('Accept-Encoding', ''))
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in if_none_match:
+        response = HttpResponseNotModified()
+    elif accepts_gzip and gzip_etag in if_none_match:
+        response = HttpResponseNotModified()
+        etag = gzip_etag
+    else:
+        body, compressed = get_catalog(etag, rarity)
+        if compressed is not None and accepts_gzip:
+            response = HttpResponse(compressed, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+            etag = gzip_etag
+        else:
+            response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept-Encoding',))
+    patch_cache_control(response, public=True, max_age=settings.API_CATALOG_MAX_AGE)
+    return response
+
+def requested_identifiers(request):
+    """ (usernames, twitch_ids) from ?users=a,b&twitch_ids=1,2 or a JSON body with the same keys as lists. """
+    if request.method == 'POST':
+        data = json.loads(request.body or b'{}')
+        if not isinstance(data, dict):
+            raise ValueError("Expected a JSON object")
+        usernames, twitch_ids = data.get('users', []), data.get('twitch_ids', [])
+        if not isinstance(usernames, list) or not isinstance(twitch_ids, list):
+            raise ValueError("'users' and 'twitch_ids' must be lists")
+    else:
+        usernames = request.GET.get('users', '').split(',')
+        twitch_ids = request.GET.get('twitch_ids', '').split(',')
+    usernames = {str(name).strip().lstrip('@').lower() for name in usernames} - {''}
+    twitch_ids = {str(twitch_id).strip() for twitch_id in twitch_ids} - {''}
+    return usernames, twitch_ids
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def inventories(request):
+    """
+    Inventories of up to INVENTORY_BATCH_MAX_USERS users by username and/or Twitch ID, as
+    {"users": {username: {"twitch_id", "version", "emotes": [id, count, id, count, ...]}}}.
+    Emote IDs resolve through /api/emotes/. The ETag covers every user's inventory_version.
+    """
+    try:
+        usernames, twitch_ids = requested_identifiers(request)
+    except ValueError as e:  # Includes malformed JSON
+        return JsonResponse({'error': str(e)}, status=400)
+    if len(usernames) + len(twitch_ids) > settings.INVENTORY_BATCH_MAX_USERS:
+        return JsonResponse({'error': f"At most {settings.INVENTORY_BATCH_MAX_USERS} users per request"}, status=400)
+
+    rows = list(
+        User.objects.filter(Q(username__in=usernames) | Q(twitch_id__in=twitch_ids))
+        .order_by('id').values_list('id', 'username', 'twitch_id', 'inventory_version')
+    ) if usernames or twitch_ids else []
+    versions = {user_id: version for user_id, _, _, version in rows}
+    etag_source = f"{catalog_version()}|" + ','.join(f"{user_id}:{version}" for user_id, version in versions.items())
+    etag = f'"{hashlib.sha1(etag_source.encode()).hexdigest()}"'
+
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        found = get_many(versions, versions=versions)
+        users = {}
+        for user_id, username, twitch_id, version in rows:
+            emotes = [value for pair in sorted(found[user_id].counts().items()) for value in pair] if user_id in found else []
+            users[username] = {'twitch_id': twitch_id, 'version': version, 'emotes': emotes}
+        resolved = {username for _, username, _, _ in rows}
+        resolved_ids = {twitch_id for _, _, twitch_id, _ in rows}
+        response = JsonResponse({
+            'users': users,
+            'missing': sorted(usernames - resolved) + sorted(twitch_ids - resolved_ids),
+        })
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.INVENTORY_BATCH_MAX_AGE)
+    return response
@@ -16,4 +16,14 @@ load_dotenv()
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emoterush.settings')
 
-application = get_asgi_application()
+# Initialize Django before importing consumers (they import models)
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+from alerts.routing import websocket_urlpatterns
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': AllowedHostsOriginValidator(URLRouter(websocket_urlpatterns)),
+})
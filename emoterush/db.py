@@ -0,0 +1,117 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Reads go to the primary unless they run inside a designated context: a view listed in
+DATABASE_REPLICA_VIEWS (fnmatch patterns on view names) served by ReplicaRoutingMiddleware, or
+a `use_replica()` block. Even then they stay on the primary when the current request has
+already written, when the caller wrote within the last DATABASE_REPLICA_STICKY_SECONDS
+(tracked with a cookie), or inside a transaction. Writes always go to the primary, and so do
+reads that fill a shared cache (catalog, inventories, floors, leaderboards, supply snapshot):
+what a lagging replica returns there would be served to everyone until the entry expires.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fnmatch import fnmatchcase
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from .middleware import HybridMiddleware
+
+STICKY_COOKIE = 'db_sticky'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+class RoutingState:
+    """ Mutable per-request routing flags; shared by reference with threads the request spawns. """
+    __slots__ = ('replica', 'sticky', 'wrote')
+
+    def __init__(self, sticky=False):
+        self.replica = None  # Alias chosen for this context, or None for the primary
+        self.sticky = sticky
+        self.wrote = False
+
+_state = ContextVar('db_routing_state', default=None)
+
+def pick_replica():
+    return random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None
+
+@contextmanager
+def use_replica():
+    """ Send reads in this block to one replica unless the caller has written recently. """
+    state = _state.get()
+    token = None
+    if state is None:
+        state = RoutingState()
+        token = _state.set(state)
+    previous = state.replica
+    state.replica = pick_replica()
+    try:
+        yield state.replica or DEFAULT_DB_ALIAS
+    finally:
+        state.replica = previous
+        if token is not None:
+            _state.reset(token)
+
+def is_replica_view(view_name):
+    return any(fnmatchcase(view_name, pattern) for pattern in settings.DATABASE_REPLICA_VIEWS)
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None or state.wrote or state.sticky:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS  # Reads inside a transaction must see its writes
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Every alias holds the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """ Route designated safe-method views to a replica; mark callers who write as sticky. Place before SessionMiddleware. """
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+
+    def call(self, request):
+        state = RoutingState(sticky=STICKY_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.mark_sticky(state, response)
+
+    async def acall(self, request):
+        # sync_to_async copies the context, so ORM calls on worker threads share this state object
+        state = RoutingState(sticky=STICKY_COOKIE in request.COOKIES)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.mark_sticky(state, response)
+
+    def mark_sticky(self, state, response):
+        if state.wrote:
+            response.set_cookie(
+                STICKY_COOKIE, '1', max_age=settings.DATABASE_REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        match = request.resolver_match
+        if state is not None and match and request.method in SAFE_METHODS and is_replica_view(match.view_name):
+            state.replica = pick_replica()
@@ -0,0 +1,263 @@
+"""
+In-process metrics registry with Prometheus text export.
+
+Hot paths only touch a per-thread shard (no locks); shards are merged at scrape time, and those
+of exited threads are folded into a base shard so thread churn does not grow the registry.
+When settings.METRICS_DIR is set, each process periodically writes its totals to
+<METRICS_DIR>/<pid>.json and the /metrics view sums every live process file, so one
+scrape covers all workers.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not self.registry.enabled:
+            return
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+class Gauge(Metric):
+    """ Process-level value; across processes values are summed ('sum') or the max is taken ('max'). """
+    kind = 'gauge'
+
+    def __init__(self, registry, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        super().__init__(registry, name, documentation, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+
+    def set(self, value, *labels):
+        if self.registry.enabled:
+            self.registry.gauges[(self.name, labels)] = value
+
+    def inc(self, *labels, amount=1):
+        if self.registry.enabled:
+            key = (self.name, labels)
+            self.registry.gauges[key] = self.registry.gauges.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        if not self.registry.enabled:
+            return
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        data = shard.get(key)
+        if data is None:
+            data = shard[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        data[0][bisect.bisect_left(self.buckets, value)] += 1
+        data[1] += value
+        data[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+def timed(histogram, *labels):
+    """ Decorator recording a function's wall time in a histogram. """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not histogram.registry.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *labels)
+        return wrapper
+    return decorator
+
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = getattr(settings, 'METRICS_ENABLED', True)
+        self.metrics = {}
+        self.gauges = {}
+        self.base = {}  # Totals of exited threads' shards
+        self.shards = []  # (weakref to thread, its shard)
+        self.local = threading.local()
+        self.lock = threading.Lock()  # Only taken when a thread creates its shard or on export
+        self.last_flush = 0.0
+
+    def shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            with self.lock:
+                self.fold_dead_shards()
+                self.shards.append((weakref.ref(threading.current_thread()), shard))
+            return shard
+
+    def fold_dead_shards(self):
+        """ Merge the shards of exited threads into the base shard; call with the lock held. """
+        live = []
+        for thread_ref, shard in self.shards:
+            thread = thread_ref()
+            if thread is not None and thread.is_alive():
+                live.append((thread_ref, shard))
+                continue
+            for key, value in shard.items():
+                self.base[key] = merge_values(self.base.get(key), value)
+        self.shards = live
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        return self.register(Gauge(self, name, documentation, labelnames, multiprocess_mode))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def collect(self):
+        """ Merge thread shards and gauges into {name: {labels: value}} for this process. """
+        merged = {}
+        with self.lock:
+            self.fold_dead_shards()
+            shards = [dict(self.base)] + [shard for _, shard in self.shards]
+        for shard in shards:
+            for (name, labels), value in list(shard.items()):
+                series = merged.setdefault(name, {})
+                series[labels] = merge_values(series.get(labels), value)
+        for (name, labels), value in list(self.gauges.items()):
+            merged.setdefault(name, {})[labels] = value
+        return merged
+
+    def flush_to_dir(self, force=False):
+        """ Write this process's totals for other workers' /metrics to pick up (rate-limited). """
+        directory = getattr(settings, 'METRICS_DIR', None)
+        now = time.monotonic()
+        if not directory or (not force and now - self.last_flush < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        data = {name: [[list(labels), value] for labels, value in series.items()] for name, series in self.collect().items()}
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def collect_all(self):
+        """ Totals across every process that flushed recently, plus this one live. """
+        merged = self.collect()
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory or not os.path.isdir(directory):
+            return merged
+        own = f"{os.getpid()}.json"
+        stale_before = time.time() - settings.METRICS_PROCESS_TTL
+        for file_name in os.listdir(directory):
+            if not file_name.endswith('.json') or file_name == own:
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                if os.path.getmtime(path) < stale_before:
+                    os.remove(path)  # Worker exited; Prometheus treats the drop as a counter reset
+                    continue
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, series in data.items():
+                metric = self.metrics.get(name)
+                target = merged.setdefault(name, {})
+                for labels, value in series:
+                    labels = tuple(labels)
+                    if metric is not None and metric.kind == 'gauge' and metric.multiprocess_mode == 'max':
+                        target[labels] = max(target.get(labels, value), value)
+                    else:
+                        target[labels] = merge_values(target.get(labels), value)
+        return merged
+
+    def render(self):
+        """ Prometheus text exposition format (0.0.4). """
+        data = self.collect_all()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, value in sorted(data.get(name, {}).items()):
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.kind == 'histogram':
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(list(metric.buckets) + ['+Inf'], counts):
+                        cumulative += bucket_count
+                        le = bound if bound == '+Inf' else repr(float(bound))
+                        lines.append(f"{name}_bucket{format_labels(pairs + [('le', le)])} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(pairs)} {total}")
+                    lines.append(f"{name}_count{format_labels(pairs)} {count}")
+                else:
+                    lines.append(f"{name}{format_labels(pairs)} {value}")
+        return '\n'.join(lines) + '\n'
+
+def merge_values(current, value):
+    if current is None:
+        return [list(value[0]), value[1], value[2]] if isinstance(value, list) else value
+    if isinstance(value, list):
+        return [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1], current[2] + value[2]]
+    return current + value
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (f'{k}="{escape_label(v)}"' for k, v in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REGISTRY = MetricsRegistry()
+
+# Hot-path metrics
+ROLL_SECONDS = REGISTRY.histogram('emoterush_roll_seconds', 'Time spent in roll_emotes, per batch of rolls.')
+ALLOCATION_CONFLICTS = REGISTRY.counter('emoterush_allocation_conflicts_total', 'allocate_instance calls refused for lack of remaining instances.', ('rarity',))
+GATEWAY_SECONDS = REGISTRY.histogram('emoterush_payment_gateway_seconds', 'Payment gateway call latency.', ('operation', 'method', 'outcome'))
+GATEWAY_ERRORS = REGISTRY.counter('emoterush_payment_gateway_errors_total', 'Failed payment gateway calls.', ('operation', 'method'))
+SIGNAL_FANOUT_SECONDS = REGISTRY.histogram('emoterush_signal_fanout_seconds', 'Time spent in emote assignment signal fan-out.', ('signal',))
+REQUEST_SECONDS = REGISTRY.histogram('emoterush_request_seconds', 'Request latency per view.', ('view', 'method'))
+REQUEST_QUERIES = REGISTRY.histogram('emoterush_request_queries', 'SQL queries per request per view.', ('view',), buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+
+def record_gateway_call(operation, method, succeeded, seconds):
+    """ Record one payment gateway round trip (process_payment / process_payout). """
+    outcome = 'success' if succeeded else 'failure'
+    GATEWAY_SECONDS.observe(seconds, operation, method, outcome)
+    if not succeeded:
+        GATEWAY_ERRORS.inc(operation, method)
@@ -0,0 +1,148 @@
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from .metrics import REGISTRY, REQUEST_QUERIES, REQUEST_SECONDS
+
+logger = logging.getLogger('emoterush.queries')
+
+class HybridMiddleware:
+    """
+    Base for middleware that runs natively on both stacks: `call` under WSGI, `acall` under ASGI.
+    Sync-only middleware would push every async request through Django's single sync thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.acall(request)
+        return self.call(request)
+
+    def call(self, request):
+        return self.get_response(request)
+
+    async def acall(self, request):
+        return await self.get_response(request)
+
+class QueryCounter:
+    """ connection.execute_wrapper that counts queries and their total time (and statements if asked). """
+
+    def __init__(self, record=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter() if record else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            if self.statements is not None:
+                self.statements[sql] += 1  # Parameters are separate, so repeats share one key
+
+    def report(self, top=5):
+        """ The most repeated statements, e.g., to spot N+1 loops. """
+        lines = [f"{self.count} queries, {self.duration * 1000:.1f} ms in DB"]
+        for sql, n in (self.statements or Counter()).most_common(top):
+            lines.append(f"  {n}x {sql[:300]}")
+        return '\n'.join(lines)
+
+@contextmanager
+def count_queries(counter):
+    """ Install `counter` on every configured database alias (primary and replicas). """
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(counter))
+        yield counter
+
+@asynccontextmanager
+async def acount_queries(counter):
+    """
+    count_queries for the ASGI stack. Connections are per thread, and a request's sync views and
+    thread-sensitive ORM calls all run on its one sync thread, so install the counter there.
+    """
+    stack = ExitStack()
+    await sync_to_async(stack.enter_context)(count_queries(counter))
+    try:
+        yield counter
+    finally:
+        await sync_to_async(stack.close)()
+
+def query_budget_for(path, view_name):
+    """ Budget from QUERY_BUDGETS by view name, then longest matching URL prefix, else the default. """
+    budgets = settings.QUERY_BUDGETS
+    if view_name in budgets:
+        return budgets[view_name]
+    prefixes = [p for p in budgets if p.startswith('/') and path.startswith(p)]
+    if prefixes:
+        return budgets[max(prefixes, key=len)]
+    return settings.QUERY_BUDGET_DEFAULT
+
+class MetricsMiddleware(HybridMiddleware):
+    """ Per-view request latency and SQL count histograms. """
+
+    def call(self, request):
+        if not REGISTRY.enabled:
+            return self.get_response(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with count_queries(counter):
+            response = self.get_response(request)
+        self.observe(request, time.perf_counter() - started, counter.count)
+        return response
+
+    async def acall(self, request):
+        if not REGISTRY.enabled:
+            return await self.get_response(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        async with acount_queries(counter):
+            response = await self.get_response(request)
+        self.observe(request, time.perf_counter() - started, counter.count)
+        return response
+
+    def observe(self, request, seconds, queries):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        REQUEST_SECONDS.observe(seconds, view, request.method)
+        if queries is not None:
+            REQUEST_QUERIES.observe(queries, view)
+        REGISTRY.flush_to_dir()
+
+class QueryBudgetMiddleware(HybridMiddleware):
+    """ Log requests whose SQL count exceeds their budget, with the top repeated statements. """
+
+    def call(self, request):
+        counter = QueryCounter(record=True)
+        with count_queries(counter):
+            response = self.get_response(request)
+        return self.check(request, response, counter)
+
+    async def acall(self, request):
+        counter = QueryCounter(record=True)
+        async with acount_queries(counter):
+            response = await self.get_response(request)
+        return self.check(request, response, counter)
+
+    def check(self, request, response, counter):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        budget = query_budget_for(request.path, view)
+        if counter.count > budget:
+            logger.warning("Query budget exceeded on %s %s (%s): %d > %d\n%s",
+                           request.method, request.path, view, counter.count, budget, counter.report())
+        if settings.DEBUG:
+            response['Server-Timing'] = f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"'
+        return response
@@ -0,0 +1,176 @@
+"""
+Opt-in request profiling.
+
+A view is profiled when it is listed in PROFILING_VIEWS, when it wins the
+PROFILING_SAMPLE_RATE draw, or when a staff user sends the PROFILING_HEADER header.
+The default 'collapsed' mode samples the request thread's stack from a helper thread
+every PROFILING_INTERVAL seconds and writes flamegraph-ready collapsed stacks;
+'pstats' mode runs cProfile instead. With PROFILING_ENABLED off the middleware
+removes itself at startup, so disabled profiling costs nothing per request.
+"""
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, get_resolver
+from django.utils import timezone
+from .middleware import HybridMiddleware
+
+SAFE_NAME_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+class StackSampler:
+    """ Samples one thread's Python stack at a fixed interval from a background thread. """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_frame(frame)] += 1
+
+    def collapsed(self):
+        """ Brendan Gregg's collapsed format: 'root;caller;callee count' per line. """
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def collapse_frame(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+def profile_path(view_name, extension):
+    directory = settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+    return os.path.join(directory, f"{stamp}-{SAFE_NAME_RE.sub('_', view_name)}.{extension}")
+
+def list_profiles():
+    """ (name, size, modified) of stored profiles, newest first. """
+    directory = settings.PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith(('.collapsed', '.prof')):
+            stat = os.stat(os.path.join(directory, name))
+            entries.append((name, stat.st_size, stat.st_mtime))
+    return sorted(entries, key=lambda entry: entry[2], reverse=True)
+
+def prune_profiles():
+    for name, _, _ in list_profiles()[settings.PROFILING_MAX_FILES:]:
+        os.remove(os.path.join(settings.PROFILING_DIR, name))
+
+class ProfilingMiddleware(HybridMiddleware):
+    """
+    Profiles selected views, timing everything below this middleware: the view, later
+    middleware, template rendering and exception handling. Place after AuthenticationMiddleware
+    so the staff header can be checked. Under ASGI the profiler follows the thread the view
+    runs on: the event loop for async views (so other requests awaiting meanwhile show up in
+    the samples too) or the sync worker thread for sync views. Under WSGI async views pass
+    through unprofiled, as each runs on a short-lived event loop thread of its own.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed()
+        super().__init__(get_response)
+        self.views = set(settings.PROFILING_VIEWS)
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.header = f"HTTP_{settings.PROFILING_HEADER.upper().replace('-', '_')}"
+
+    def should_profile(self, request, view_name, user=None):
+        if view_name in self.views:
+            return True
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        return bool(request.META.get(self.header)) and getattr(user or request.user, 'is_staff', False)
+
+    def resolve(self, request):
+        """ The URL match the handler is about to dispatch to; resolver_match is not set yet at this point. """
+        try:
+            return get_resolver(getattr(request, 'urlconf', None)).resolve(request.path_info)
+        except Resolver404:
+            return None
+
+    def start(self):
+        """ A cProfile.Profile or StackSampler profiling the calling thread. """
+        if settings.PROFILING_FORMAT == 'pstats':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        sampler = StackSampler(threading.get_ident(), settings.PROFILING_INTERVAL)
+        sampler.start()
+        return sampler
+
+    def stop(self, profiler):
+        """ Stop `profiler`; cProfile must be disabled on the thread that enabled it. """
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        else:
+            profiler.stop()
+
+    def save(self, profiler, request, view_name, elapsed_ms):
+        if isinstance(profiler, cProfile.Profile):
+            profiler.dump_stats(profile_path(view_name, 'prof'))
+        else:
+            with open(profile_path(view_name, 'collapsed'), 'w') as f:
+                f.write(f"# {request.method} {request.path} {elapsed_ms:.1f} ms\n")
+                f.write(profiler.collapsed())
+        prune_profiles()
+
+    def call(self, request):
+        match = self.resolve(request)
+        if match is None or iscoroutinefunction(match.func) or not self.should_profile(request, match.view_name):
+            return self.get_response(request)
+        profiler = self.start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(profiler)
+        self.save(profiler, request, match.view_name, (time.perf_counter() - started) * 1000)
+        return response
+
+    async def acall(self, request):
+        match = self.resolve(request)
+        if match is None:
+            return await self.get_response(request)
+        user = await request.auser() if request.META.get(self.header) else None  # request.user would query from the loop
+        if not self.should_profile(request, match.view_name, user):
+            return await self.get_response(request)
+        on_loop = iscoroutinefunction(match.func)
+        # Sync views run on the request's thread-sensitive executor, so that is the thread to profile
+        profiler = self.start() if on_loop else await sync_to_async(self.start)()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if on_loop:
+                self.stop(profiler)
+            else:
+                await sync_to_async(self.stop)(profiler)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        await sync_to_async(self.save, thread_sensitive=False)(profiler, request, match.view_name, elapsed_ms)
+        return response
@@ -0,0 +1,34 @@
+"""
+Indexes for case-insensitive admin search on PostgreSQL.
+
+Django compiles `icontains` and `istartswith` to `UPPER(column::text) LIKE UPPER(%s)`, which no plain
+column index can serve. These helpers index that exact expression: a pg_trgm GIN index for substring
+search (search_fields 'name'), a text_pattern_ops B-tree for prefix search (search_fields '^name').
+Other databases have neither operator class, so models list them through postgres_indexes.
+"""
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import connections, models
+from django.db.models.functions import Cast, Upper
+
+def search_expression(field):
+    return Upper(Cast(field, models.TextField()))
+
+def trigram_index(field, name):
+    """ Serves `field__icontains`. Needs the pg_trgm extension (see create_trigram_extension). """
+    return GinIndex(OpClass(search_expression(field), name='gin_trgm_ops'), name=name)
+
+def prefix_index(field, name):
+    """ Serves `field__istartswith`. """
+    return models.Index(OpClass(search_expression(field), name='text_pattern_ops'), name=name)
+
+def postgres_indexes(*indexes):
+    """ `indexes` when the default database is PostgreSQL, else none: SQLite rejects the opclasses when building the schema. """
+    return list(indexes) if settings.DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql' else []
+
+def create_trigram_extension(using, **kwargs):
+    """ pre_migrate receiver: makes pg_trgm available before any migration builds a trigram index. """
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from pathlib import Path
 import os
 from dotenv import load_dotenv
@@ -16,6 +17,7 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1']
 BASE_URL = 'http://localhost:8000'
 
 INSTALLED_APPS = [
+    'daphne',
     'users.apps.UsersConfig',
     'django.contrib.admin',
     'django.contrib.auth',
@@ -24,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     
     'rest_framework',
 
@@ -45,11 +48,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'emoterush.middleware.MetricsMiddleware',
+    'emoterush.middleware.QueryBudgetMiddleware',
+    'emoterush.db.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'emoterush.profiling.ProfilingMiddleware',
     'allauth.account.middleware.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -77,15 +84,53 @@ WSGI_APPLICATION = 'emoterush.wsgi.application'
 ASGI_APPLICATION = 'emoterush.asgi.application'
 
 # Database settings
-DATABASES = {
-    'default': {
+def postgres(host, **extra):
+    """ Connection settings for the primary or a replica. """
+    config = {
         'ENGINE': 'django.db.backends.postgresql',
         'NAME': 'emoterush',
         'USER': 'postgres',
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
-        'HOST': 'localhost',
+        'HOST': host,
         'PORT': '5432',
+        'CONN_MAX_AGE': int(os.environ.get('POSTGRES_CONN_MAX_AGE', 600)),  # Persistent connections
+        'CONN_HEALTH_CHECKS': True,  # Drop dead persistent connections before reuse
     }
+    if os.environ.get('POSTGRES_POOL_SIZE'):
+        # psycopg 3 connection pool (psycopg[pool] in requirements.txt); replaces CONN_MAX_AGE
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS'] = {'pool': {'min_size': 2, 'max_size': int(os.environ['POSTGRES_POOL_SIZE'])}}
+    config.update(extra)
+    return config
+
+DATABASES = {
+    'default': postgres(os.environ.get('POSTGRES_HOST', 'localhost')),
+}
+
+# Read replicas: aliases replica1..N, used only by the views and blocks emoterush.db designates
+DATABASE_REPLICAS = []
+for i, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{i}'] = postgres(host.strip(), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica{i}')
+DATABASE_ROUTERS = ['emoterush.db.ReplicaRouter']
+DATABASE_REPLICA_VIEWS = [
+    'emote_catalog',
+    'inventories',
+    'analytics:*',
+    'marketplace:listings',
+    'marketplace:floor_prices',
+    'admin:*_changelist',
+]
+DATABASE_REPLICA_STICKY_SECONDS = 10  # Longer than worst-case replication lag
+
+# Shared cache: version stamps (catalog, matcher), inventories, payment profiles and leaderboards
+# must be visible to every worker process, so this is never the per-process LocMem default
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/1'),
+        'KEY_PREFIX': 'emoterush',
+    },
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -109,6 +154,22 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Emote catalog (see emotes.catalog)
+EMOTE_CATALOG_VERSION_TTL = 1.0  # Seconds a process reuses its read of the shared version stamp
+
+# Emote media is stored by content hash, so hashed URLs never change content
+EMOTE_MEDIA_MAX_AGE = 60 * 60 * 24 * 365
+EMOTE_MEDIA_LEGACY_MAX_AGE = 60 * 60
+# Hand file bodies to the front-end server: 'x-accel-redirect' (nginx, internal location at
+# EMOTE_MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' (Apache, lighttpd); None streams them from Django
+EMOTE_MEDIA_SENDFILE = os.environ.get('EMOTE_MEDIA_SENDFILE') or None
+EMOTE_MEDIA_ACCEL_PREFIX = '/internal-media/'
+
+# Overlay sprite atlases
+EMOTE_ATLAS_TILE_SIZE = 112
+EMOTE_ATLAS_COLUMNS = 32
+EMOTE_ATLAS_BUILD_WORKERS = 2  # Background threads per process rebuilding stale atlases
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTHENTICATION_BACKENDS = [
@@ -132,13 +193,97 @@ LOGIN_URL = '/accounts/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/'
 
-CHANNEL_LAYERS = {
+REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ],
 }
 
+# Overlay alerts: in-memory layer for a single node, Redis (channels_redis) to scale out
+CHANNEL_REDIS_URL = os.environ.get('CHANNEL_REDIS_URL')
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [CHANNEL_REDIS_URL], 'capacity': 1000, 'expiry': 10},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
+
+# Per-overlay alert coalescing and backpressure
+ALERTS_COALESCE_WINDOW = 2.0  # Seconds between flushes of merged alerts
+ALERTS_MAX_QUEUE_DEPTH = 50  # Alerts buffered per overlay before low-priority ones are summarized
+ALERTS_PRIORITY_RARITIES = ('mythic', 'novelty')
+ALERTS_MAX_EMOTES_PER_ALERT = 10
+
+# Analytics
+ANALYTICS_EVENT_BUFFER_SIZE = 500  # Roll events per bulk insert
+ANALYTICS_ROLLUP_GAP_TIMEOUT = timedelta(minutes=10)  # A skipped event ID not committed by then was rolled back
+ANALYTICS_SUPPLY_RATE_WINDOW = timedelta(hours=24)  # Allocation rate is averaged over this window
+ANALYTICS_SUPPLY_CACHE_TIMEOUT = 300
+ANALYTICS_SUPPLY_SNAPSHOT_RETENTION_DAYS = 30
+
+# Leaderboards (donors, streamers, collectors; daily, weekly and all-time)
+LEADERBOARD_SIZE = 100  # Entries kept in each cached top list
+LEADERBOARD_CACHE_TIMEOUT = 300  # Bounds drift of the cached top lists between processes
+LEADERBOARD_RETENTION_DAYS = 35  # Daily and weekly rows older than this are pruned
+LEADERBOARD_RARITY_WEIGHTS = {  # Collector score per emote held; special rarities do not count
+    'common': 1,
+    'uncommon': 2,
+    'rare': 5,
+    'epic': 10,
+    'legendary': 25,
+    'exotic': 50,
+    'mythic': 100,
+    'novelty': 250,
+}
+
+# Metrics (/metrics, Prometheus text format)
+METRICS_ENABLED = True
+METRICS_DIR = os.environ.get('METRICS_DIR')  # Shared directory to aggregate across worker processes
+METRICS_FLUSH_INTERVAL = 5  # Seconds between per-process snapshot writes
+METRICS_PROCESS_TTL = 600  # Drop snapshots of processes silent for this long
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# SQL query budgets per request: view name or URL prefix -> max queries (see emoterush.testing.query_budget)
+QUERY_BUDGET_DEFAULT = 50
+QUERY_BUDGETS = {
+    # payments.urls has no namespace. Donations roll in one batch (roll_emotes) and bump every leaderboard bucket at once, so the count doesn't grow with the amount.
+    # Measured at 38 queries warm and 42 on a process's first donation, leaderboard writes after commit included
+    'donate': 45,
+    'donate_to_username': 45,
+    'request_payout': 35,  # Payout and fee ledger rows each update the earnings rollups
+    '/admin/': 30,
+}
+
+# Per-user inventory read cache (see users.inventory)
+INVENTORY_CACHE_TIMEOUT = 3600
+INVENTORY_BATCH_MAX_USERS = 500  # Usernames plus Twitch IDs accepted by /api/inventories/
+INVENTORY_BATCH_MAX_AGE = 5  # Seconds an overlay may reuse a batch response before revalidating
+
+# Streamer payment profiles behind /donate/@username/ (see users.profiles)
+PAYMENT_PROFILE_CACHE_TIMEOUT = 3600  # Evicted on change; the timeout only bounds writes that bypass User.save
+PAYMENT_PROFILE_MISSING_TIMEOUT = 60  # Unknown usernames
+
+# Emote catalog API
+API_CATALOG_MAX_AGE = 30  # Seconds clients may reuse a response before revalidating
+API_CATALOG_SUPPLY_TTL = 60  # Max staleness of remaining_instances, which does not bump the catalog version
+API_CATALOG_GZIP_MIN_LENGTH = 1024  # Smaller bodies are sent uncompressed
+
+# Request profiling (see emoterush.profiling); off unless PROFILING_ENABLED=true
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILING_VIEWS = []  # View names always profiled, e.g., ['payments:donate']
+PROFILING_SAMPLE_RATE = 0.0  # Fraction of other requests profiled
+PROFILING_HEADER = 'X-Profile'  # Staff users can send this header to profile one request
+PROFILING_FORMAT = 'collapsed'  # 'collapsed' (sampled stacks) or 'pstats' (cProfile)
+PROFILING_INTERVAL = 0.005  # Seconds between stack samples
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_FILES = 200
+
 AUTH_USER_MODEL = 'users.User'
 
 SOCIALACCOUNT_ONLY = True
@@ -157,3 +302,10 @@ PAYPAL_SECRET = os.environ.get('PAYPAL_SECRET')
 PAYPAL_MODE = os.environ.get('PAYPAL_MODE', 'sandbox')
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
+PAYPAL_API_BASE = 'https://api-m.paypal.com' if PAYPAL_MODE == 'live' else 'https://api-m.sandbox.paypal.com'
+STRIPE_API_BASE = 'https://api.stripe.com'
+PAYMENT_GATEWAY_TIMEOUT = 30  # Seconds per async gateway request
+PAYMENT_GATEWAY_MAX_CONNECTIONS = 200  # Per process; bounds in-flight async gateway calls
+# Route payments to the async views unless served by emoterush.wsgi, where each async view call would
+# run on a fresh event loop; the sync views hold a worker thread per request instead
+PAYMENT_ASYNC_VIEWS = os.environ.get('EMOTERUSH_SERVER', 'asgi') != 'wsgi'
@@ -0,0 +1,31 @@
+from contextlib import contextmanager
+from django.db import connections
+from django.urls import resolve
+from .middleware import QueryCounter, count_queries, query_budget_for
+
+@contextmanager
+def query_budget(budget=None, path='', view_name=None, using=None):
+    """
+    Fail if the block runs more SQL than its budget (explicit, or looked up like the middleware).
+    Queries on every alias count unless `using` names one.
+    Usage:
+        with query_budget(path='/payments/donate/'):
+            self.client.post('/payments/donate/', data)
+    """
+    if budget is None:
+        if view_name is None and path:
+            view_name = resolve(path).view_name
+        budget = query_budget_for(path, view_name)
+    counter = QueryCounter(record=True)
+    with (connections[using].execute_wrapper(counter) if using else count_queries(counter)):
+        yield counter
+    if counter.count > budget:
+        raise AssertionError(f"Query budget exceeded for {view_name or path or 'block'}: {counter.count} > {budget}\n{counter.report()}")
+
+class QueryBudgetMixin:
+    """ TestCase mixin: self.assertWithinQueryBudget('post', '/payments/donate/', data={...}). """
+
+    def assertWithinQueryBudget(self, method, path, budget=None, **kwargs):
+        with query_budget(budget=budget, path=path):
+            response = getattr(self.client, method)(path, **kwargs)
+        return response
@@ -0,0 +1,62 @@
+import asyncio
+import os
+import tempfile
+import time
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import path
+from .profiling import ProfilingMiddleware, list_profiles
+
+async def slow_async_view(request):
+    await asyncio.sleep(0.05)
+    return HttpResponse('done')
+
+def slow_sync_view(request):
+    time.sleep(0.05)
+    return HttpResponse('done')
+
+urlpatterns = [
+    path('slow/', slow_async_view, name='slow'),
+    path('slow-sync/', slow_sync_view, name='slow_sync'),
+]
+
+class ProfilingMiddlewareTests(SimpleTestCase):
+    """ Listed views are profiled on the ASGI path too. """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            PROFILING_ENABLED=True, PROFILING_VIEWS=['slow', 'slow_sync'], PROFILING_FORMAT='collapsed',
+            PROFILING_INTERVAL=0.001, PROFILING_DIR=directory.name,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory.name
+
+    async def profile(self, view, url):
+        async def get_response(request):
+            # As the ASGI handler dispatches: sync views go to the thread-sensitive executor
+            if asyncio.iscoroutinefunction(view):
+                return await view(request)
+            return await sync_to_async(view)(request)
+
+        request = RequestFactory().get(url)
+        request.urlconf = __name__
+        response = await ProfilingMiddleware(get_response)(request)
+        self.assertEqual(response.content, b'done')
+        profiles = list_profiles()
+        self.assertEqual(len(profiles), 1)
+        with open(os.path.join(self.directory, profiles[0][0])) as f:
+            header, *stacks = f.read().splitlines()
+        self.assertTrue(header.startswith(f"# GET {url} "))
+        return stacks
+
+    async def test_async_view_is_profiled(self):
+        stacks = await self.profile(slow_async_view, '/slow/')
+        self.assertTrue(stacks)  # The loop thread was sampled while the view awaited
+
+    async def test_sync_view_under_asgi_is_profiled(self):
+        stacks = await self.profile(slow_sync_view, '/slow-sync/')
+        self.assertTrue(any('slow_sync_view' in stack for stack in stacks))
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from .views import home
+from .views import home, metrics, profiles, profile_download
+from emotes.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,7 +11,15 @@ urlpatterns = [
     path('users/', include('users.urls')),
     path('api/', include('api.urls')),
     path('', home, name='home'),
+    path('metrics', metrics, name='metrics'),
+    path('profiles/', profiles, name='profiles'),
+    path('profiles/<str:name>', profile_download, name='profile_download'),
     path('payments/', include('payments.urls')),
+    path('emotes/', include('emotes.urls')),
+    path('analytics/', include('analytics.urls')),
+    path('marketplace/', include('marketplace.urls')),
+    path('alerts/', include('alerts.urls')),
+    path(f"{settings.MEDIA_URL.strip('/')}/emotes/<path:path>", serve_media, name='emote_media'),
 ]
 
 if settings.DEBUG:
@@ -1,4 +1,29 @@
-from django.http import HttpResponse
+import os
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from .metrics import REGISTRY
+from .profiling import list_profiles
 
 def home(request):
-    return HttpResponse("Welcome to EmoteRush!")
\ No newline at end of file
+    return HttpResponse("Welcome to EmoteRush!")
+
+def metrics(request):
+    """ Prometheus scrape endpoint; open to METRICS_ALLOWED_IPS and staff. """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@staff_member_required
+def profiles(request):
+    """ List stored request profiles. """
+    return JsonResponse({'profiles': [
+        {'name': name, 'size': size, 'modified': modified} for name, size, modified in list_profiles()
+    ]})
+
+@staff_member_required
+def profile_download(request, name):
+    """ Download one profile (.collapsed for flamegraph.pl/speedscope, .prof for pstats/snakeviz). """
+    if name != os.path.basename(name) or name not in {entry[0] for entry in list_profiles()}:
+        raise Http404("Profile not found")
+    return FileResponse(open(os.path.join(settings.PROFILING_DIR, name), 'rb'), as_attachment=True, filename=name)
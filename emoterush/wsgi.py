@@ -15,5 +15,6 @@ from django.core.wsgi import get_wsgi_application
 load_dotenv()
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'emoterush.settings')
+os.environ.setdefault('EMOTERUSH_SERVER', 'wsgi')  # Selects the sync payment views (PAYMENT_ASYNC_VIEWS)
 
 application = get_wsgi_application()
@@ -1,8 +1,15 @@
+from contextvars import ContextVar
 from django.contrib import admin
-from .models import Emote
+from .models import Emote, MediaBlob
+from analytics.supply import get_supply_snapshot
+
+page_snapshot = ContextVar('page_snapshot', default=None)  # Supply snapshot read once per changelist page
+
+def clear_page_snapshot(response=None):
+    page_snapshot.set(None)
 
 class EmoteAdmin(admin.ModelAdmin):
-    list_display = ('name', 'chat_display_name', 'rarity', 'artist', 'formatted_roll_chance', 'formatted_max_instances', 'remaining_instances', 'created_at')
+    list_display = ('name', 'chat_display_name', 'rarity', 'artist', 'formatted_roll_chance', 'formatted_max_instances', 'remaining_instances', 'allocation_rate', 'exhaustion_eta', 'created_at')
     list_filter = ('rarity',)
     search_fields = ('name', 'chat_display_name')
     autocomplete_fields = ['artist']
@@ -52,6 +59,33 @@ class EmoteAdmin(admin.ModelAdmin):
         return f"{obj.max_instances:,}" if obj.max_instances > 0 else "Unlimited"
     formatted_max_instances.short_description = "Max Instances"
 
+    def changelist_view(self, request, extra_context=None):
+        """ Reads the supply snapshot once for the page instead of twice per row; rows render after this returns. """
+        page_snapshot.set(get_supply_snapshot())
+        response = super().changelist_view(request, extra_context)
+        # Under ASGI the render runs in another context, where the set() token would not reset
+        if hasattr(response, 'add_post_render_callback') and not response.is_rendered:
+            response.add_post_render_callback(clear_page_snapshot)
+        else:
+            clear_page_snapshot()
+        return response
+
+    def supply_stats(self, obj):
+        """ This emote's entry in the cached supply snapshot (see refresh_supply_stats). """
+        snapshot = page_snapshot.get()
+        if snapshot is None:
+            snapshot = get_supply_snapshot()
+        return snapshot.get('emotes', {}).get(str(obj.pk), {})
+
+    def allocation_rate(self, obj):
+        rate = self.supply_stats(obj).get('rate_per_hour')
+        return f"{rate:,}/h" if rate else "-"
+    allocation_rate.short_description = "Allocation Rate"
+
+    def exhaustion_eta(self, obj):
+        return self.supply_stats(obj).get('exhaustion_eta') or "-"
+    exhaustion_eta.short_description = "Exhaustion ETA"
+
     def has_add_permission(self, request):
         return request.user.is_superuser
     
@@ -74,4 +108,14 @@ class EmoteAdmin(admin.ModelAdmin):
     class Media:
         js = ('admin/js/emote_rarity_update.js',)
 
-admin.site.register(Emote, EmoteAdmin)
\ No newline at end of file
+admin.site.register(Emote, EmoteAdmin)
+
+@admin.register(MediaBlob)
+class MediaBlobAdmin(admin.ModelAdmin):
+    list_display = ('path', 'ref_count', 'created_at', 'updated_at')
+    list_filter = ('ref_count',)
+    search_fields = ('path', 'sha256')
+    readonly_fields = ('path', 'sha256', 'ref_count', 'created_at', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
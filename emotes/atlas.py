@@ -0,0 +1,175 @@
+"""
+Overlay sprite atlases.
+
+Views serve the last built atlas and, when the emotes behind it have changed, rebuild it on a
+background thread, so no request decodes or encodes images. Builds of one key queue on its
+EmoteAtlas row, so concurrent builders never race to create it and a late one finds the work done.
+"""
+import hashlib
+import io
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from .media import emote_media_storage, retain_media, release_media
+from .models import Emote, EmoteAtlas
+
+logger = logging.getLogger('emoterush.emotes')
+
+def inventory_version(emotes):
+    """ Hash the emotes (and their stored image paths) that make up an atlas. """
+    sha = hashlib.sha1()
+    for emote in sorted(emotes, key=lambda e: e.pk):
+        sha.update(f"{emote.pk}:{emote.chat_display_name}:{emote.thumbnail.name or emote.image.name}\n".encode())
+    return sha.hexdigest()
+
+def tile_signature(emote):
+    """ What a cell's pixels depend on: the emote and the stored image its tile is cut from. """
+    return f"{emote.pk}:{emote.thumbnail.name or emote.image.name}"
+
+def load_tile(emote, tile_size):
+    """ Return a tile_size square RGBA still of the emote (thumbnail or first GIF frame). """
+    from PIL import Image  # Loaded when an atlas is first built, not with the URLconf
+    source = emote.thumbnail if emote.thumbnail else emote.image
+    with source.open('rb') as f:
+        img = Image.open(f)
+        img.seek(0)
+        img = img.convert('RGBA')
+    if img.size != (tile_size, tile_size):
+        img = img.resize((tile_size, tile_size), Image.LANCZOS)
+    return img
+
+def cell_box(index, columns, tile_size):
+    x = (index % columns) * tile_size
+    y = (index // columns) * tile_size
+    return x, y
+
+def build_atlas(key, emotes):
+    """
+    Build or incrementally update the sprite sheet for a set of emotes.
+    Args:
+        key (str): Atlas identity, e.g., 'user:42' or 'rarity:mythic'.
+        emotes (iterable): Emote instances to include.
+    Returns:
+        EmoteAtlas: Up-to-date atlas; unchanged inventories return the cached row without touching images.
+    """
+    emotes = [e for e in emotes if e.image]
+    version = inventory_version(emotes)
+    atlas = EmoteAtlas.objects.filter(key=key).first()
+    if atlas and atlas.version == version:
+        return atlas
+    with transaction.atomic():
+        # Builders of one key take turns on its row; whoever comes second finds it up to date
+        EmoteAtlas.objects.get_or_create(key=key)
+        atlas = EmoteAtlas.objects.select_for_update().get(key=key)
+        if atlas.version != version:
+            write_sheet(atlas, emotes, version)
+    return atlas
+
+def write_sheet(atlas, emotes, version):
+    """ Pack `emotes` into a new sheet for the locked `atlas`, reusing unchanged cells of its current one. """
+    from PIL import Image
+
+    tile_size = settings.EMOTE_ATLAS_TILE_SIZE
+    columns = settings.EMOTE_ATLAS_COLUMNS
+    layout = atlas.get_layout()
+    reuse = bool(atlas.sheet and layout.get('tile') == tile_size and layout.get('columns') == columns)
+    old_cells = layout.get('cells', {}) if reuse else {}
+    old_signatures = layout.get('signatures', {}) if reuse else {}
+
+    # Keep cells of emotes still owned; only new emotes and those whose image changed need decoding and pasting
+    wanted = {e.chat_display_name: e for e in emotes}
+    signatures = {name: tile_signature(emote) for name, emote in wanted.items()}
+    cells = {name: index for name, index in old_cells.items() if name in wanted}
+    changed = [name for name in sorted(cells) if old_signatures.get(name) != signatures[name]]
+    freed = sorted(index for name, index in old_cells.items() if name not in wanted)
+    next_index = max(old_cells.values(), default=-1) + 1
+    added = [name for name in sorted(wanted) if name not in cells]
+    for name in added:
+        if freed:
+            cells[name] = freed.pop(0)
+        else:
+            cells[name] = next_index
+            next_index += 1
+
+    rows = max(1, (max(cells.values(), default=-1) // columns) + 1)
+    size = (columns * tile_size, rows * tile_size)
+    sheet = Image.new('RGBA', size, (0, 0, 0, 0))
+    if reuse:
+        with emote_media_storage.open(atlas.sheet, 'rb') as f:
+            old_sheet = Image.open(f).convert('RGBA')
+        sheet.paste(old_sheet.crop((0, 0, min(old_sheet.width, size[0]), min(old_sheet.height, size[1]))), (0, 0))
+        blank = Image.new('RGBA', (tile_size, tile_size), (0, 0, 0, 0))
+        for index in freed:  # Cells of removed emotes that no new emote took over
+            sheet.paste(blank, cell_box(index, columns, tile_size))
+    for name in (added + changed if reuse else wanted):
+        sheet.paste(load_tile(wanted[name], tile_size), cell_box(cells[name], columns, tile_size))
+
+    buffer = io.BytesIO()
+    sheet.save(buffer, 'PNG', optimize=True)
+    sheet_name = emote_media_storage.save('emotes/atlases/sheet.png', ContentFile(buffer.getvalue()))
+
+    old_sheet_name = atlas.sheet
+    atlas.version = version
+    atlas.sheet = sheet_name
+    atlas.set_layout({'tile': tile_size, 'columns': columns, 'cells': cells, 'signatures': signatures})
+    atlas.save()
+    if old_sheet_name != sheet_name:
+        retain_media(sheet_name)
+        release_media(old_sheet_name)
+
+_executor = None
+_scheduled = set()
+_scheduled_lock = threading.Lock()
+
+def schedule_build(key, emote_ids):
+    """ Build an atlas on a background thread unless this process already has the key queued. """
+    global _executor
+    with _scheduled_lock:
+        if key in _scheduled:
+            return
+        _scheduled.add(key)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.EMOTE_ATLAS_BUILD_WORKERS, thread_name_prefix='atlas')
+    _executor.submit(run_build, key, emote_ids)
+
+def run_build(key, emote_ids):
+    try:
+        build_atlas(key, Emote.objects.filter(id__in=emote_ids))
+    except Exception:
+        logger.exception("Could not build atlas %s", key)
+    finally:
+        with _scheduled_lock:
+            _scheduled.discard(key)
+        connection.close()  # This thread's own connection; nothing else closes it
+
+def current_atlas(key, emotes):
+    """
+    The last built atlas for `key` (None before the first build finishes), scheduling a background
+    rebuild when `emotes` no longer match it.
+    """
+    emotes = [e for e in emotes if e.image]
+    atlas = EmoteAtlas.objects.filter(key=key).exclude(version='').first()
+    if atlas is None or atlas.version != inventory_version(emotes):
+        schedule_build(key, [e.pk for e in emotes])
+    return atlas
+
+def user_emotes(user):
+    owned = [name for name, count in user.get_emotes().items() if count > 0]
+    return Emote.objects.filter(name__in=owned)
+
+def build_user_atlas(user):
+    """ Atlas of every emote the user currently owns. """
+    return build_atlas(f"user:{user.pk}", user_emotes(user))
+
+def build_rarity_atlas(rarity):
+    """ Atlas of every emote in a rarity tier. """
+    return build_atlas(f"rarity:{rarity}", Emote.objects.filter(rarity=rarity))
+
+def current_user_atlas(user):
+    return current_atlas(f"user:{user.pk}", user_emotes(user))
+
+def current_rarity_atlas(rarity):
+    return current_atlas(f"rarity:{rarity}", Emote.objects.filter(rarity=rarity))
@@ -0,0 +1,102 @@
+"""
+Emote catalog version stamp and process-local catalog cache.
+
+The stamp lives in the shared cache and changes whenever an emote is created, edited or
+deleted, so anything derived from the catalog (cached API responses, per-process lookups)
+can tell it is stale. Saves that only move remaining_instances do not change it, which is
+why the cached entries carry no supply counts. Each process re-reads the stamp at most every
+EMOTE_CATALOG_VERSION_TTL seconds, so other processes see an edit within that time (this
+process sees its own at once).
+"""
+import threading
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from .models import Emote
+
+VERSION_KEY = 'emotes:catalog_version'
+
+_version = (None, 0.0)  # (stamp, time.monotonic() it was read)
+
+def catalog_version():
+    global _version
+    version, read_at = _version
+    now = time.monotonic()
+    if version is None or now - read_at >= settings.EMOTE_CATALOG_VERSION_TTL:
+        version = cache.get_or_set(VERSION_KEY, lambda: uuid.uuid4().hex[:12], None)
+        _version = (version, now)
+    return version
+
+def publish_version():
+    global _version
+    # A fresh token rather than a counter, so a cache flush can never bring an old version back
+    version = uuid.uuid4().hex[:12]
+    cache.set(VERSION_KEY, version, None)
+    _version = (version, time.monotonic())
+
+def bump_catalog_version():
+    """
+    Publish a new version once the current transaction commits (at once outside one); bumping
+    earlier would let another process reload the old rows and keep them under the new token.
+    """
+    transaction.on_commit(publish_version)
+
+class CatalogEmote(namedtuple('CatalogEmote', ['id', 'name', 'chat_display_name', 'rarity', 'artist_id'])):
+    """ Immutable catalog fields of an Emote. """
+    __slots__ = ()
+
+    def is_special(self):
+        return self.rarity in Emote.SPECIAL_RARITIES
+
+    @property
+    def max_instances(self):
+        return Emote.RARITY_MAX_INSTANCES.get(self.rarity, 0)
+
+    def allocate(self, count=1):
+        return Emote.allocate(self.id, self.rarity, count)
+
+class EmoteCatalog:
+    """ Every emote indexed by ID, name, chat_display_name and rarity. """
+
+    def __init__(self, rows):
+        self.by_id, self.by_name, self.by_chat_name = {}, {}, {}
+        self.by_rarity = defaultdict(list)
+        for row in rows:
+            emote = CatalogEmote(*row)
+            self.by_id[emote.id] = emote
+            self.by_name[emote.name] = emote
+            self.by_chat_name[emote.chat_display_name] = emote
+            self.by_rarity[emote.rarity].append(emote)
+
+_lock = threading.Lock()
+_catalog = None
+_catalog_version = None
+
+def get_catalog():
+    """ Return the process-local catalog, reloading it from the primary in one query if the shared version moved. """
+    global _catalog, _catalog_version
+    version = catalog_version()
+    if _catalog is None or _catalog_version != version:
+        with _lock:
+            if _catalog is None or _catalog_version != version:
+                _catalog = EmoteCatalog(Emote.objects.using(DEFAULT_DB_ALIAS).values_list('id', 'name', 'chat_display_name', 'rarity', 'artist_id'))
+                _catalog_version = version
+    return _catalog
+
+def clear_catalog():
+    """ Drop this process's copy and its read of the version; other processes notice the bumped version. """
+    global _catalog, _version
+    _catalog = None
+    _version = (None, 0.0)
+
+def get_emote(id=None, name=None, chat_display_name=None):
+    """ Look up one CatalogEmote by any key; None if it does not exist. """
+    catalog = get_catalog()
+    if id is not None:
+        return catalog.by_id.get(id)
+    if name is not None:
+        return catalog.by_name.get(name)
+    return catalog.by_chat_name.get(chat_display_name)
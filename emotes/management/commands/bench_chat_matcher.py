@@ -0,0 +1,56 @@
+import random
+import string
+import time
+from django.core.management.base import BaseCommand
+from emotes.matcher import ChatMatcher
+
+WORDS = ['lol', 'gg', 'pog', 'nice', 'what', 'no', 'way', 'hype', 'clip', 'that', 'chat', 'W', 'L', 'based', 'true']
+
+class Command(BaseCommand):
+    help = 'Benchmark ER: token matching and ownership checks on a synthetic chat log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--emotes', type=int, default=5000, help='Synthetic emotes in the catalog.')
+        parser.add_argument('--users', type=int, default=20000, help='Synthetic chatters.')
+        parser.add_argument('--owned', type=int, default=200, help='Emotes owned per chatter.')
+        parser.add_argument('--messages', type=int, default=200000, help='Chat messages in the log.')
+        parser.add_argument('--emote-rate', type=float, default=0.3, help='Fraction of messages containing ER: tokens.')
+        parser.add_argument('--batch', type=int, default=1000, help='Messages per match_batch call.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        names = [f"ER:{''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12)))}{i}" for i in range(options['emotes'])]
+
+        started = time.perf_counter()
+        matcher = ChatMatcher(enumerate(names, start=1))
+        build_time = time.perf_counter() - started
+
+        users = [f"viewer{i}" for i in range(options['users'])]
+        owned = {}
+        for username in users:
+            owned_names = rng.sample(names, min(options['owned'], len(names)))
+            owned[username] = matcher.bitset({name[3:]: 1 for name in owned_names})
+
+        pairs = []
+        for _ in range(options['messages']):
+            words = rng.choices(WORDS, k=rng.randint(2, 12))
+            if rng.random() < options['emote_rate']:
+                for _ in range(rng.randint(1, 3)):
+                    token = rng.choice(names) + rng.choice(['', '', '', '!', '?'])
+                    words.insert(rng.randint(0, len(words)), token)
+            pairs.append((rng.choice(users), ' '.join(words)))
+
+        batch = options['batch']
+        tokens = 0
+        started = time.perf_counter()
+        for start in range(0, len(pairs), batch):
+            for _, matches in matcher.match_batch(pairs[start:start + batch], owned):
+                tokens += len(matches)
+        elapsed = time.perf_counter() - started
+
+        bitset_bytes = sum((bits.bit_length() + 7) // 8 for bits in owned.values())
+        self.stdout.write(f"Catalog build:      {build_time * 1000:.1f} ms for {len(names):,} emotes")
+        self.stdout.write(f"Messages:           {len(pairs):,} ({tokens:,} emote tokens)")
+        self.stdout.write(f"Throughput:         {len(pairs) / elapsed:,.0f} msg/s, {tokens / elapsed:,.0f} tokens/s")
+        self.stdout.write(f"Ownership bitsets:  {bitset_bytes / len(owned):,.0f} bytes/user")
@@ -0,0 +1,54 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from emoterush.metrics import REGISTRY
+from emotes.services import roll_emote
+from users.models import User
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Benchmark roll_emote throughput with metrics on and off (changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', default=None, help='User to roll for (default: first user).')
+        parser.add_argument('--rolls', type=int, default=500, help='Rolls per round.')
+        parser.add_argument('--rounds', type=int, default=5, help='Alternating on/off rounds; the best of each is kept.')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(username=options['username']) if options['username'] else User.objects.order_by('id')
+        user = users.first()
+        if user is None:
+            raise CommandError("No user found; create one or pass --username.")
+
+        best = {True: float('inf'), False: float('inf')}
+        was_enabled = REGISTRY.enabled
+        try:
+            for i in range(options['rounds']):
+                for enabled in ((False, True) if i % 2 == 0 else (True, False)):
+                    REGISTRY.enabled = enabled
+                    best[enabled] = min(best[enabled], self.run_round(user, options['rolls']))
+        finally:
+            REGISTRY.enabled = was_enabled
+
+        rolls = options['rolls']
+        overhead = (best[True] - best[False]) / best[False] * 100
+        self.stdout.write(f"Metrics off:  {rolls / best[False]:,.0f} rolls/s ({best[False] / rolls * 1e6:,.1f} us/roll)")
+        self.stdout.write(f"Metrics on:   {rolls / best[True]:,.0f} rolls/s ({best[True] / rolls * 1e6:,.1f} us/roll)")
+        self.stdout.write(f"Overhead:     {overhead:+.2f}%")
+
+    def run_round(self, user, rolls):
+        """ Time `rolls` rolls in a transaction that is then rolled back. """
+        elapsed = 0.0
+        try:
+            with transaction.atomic():
+                user = User.objects.get(pk=user.pk)
+                started = time.perf_counter()
+                for _ in range(rolls):
+                    roll_emote(user)
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        return elapsed
@@ -0,0 +1,50 @@
+import csv
+import time
+from django.core.management.base import BaseCommand, CommandError
+from emotes.models import Emote
+from emotes.services import SPECIAL_ROLE_FIELDS, grant_emote, revoke_emote, set_role
+from users.models import User
+
+def read_user_ids(path):
+    """ User IDs from the first column of a CSV file; non-numeric rows (e.g., a header) are skipped. """
+    with open(path, newline='') as f:
+        return [int(row[0]) for row in csv.reader(f) if row and row[0].strip().isdigit()]
+
+class Command(BaseCommand):
+    help = 'Grant or revoke an emote, or set or clear a role, for many users at once'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--emote', help='Emote name to grant (or revoke with --revoke).')
+        target.add_argument('--role', choices=list(SPECIAL_ROLE_FIELDS), help='Role to set (or clear with --revoke); setting grants its emotes.')
+        users = parser.add_mutually_exclusive_group(required=True)
+        users.add_argument('--csv', help='CSV file with user IDs in the first column.')
+        users.add_argument('--all', action='store_true', help='Every user.')
+        parser.add_argument('--revoke', action='store_true', help='Revoke the emote or clear the role instead.')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Users per transaction.')
+
+    def handle(self, *args, **options):
+        users = User.objects.all() if options['all'] else read_user_ids(options['csv'])
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+
+        if options['role']:
+            rarity = options['role']
+            changed, granted = set_role(users, rarity, not options['revoke'], chunk_size)
+            summary = f"{'Cleared' if options['revoke'] else 'Set'} {rarity} role on {changed} users; granted {granted} emotes"
+        else:
+            try:
+                emote = Emote.objects.get(name=options['emote'])
+            except Emote.DoesNotExist:
+                raise CommandError(f"Emote '{options['emote']}' does not exist.")
+            if options['revoke']:
+                changed, revoked = revoke_emote(emote, users, chunk_size)
+                summary = f"Revoked {revoked} {emote.name} from {changed} users"
+            else:
+                try:
+                    granted = grant_emote(emote, users, chunk_size)
+                except ValueError as e:
+                    raise CommandError(str(e))
+                summary = f"Granted {emote.name} to {granted} users"
+
+        self.stdout.write(self.style.SUCCESS(f"{summary} in {time.perf_counter() - started:.2f}s."))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from emotes.catalog import bump_catalog_version
+from emotes.models import Emote
+
+class Command(BaseCommand):
+    help = (
+        "Rename emotes that share a name, keeping the oldest, so the unique constraint on Emote.name can be applied. "
+        "Run it before altering the column. Inventories key emotes by name, so holdings of a shared name stay with the oldest emote."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List the renames without making them.')
+
+    def handle(self, *args, **options):
+        names = list(Emote.objects.values('name').annotate(copies=Count('id')).filter(copies__gt=1).values_list('name', flat=True))
+        renamed = 0
+        with transaction.atomic():
+            for name in names:
+                for emote_id in Emote.objects.filter(name=name).order_by('id').values_list('id', flat=True)[1:]:
+                    suffix = f"_{emote_id}"
+                    new_name = name[:Emote._meta.get_field('name').max_length - len(suffix)] + suffix
+                    self.stdout.write(f"{'Would rename' if options['dry_run'] else 'Renamed'} #{emote_id} {name} -> {new_name}")
+                    if not options['dry_run']:
+                        Emote.objects.filter(pk=emote_id).update(name=new_name, chat_display_name=f"ER:{new_name}")
+                    renamed += 1
+            if renamed and not options['dry_run']:
+                bump_catalog_version()
+        verb = 'Would rename' if options['dry_run'] else 'Renamed'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {renamed} emote(s) sharing {len(names)} name(s)."))
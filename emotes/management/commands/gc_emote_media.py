@@ -0,0 +1,17 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from emotes.media import collect_orphaned_media
+
+class Command(BaseCommand):
+    help = 'Delete content-addressed emote media files that are no longer referenced by any emote'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=1.0, help='Only collect files unreferenced for at least this many hours.')
+        parser.add_argument('--dry-run', action='store_true', help='List orphaned files without deleting them.')
+
+    def handle(self, *args, **options):
+        deleted = collect_orphaned_media(grace=timedelta(hours=options['grace_hours']), dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        for path in deleted:
+            self.stdout.write(f"{verb} {path}")
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(deleted)} orphaned media file(s)."))
@@ -0,0 +1,194 @@
+import csv
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from emotes.catalog import bump_catalog_version
+from emotes.matcher import invalidate_matcher
+from emotes.media import emote_media_storage, retain_media
+from emotes.models import Emote, validate_square_image, validate_emote_format_and_size, validate_thumbnail
+from emotes.services import assign_special_emotes
+from users.models import User
+
+MANIFEST_NAMES = ('manifest.json', 'manifest.csv')
+
+def validate_entry(entry):
+    """
+    Validate one manifest entry and generate its renditions. Runs in a worker process.
+    Args:
+        entry (dict): Manifest row with 'image' (and optional 'thumbnail') bytes attached.
+    Returns:
+        dict: The entry with 'error' set, or with a generated 'thumbnail' for GIFs lacking one.
+    """
+    try:
+        image = ContentFile(entry['image'], name=entry['file'])
+        validate_square_image(image)
+        validate_emote_format_and_size(image)
+        if entry.get('thumbnail'):
+            thumb = ContentFile(entry['thumbnail'], name=entry['thumbnail_file'])
+            validate_square_image(thumb)
+            validate_thumbnail(thumb)
+        elif os.path.splitext(entry['file'])[1].lower() == '.gif':
+            # Thumbnail rendition defaults to the first frame of the GIF
+            img = Image.open(io.BytesIO(entry['image']))
+            img.seek(0)
+            buffer = io.BytesIO()
+            img.convert('RGBA').save(buffer, 'PNG', optimize=True)
+            entry['thumbnail'] = buffer.getvalue()
+            entry['thumbnail_file'] = f"{os.path.splitext(entry['file'])[0]}.png"
+    except ValidationError as e:
+        entry['error'] = '; '.join(e.messages)
+    except Exception as e:
+        entry['error'] = f"Unreadable image: {e}"
+    return entry
+
+class Command(BaseCommand):
+    help = 'Bulk import emotes from a directory or zip with a manifest (name, rarity, artist, file[, thumbnail])'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory or .zip containing the emote files.')
+        parser.add_argument('--manifest', default=None, help='Manifest path (JSON list or CSV). Defaults to manifest.json/manifest.csv inside the source.')
+        parser.add_argument('--workers', type=int, default=None, help='Validation processes (default: CPU count).')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Emotes inserted per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; write nothing.')
+
+    def handle(self, *args, **options):
+        reader = self.open_source(options['source'])
+        rows = self.load_manifest(reader, options['manifest'])
+        if not rows:
+            raise CommandError("Manifest is empty.")
+
+        report = []  # (file, status, message)
+        entries = self.prepare_entries(rows, reader, report)
+
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            validated = list(pool.map(validate_entry, entries, chunksize=8))
+
+        valid = []
+        for entry in validated:
+            if entry.get('error'):
+                report.append((entry['file'], 'error', entry['error']))
+            else:
+                valid.append(entry)
+
+        created = []
+        if not options['dry_run']:
+            chunk_size = options['chunk_size']
+            for start in range(0, len(valid), chunk_size):
+                created += self.insert_chunk(valid[start:start + chunk_size], report)
+            invalidate_matcher()  # bulk_create skips the post_save receivers
+            bump_catalog_version()
+            # One merged fan-out instead of assign_new_emote per row
+            granted = assign_special_emotes(created)
+            self.stdout.write(f"Granted special emotes to {granted} user(s).")
+        else:
+            report += [(entry['file'], 'ok', 'valid (dry run)') for entry in valid]
+
+        for file_name, status, message in report:
+            line = f"{file_name}: {message}"
+            self.stdout.write(self.style.SUCCESS(line) if status == 'ok' else self.style.ERROR(line))
+        errors = sum(1 for _, status, _ in report if status != 'ok')
+        self.stdout.write(self.style.SUCCESS(f"Imported {len(created)} emote(s), {errors} error(s)."))
+
+    def open_source(self, source):
+        """ Return a callable reading a relative path from the directory or zip. """
+        if os.path.isdir(source):
+            def read(name):
+                with open(os.path.join(source, name), 'rb') as f:
+                    return f.read()
+            read.names = {
+                os.path.relpath(os.path.join(root, f), source).replace(os.sep, '/')
+                for root, _, files in os.walk(source) for f in files
+            }
+            return read
+        if zipfile.is_zipfile(source):
+            archive = zipfile.ZipFile(source)
+            def read(name):
+                return archive.read(name)
+            read.names = set(archive.namelist())
+            return read
+        raise CommandError(f"{source} is neither a directory nor a zip file.")
+
+    def load_manifest(self, reader, manifest_path):
+        if manifest_path:
+            with open(manifest_path, 'rb') as f:
+                raw, name = f.read(), manifest_path
+        else:
+            name = next((n for n in MANIFEST_NAMES if n in reader.names), None)
+            if not name:
+                raise CommandError("No manifest.json or manifest.csv found in source.")
+            raw = reader(name)
+        text = raw.decode('utf-8-sig')
+        if name.endswith('.json'):
+            return json.loads(text)
+        return list(csv.DictReader(io.StringIO(text)))
+
+    def prepare_entries(self, rows, reader, report):
+        """ Check manifest fields cheaply in-process and attach file bytes. """
+        valid_rarities = dict(Emote.RARITY_CHOICES)
+        existing = set(Emote.objects.filter(name__in=[r.get('name') for r in rows]).values_list('name', flat=True))
+        seen = set()
+        entries = []
+        for row in rows:
+            file_name = row.get('file') or ''
+            name = (row.get('name') or '').strip()
+            rarity = (row.get('rarity') or 'common').strip()
+            error = None
+            if not name or not file_name:
+                error = "Manifest row needs 'name' and 'file'."
+            elif len(f"ER:{name}") > 50:
+                error = "Chat display name exceeds 50 characters with 'ER:' prefix."
+            elif rarity not in valid_rarities:
+                error = f"Unknown rarity '{rarity}'."
+            elif name in existing or name in seen:
+                error = f"Emote '{name}' already exists."
+            elif file_name not in reader.names:
+                error = f"File '{file_name}' not found."
+            elif row.get('thumbnail') and row['thumbnail'] not in reader.names:
+                error = f"Thumbnail '{row['thumbnail']}' not found."
+            if error:
+                report.append((file_name or name, 'error', error))
+                continue
+            seen.add(name)
+            entry = {
+                'name': name,
+                'rarity': rarity,
+                'artist': (row.get('artist') or '').strip(),
+                'file': file_name,
+                'image': reader(file_name),
+            }
+            if row.get('thumbnail'):
+                entry['thumbnail_file'] = row['thumbnail']
+                entry['thumbnail'] = reader(row['thumbnail'])
+            entries.append(entry)
+        return entries
+
+    def insert_chunk(self, entries, report):
+        """ Store files and bulk_create one chunk of emotes in a single transaction. """
+        artists = {u.username: u for u in User.objects.filter(username__in={e['artist'] for e in entries if e['artist']})}
+        emotes = []
+        with transaction.atomic():
+            for entry in entries:
+                if entry['artist'] and entry['artist'] not in artists:
+                    report.append((entry['file'], 'error', f"Artist '{entry['artist']}' not found."))
+                    continue
+                emote = Emote(name=entry['name'], rarity=entry['rarity'], artist=artists.get(entry['artist']))
+                emote.clean()
+                emote.remaining_instances = emote.max_instances
+                emote.image.name = emote_media_storage.save(f"emotes/{os.path.basename(entry['file'])}", ContentFile(entry['image']))
+                if entry.get('thumbnail'):
+                    emote.thumbnail.name = emote_media_storage.save(f"emotes/thumbs/{os.path.basename(entry['thumbnail_file'])}", ContentFile(entry['thumbnail']))
+                emotes.append((entry, emote))
+            Emote.objects.bulk_create([emote for _, emote in emotes])
+            for entry, emote in emotes:
+                retain_media(emote.image.name)
+                retain_media(emote.thumbnail.name)
+                report.append((entry['file'], 'ok', f"created {emote.chat_display_name} ({emote.rarity})"))
+        return [emote for _, emote in emotes]
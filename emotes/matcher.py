@@ -0,0 +1,135 @@
+import json
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from django.core.cache import cache
+from django.db import transaction
+from users.models import User
+from .models import Emote
+
+TOKEN_RE = re.compile(r'(?<!\S)ER:\S+')
+VERSION_KEY = 'emotes:matcher_version'
+OWNERSHIP_CACHE_SIZE = 100000
+
+class ChatMatcher:
+    """
+    Finds 'ER:' emote tokens in chat messages.
+
+    A compiled regex locates token starts; each token is then matched against a hash
+    table of chat_display_name values bucketed by length, longest first, which gives
+    trie-style longest-prefix matching ("ER:pog!" -> ER:pog) at dict-lookup speed.
+    Ownership bitsets use dense per-matcher positions, so their size follows the catalog,
+    not the highest primary key.
+    """
+
+    def __init__(self, emotes):
+        self.ids = {name: emote_id for emote_id, name in emotes}
+        self.positions = {name: position for position, name in enumerate(sorted(self.ids, key=self.ids.get))}
+        self.lengths = sorted({len(name) for name in self.ids}, reverse=True)
+
+    def find(self, message):
+        """ Return [(chat_display_name, emote_id), ...] for every known token in a message. """
+        if 'ER:' not in message:
+            return []
+        ids = self.ids
+        found = []
+        for match in TOKEN_RE.finditer(message):
+            token = match.group()
+            size = len(token)
+            for length in self.lengths:
+                if length > size:
+                    continue
+                name = token[:length] if length < size else token
+                emote_id = ids.get(name)
+                if emote_id is None:
+                    continue
+                if length < size and (token[length].isalnum() or token[length] == '_'):
+                    continue  # 'ER:pog' inside 'ER:pogger' is not a match
+                found.append((name, emote_id))
+                break
+        return found
+
+    def bitset(self, emotes_dict):
+        """ Compact ownership bitset (bit N = owns the emote at position N) from a name->count dict. """
+        bits = 0
+        positions = self.positions
+        for name, count in emotes_dict.items():
+            position = positions.get(f"ER:{name}")
+            if position is not None and count > 0:
+                bits |= 1 << position
+        return bits
+
+    def match_batch(self, pairs, owned):
+        """
+        Match tokens and check ownership for many messages.
+        Args:
+            pairs (list): [(username, message), ...]
+            owned (dict): username -> ownership bitset
+        Returns:
+            list: [(username, [(chat_display_name, owns_it), ...]), ...] for messages containing emotes.
+        """
+        results = []
+        for username, message in pairs:
+            tokens = self.find(message)
+            if tokens:
+                bits = owned.get(username, 0)
+                results.append((username, [(name, bool(bits >> self.positions[name] & 1)) for name, _ in tokens]))
+        return results
+
+_lock = threading.Lock()
+_matcher = None
+_matcher_version = None
+_ownership = OrderedDict()  # username -> (date_updated, bitset)
+
+def matcher_version():
+    return cache.get_or_set(VERSION_KEY, lambda: uuid.uuid4().hex[:12], None)
+
+def invalidate_matcher():
+    """ Mark the matcher stale in every process sharing the cache, once the current transaction commits. """
+    # A fresh token rather than a counter, so a cache flush can never bring an old version back
+    transaction.on_commit(lambda: cache.set(VERSION_KEY, uuid.uuid4().hex[:12], None))
+
+def get_matcher():
+    """ Return the process-local matcher, rebuilding it in one query if an Emote changed. """
+    global _matcher, _matcher_version
+    version = matcher_version()
+    if _matcher is None or _matcher_version != version:
+        with _lock:
+            if _matcher is None or _matcher_version != version:
+                _matcher = ChatMatcher(Emote.objects.values_list('id', 'chat_display_name'))
+                _matcher_version = version
+                _ownership.clear()  # Bitsets depend on the name -> ID map
+    return _matcher
+
+def get_owned_bitsets(usernames, matcher):
+    """ Ownership bitsets for many users; only users whose row changed are re-parsed. """
+    usernames = set(usernames)
+    if not usernames:
+        return {}
+    stamps = dict(User.objects.filter(username__in=usernames).values_list('username', 'date_updated'))
+    stale = [u for u, stamp in stamps.items() if _ownership.get(u, (None,))[0] != stamp]
+    if stale:
+        for username, stamp, emotes_json in User.objects.filter(username__in=stale).values_list('username', 'date_updated', 'emotes'):
+            _ownership[username] = (stamp, matcher.bitset(json.loads(emotes_json)))
+    owned = {}
+    for username in stamps:
+        entry = _ownership.get(username)
+        if entry:
+            _ownership.move_to_end(username)
+            owned[username] = entry[1]
+    while len(_ownership) > OWNERSHIP_CACHE_SIZE:
+        _ownership.popitem(last=False)
+    return owned
+
+def match_chat(pairs):
+    """
+    Batch API for the chat bot: find 'ER:' tokens and whether each sender owns them.
+    Args:
+        pairs (list): [(username, message), ...]
+    Returns:
+        list: [(username, [(chat_display_name, owns_it), ...]), ...] for messages containing emotes.
+    """
+    matcher = get_matcher()
+    senders = {username for username, message in pairs if 'ER:' in message}
+    return matcher.match_batch(pairs, get_owned_bitsets(senders, matcher))
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import re
+from datetime import timedelta
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+HASHED_NAME_RE = re.compile(r'^[0-9a-f]{64}$')
+
+class ContentAddressedStorage(FileSystemStorage):
+    """ Store uploads under the SHA-256 of their content so identical files share one path. """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = self.content_hash(content)
+        name = self.hashed_name(name, digest)
+        if self.exists(name):
+            return name  # Same bytes already stored, reuse the existing file
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Hashed names are deterministic, so never append a random suffix
+        return name
+
+    @staticmethod
+    def content_hash(content):
+        """ Return the hex SHA-256 of a file without loading it into memory at once. """
+        sha = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            sha.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return sha.hexdigest()
+
+    @staticmethod
+    def hashed_name(name, digest):
+        """ Build 'emotes/ab/<digest>.png' from 'emotes/original.png'. """
+        directory = os.path.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], f"{digest}{ext}")
+
+emote_media_storage = ContentAddressedStorage()
+
+def get_emote_media_storage():
+    return emote_media_storage
+
+def is_content_addressed(name):
+    """ Whether a stored name was produced by ContentAddressedStorage (safe to cache forever). """
+    stem = os.path.splitext(os.path.basename(name or ''))[0]
+    return bool(HASHED_NAME_RE.match(stem))
+
+def retain_media(name):
+    """ Increment the reference count for a stored file, registering it on first use. """
+    if not name:
+        return
+    from .models import MediaBlob
+    stem = os.path.splitext(os.path.basename(name))[0]
+    blob, created = MediaBlob.objects.get_or_create(
+        path=name,
+        defaults={'sha256': stem if is_content_addressed(name) else '', 'ref_count': 1},
+    )
+    if not created:
+        MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+def release_media(name):
+    """ Decrement the reference count for a stored file. The file itself is removed by the GC. """
+    if not name:
+        return
+    from .models import MediaBlob
+    MediaBlob.objects.filter(path=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+def collect_orphaned_media(grace=timedelta(hours=1), dry_run=False, storage=None):
+    """
+    Delete stored files whose reference count dropped to zero.
+    Args:
+        grace (timedelta): Only collect blobs unreferenced for at least this long, so in-flight uploads survive.
+        dry_run (bool): Report what would be deleted without deleting anything.
+    Returns:
+        list: Paths that were (or would be) deleted.
+    """
+    from .models import MediaBlob
+    storage = storage or emote_media_storage
+    cutoff = timezone.now() - grace
+    deleted = []
+    with transaction.atomic():
+        orphans = MediaBlob.objects.select_for_update(skip_locked=True).filter(ref_count=0, updated_at__lt=cutoff)
+        for blob in orphans:
+            deleted.append(blob.path)
+            if dry_run:
+                continue
+            if storage.exists(blob.path):
+                storage.delete(blob.path)
+            blob.delete()
+    return deleted
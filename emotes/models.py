@@ -1,16 +1,22 @@
-from django.db import models, transaction
+from django.db import models
+from django.db.models import F
 from django.core.exceptions import ValidationError
-from PIL import Image
 import os
+import json
+from .media import get_emote_media_storage
+from emoterush.metrics import ALLOCATION_CONFLICTS
+from emoterush.search import postgres_indexes, trigram_index
 
 def validate_square_image(image):
     """ Ensure image is square. """
+    from PIL import Image  # Imaging loads on first upload, not with the models
     img = Image.open(image)
     if img.size[0] != img.size[1]:
         raise ValidationError("Emote image must square (width = height).")
     
 def validate_emote_format_and_size(image, is_thumbnail=False):
     """ Validate format, dimensions, file size, transparency, and frames. """
+    from PIL import Image
     img = Image.open(image)
     width, height = img.size
     file_size = image.size / 1024 # Size in KB
@@ -60,6 +66,8 @@ class Emote(models.Model):
         ('novelty', 'Novelty'),
     )
 
+    SPECIAL_RARITIES = ('pity', 'earlydays', 'developer', 'artist', 'founder')
+
     RARITY_CHANCES = {
         'pity': 0.0,
         'earlydays': 0.0,
@@ -95,16 +103,18 @@ class Emote(models.Model):
     from django.contrib.auth import get_user_model
     User = get_user_model()
 
-    name = models.CharField(max_length=47, help_text="User-friendly name without 'ER:' prefix (e.g., pity1)")
+    name = models.CharField(max_length=47, unique=True, help_text="User-friendly name without 'ER:' prefix (e.g., pity1)")
     chat_display_name = models.CharField(max_length=50, unique=True, help_text="Unique emote name with 'ER:' (e.g., ER:emote)", editable=False)
     rarity = models.CharField(max_length=20, choices=RARITY_CHOICES, default='common')
     image = models.ImageField(
         upload_to='emotes/',
+        storage=get_emote_media_storage,
         validators=[validate_square_image, validate_emote_format_and_size],
         help_text="PNG (still) or GIF (animated), 112x112px to 4096x4096px, ≤ 1MB. PNGs must be transparent, GIFs no more than 60 frames."
     )
     thumbnail = models.ImageField(
         upload_to='emotes/thumbs/',
+        storage=get_emote_media_storage,
         blank=True, null=True,
         validators=[validate_square_image, validate_thumbnail],
         help_text="Optional PNG thumbnail for GIFs (112x112px to 4096x4096px, ≤ 1MB). Defaults to first GIF frame."
@@ -123,6 +133,13 @@ class Emote(models.Model):
         help_text="Number of instances still available. 0 means unlimited for special emotes."
     )
 
+    class Meta:
+        indexes = postgres_indexes(
+            # Admin search (EmoteAdmin.search_fields)
+            trigram_index('name', 'idx_emote_name_trgm'),
+            trigram_index('chat_display_name', 'idx_emote_chat_name_trgm'),
+        )
+
     def clean(self):
         # Auto-prefix chat_display_name
         proposed_chat_name = f"ER:{self.name}"
@@ -144,7 +161,7 @@ class Emote(models.Model):
         return f"{self.name} ({self.rarity})"
     
     def is_special(self):
-        return self.rarity in ('pity', 'earlydays', 'developer', 'artist', 'founder')
+        return self.rarity in self.SPECIAL_RARITIES
     
     @property
     def roll_chance(self):
@@ -154,13 +171,70 @@ class Emote(models.Model):
     def max_instances(self):
         return self.RARITY_MAX_INSTANCES.get(self.rarity, 0)
     
-    @transaction.atomic
+    @classmethod
+    def allocate(cls, emote_id, rarity, count=1):
+        """ Take `count` instances with one conditional UPDATE, without loading the row. """
+        if rarity in cls.SPECIAL_RARITIES and cls.RARITY_MAX_INSTANCES.get(rarity, 0) == 0:
+            return True  # Unlimited
+        if cls.objects.filter(pk=emote_id, remaining_instances__gte=count).update(remaining_instances=F('remaining_instances') - count):
+            return True
+        ALLOCATION_CONFLICTS.inc(rarity)
+        return False
+
+    @classmethod
+    def release(cls, emote_id, rarity, count):
+        """ Return `count` revoked instances to the supply (the inverse of allocate). """
+        if rarity in cls.SPECIAL_RARITIES and cls.RARITY_MAX_INSTANCES.get(rarity, 0) == 0:
+            return  # Unlimited
+        cls.objects.filter(pk=emote_id).update(remaining_instances=F('remaining_instances') + count)
+
     def allocate_instance(self, count=1):
         """ Allocate instances and decrement remaining_instances. """
         if self.is_special() and self.remaining_instances == 0:
             return True
-        if self.remaining_instances < count:
+        if not Emote.allocate(self.pk, self.rarity, count):
             return False
         self.remaining_instances -= count
-        self.save(update_fields=['remaining_instances'])
-        return True
\ No newline at end of file
+        return True
+
+class MediaBlob(models.Model):
+    """ A content-addressed file in media storage and how many emote fields point at it. """
+    path = models.CharField(max_length=255, unique=True, help_text="Storage path, e.g., emotes/ab/<sha256>.png")
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True, help_text="Content hash (blank for legacy uploads)")
+    ref_count = models.PositiveIntegerField(default=0, help_text="Emote image/thumbnail fields referencing this file")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='idx_mediablob_orphans'),
+        ]
+
+    def __str__(self):
+        return f"{self.path} ({self.ref_count} refs)"
+
+class EmoteAtlas(models.Model):
+    """ A packed sprite sheet of emotes for overlays, keyed by owner (user or rarity). """
+    key = models.CharField(max_length=64, unique=True, help_text="Atlas identity, e.g., 'user:42' or 'rarity:mythic'")
+    version = models.CharField(max_length=40, help_text="Hash of the emotes packed into the sheet")
+    sheet = models.CharField(max_length=255, blank=True, help_text="Storage path of the sprite sheet PNG")
+    layout = models.TextField(default='{}', help_text="JSON of tile size, columns and cell index per chat_display_name")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_layout(self):
+        return json.loads(self.layout)
+
+    def set_layout(self, layout):
+        self.layout = json.dumps(layout)
+
+    def frames(self):
+        """ Pixel coordinates of each emote in the sheet. """
+        layout = self.get_layout()
+        tile, columns = layout.get('tile', 0), layout.get('columns', 1)
+        return {
+            name: {'x': (index % columns) * tile, 'y': (index // columns) * tile, 'w': tile, 'h': tile}
+            for name, index in layout.get('cells', {}).items()
+        }
+
+    def __str__(self):
+        return f"{self.key} ({self.version[:8]})"
@@ -1,6 +1,18 @@
+import json
 import random
+from collections import Counter
 from .models import Emote
+from .catalog import get_catalog
 from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models import F, Func, Q, QuerySet
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+from django.utils import timezone
+from analytics.events import RollEventBuffer, record_grants, record_roll
+from analytics.leaderboards import record_holdings
+from emoterush.metrics import ALLOCATION_CONFLICTS, ROLL_SECONDS, timed
+from users.inventory import invalidate_on_commit
 
 User = get_user_model()
 
@@ -14,26 +26,248 @@ def get_available_emotes():
             available[emote.rarity].append((emote, emote.remaining_instances))
     return available
 
-def roll_emote(user):
-    """ Roll an emote from available eoptions based on hardcoded chances. """
+def roll_emote(user, events=None):
+    """ Roll an emote from available eoptions based on hardcoded chances. Logged to `events` if given. """
+    unlocked = roll_emotes(user, 1, events=events)
+    return unlocked[0] if unlocked else None
+
+@timed(ROLL_SECONDS)
+@transaction.atomic
+def roll_emotes(user, count, events=None):
+    """
+    Roll `count` emotes at once, e.g., one per donated dollar. Each draw picks a rarity by
+    RARITY_CHANCES and an emote by remaining instances, as separate rolls would, but the batch
+    costs the same handful of queries however large it is: one supply read, one locking read and
+    one UPDATE of the emotes drawn, and one locked read and UPDATE of the inventory.
+    Returns:
+        list: Names of the emotes unlocked, in draw order; draws whose emote sold out meanwhile are dropped.
+    """
     available_emotes = get_available_emotes()
-    if not available_emotes:
-        return None
-    
     rollable_rarities = [r for r in Emote.RARITY_CHANCES.keys() if r in available_emotes]
-    if not rollable_rarities:
-        return None
-    
+    if count < 1 or not rollable_rarities:
+        return []
+
     weights = [Emote.RARITY_CHANCES[r] for r in rollable_rarities]
-    chosen_rarity = random.choices(rollable_rarities, weights=weights, k=1)[0]
-
-    emotes, remaining_counts = zip(*available_emotes[chosen_rarity])
-    chosen_emote = random.choices(emotes, weights=remaining_counts, k=1)[0]
-
-    emotes_dict = user.get_emotes()
-    old_count = emotes_dict.get(chosen_emote.name, 0)
-    user.add_emote(chosen_emote.name)
-    new_emotes_dict = user.get_emotes()
-    if new_emotes_dict.get(chosen_emote.name, 0) > old_count:
-        return chosen_emote.name
-    return None
\ No newline at end of file
+    remaining = {emote.pk: left for pairs in available_emotes.values() for emote, left in pairs}
+    drawn = []
+    for chosen_rarity in random.choices(rollable_rarities, weights=weights, k=count):
+        candidates = [(emote, remaining[emote.pk]) for emote, _ in available_emotes[chosen_rarity] if remaining[emote.pk] > 0]
+        if not candidates:
+            continue  # Earlier draws in this batch took the tier's last instances
+        emotes, remaining_counts = zip(*candidates)
+        chosen_emote = random.choices(emotes, weights=remaining_counts, k=1)[0]
+        remaining[chosen_emote.pk] -= 1
+        drawn.append(chosen_emote)
+
+    wanted = Counter(emote.pk for emote in drawn)
+    locked = dict(
+        Emote.objects.select_for_update().filter(pk__in=wanted).order_by('pk').values_list('pk', 'remaining_instances')
+    )
+    granted = {pk: min(n, locked.get(pk, 0)) for pk, n in wanted.items()}
+    Emote.objects.bulk_update(
+        [Emote(pk=pk, remaining_instances=locked[pk] - n) for pk, n in granted.items() if n], ['remaining_instances'],
+    )
+
+    unlocked = []
+    for emote in drawn:
+        if not granted[emote.pk]:
+            ALLOCATION_CONFLICTS.inc(emote.rarity)  # Sold out by a concurrent roll since the supply read
+            continue
+        granted[emote.pk] -= 1
+        record_roll(user, emote, 'roll', buffer=events)
+        unlocked.append(emote.name)
+    if unlocked:
+        def add(emotes_dict):
+            for name in unlocked:
+                emotes_dict[name] = emotes_dict.get(name, 0) + 1
+        user.update_emotes(add)  # Re-reads the locked row: `user` may be stale
+    return unlocked
+
+def save_inventories(users):
+    User.objects.bulk_update(users, ['emotes', 'inventory_version', 'date_updated'])
+    invalidate_on_commit(user.id for user in users)
+
+SPECIAL_ROLE_FIELDS = {
+    'artist': 'is_artist',
+    'developer': 'is_developer',
+    'founder': 'is_founder',
+}
+
+def assign_special_emotes(emotes, batch_size=1000):
+    """
+    Grant newly created special emotes to every eligible user in one pass.
+    Args:
+        emotes (iterable): New Emote instances; non-special rarities are ignored.
+        batch_size (int): Users read and written per batch.
+    Returns:
+        int: Number of users whose inventory changed.
+    """
+    by_rarity = {}
+    by_name = {}
+    for emote in emotes:
+        if emote.rarity == 'pity' or emote.rarity == 'earlydays' or emote.rarity in SPECIAL_ROLE_FIELDS:
+            by_rarity.setdefault(emote.rarity, []).append(emote.name)
+            by_name[emote.name] = emote
+    if not by_rarity:
+        return 0
+
+    early_user_ids = set()
+    if 'earlydays' in by_rarity:
+        early_user_ids = set(User.objects.order_by('date_created').values_list('id', flat=True)[:100])
+
+    users = User.objects.only('id', 'emotes', 'inventory_version', 'is_artist', 'is_developer', 'is_founder')
+    if 'pity' not in by_rarity:
+        eligible = Q(id__in=early_user_ids)
+        for rarity, role_field in SPECIAL_ROLE_FIELDS.items():
+            if rarity in by_rarity:
+                eligible |= Q(**{role_field: True})
+        users = users.filter(eligible)
+
+    now = timezone.now()
+    changed = []
+    updated = 0
+    with RollEventBuffer(kind='grant') as events:
+        for user in users.iterator(chunk_size=batch_size):
+            names = list(by_rarity.get('pity', []))
+            if user.id in early_user_ids:
+                names += by_rarity['earlydays']
+            for rarity, role_field in SPECIAL_ROLE_FIELDS.items():
+                if rarity in by_rarity and getattr(user, role_field):
+                    names += by_rarity[rarity]
+            emotes_dict = user.get_emotes()
+            missing = [name for name in names if emotes_dict.get(name, 0) < 1]
+            if not missing:
+                continue
+            for name in missing:
+                emotes_dict[name] = 1
+                events.add(user, by_name[name])
+            user.emotes = json.dumps(emotes_dict)
+            user.inventory_version = F('inventory_version') + 1  # Not the value read: a concurrent save may have bumped it
+            user.date_updated = now
+            changed.append(user)
+            if len(changed) >= batch_size:
+                save_inventories(changed)
+                updated += len(changed)
+                changed = []
+        if changed:
+            save_inventories(changed)
+            updated += len(changed)
+    return updated
+
+# Bulk grants edit the emotes JSON inside UPDATE statements, a chunk of users at a time,
+# instead of loading, rewriting and saving each user.
+
+class InventoryEdit(Func):
+    """ The `emotes` JSON with one emote set to `count`, or removed when `count` is None. """
+    output_field = models.TextField()
+
+    def __init__(self, name, count=None):
+        self.name = name
+        self.count = count
+        super().__init__(F('emotes'))
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.get_source_expressions()[0])
+        if self.count is None:
+            return f"(({sql})::jsonb - %s::text)::text", (*params, self.name)
+        return f"(({sql})::jsonb || jsonb_build_object(%s::text, %s))::text", (*params, self.name, self.count)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.get_source_expressions()[0])
+        path = '$.' + json.dumps(self.name)
+        if self.count is None:
+            return f"json_remove({sql}, %s)", (*params, path)
+        return f"json_set({sql}, %s, %s)", (*params, path, self.count)
+
+def held_count(name):
+    """ Expression for how many of emote `name` a user holds (NULL if none). """
+    return Cast(KeyTextTransform(name, Cast('emotes', models.JSONField())), models.IntegerField())
+
+def user_id_chunks(users, chunk_size):
+    """ Ascending lists of user IDs from a User queryset or an iterable of IDs. """
+    if isinstance(users, QuerySet):
+        ids = list(users.order_by('id').values_list('id', flat=True))
+    else:
+        ids = sorted(set(users))
+    for start in range(0, len(ids), chunk_size):
+        yield ids[start:start + chunk_size]
+
+def update_inventories(user_ids, emotes):
+    User.objects.filter(id__in=user_ids).update(
+        emotes=emotes, inventory_version=F('inventory_version') + 1, date_updated=timezone.now(),
+    )
+    invalidate_on_commit(user_ids)
+
+def grant_to_chunk(emote, user_ids):
+    """ Give one `emote` to each user in `user_ids` lacking it, taking the instances from its supply. """
+    lacking = list(
+        User.objects.filter(id__in=user_ids).alias(held=held_count(emote.name))
+        .filter(Q(held__isnull=True) | Q(held__lt=1)).select_for_update().values_list('id', flat=True)
+    )
+    if not lacking:
+        return 0
+    if not Emote.allocate(emote.id, emote.rarity, len(lacking)):
+        raise ValueError(f"Not enough {emote.name} left to grant {len(lacking)} more.")
+    update_inventories(lacking, InventoryEdit(emote.name, 1))
+    record_grants(User.objects.filter(id__in=lacking), emote)
+    record_holdings({user_id: {emote.rarity: 1} for user_id in lacking})
+    return len(lacking)
+
+def grant_emote(emote, users, chunk_size=5000):
+    """
+    Give one instance of `emote` to every user who lacks it.
+    Args:
+        emote (Emote or CatalogEmote): Emote to grant.
+        users (QuerySet or iterable): Users, or their IDs.
+        chunk_size (int): Users per transaction.
+    Returns:
+        int: Number of users granted the emote.
+    Raises:
+        ValueError: The emote's supply ran out; earlier chunks stay granted.
+    """
+    granted = 0
+    for user_ids in user_id_chunks(users, chunk_size):
+        with transaction.atomic():
+            granted += grant_to_chunk(emote, user_ids)
+    return granted
+
+def revoke_emote(emote, users, chunk_size=5000):
+    """
+    Remove `emote` from every user holding it and return the instances to its supply.
+    Returns:
+        tuple: (users changed, instances revoked).
+    """
+    changed = revoked = 0
+    for user_ids in user_id_chunks(users, chunk_size):
+        with transaction.atomic():
+            held = list(
+                User.objects.filter(id__in=user_ids).annotate(held=held_count(emote.name))
+                .filter(held__isnull=False).select_for_update().values_list('id', 'held')
+            )
+            if not held:
+                continue
+            ids = [user_id for user_id, _ in held]
+            count = sum(max(count, 0) for _, count in held)
+            update_inventories(ids, InventoryEdit(emote.name))
+            Emote.release(emote.id, emote.rarity, count)
+            record_holdings({user_id: {emote.rarity: -max(count, 0)} for user_id, count in held}, periods=('all',))
+        changed += len(ids)
+        revoked += count
+    return changed, revoked
+
+def set_role(users, rarity, value=True, chunk_size=5000):
+    """
+    Set or clear a role (see SPECIAL_ROLE_FIELDS) for many users; setting it also grants the role's emotes.
+    Clearing a role keeps the emotes, as in UserAdmin.
+    Returns:
+        tuple: (users whose role changed, emotes granted).
+    """
+    field = SPECIAL_ROLE_FIELDS[rarity]
+    role_emotes = get_catalog().by_rarity.get(rarity, []) if value else []
+    changed = granted = 0
+    for user_ids in user_id_chunks(users, chunk_size):
+        with transaction.atomic():
+            changed += User.objects.filter(id__in=user_ids).exclude(**{field: value}).update(**{field: value})
+            for emote in role_emotes:
+                granted += grant_to_chunk(emote, user_ids)
+    return changed, granted
@@ -1,50 +1,64 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from .models import Emote
-from users.models import User
+from .media import retain_media, release_media
+from .services import assign_special_emotes
+from .matcher import invalidate_matcher
+from .catalog import bump_catalog_version, clear_catalog
+from emoterush.metrics import SIGNAL_FANOUT_SECONDS
+
+MEDIA_FIELDS = ('image', 'thumbnail')
+
+@receiver(pre_save, sender=Emote)
+def remember_emote_media(sender, instance, update_fields=None, **kwargs):
+    """ Stash the stored media paths so post_save can adjust reference counts. """
+    instance._previous_media = None
+    if update_fields is not None and not set(MEDIA_FIELDS) & set(update_fields):
+        return  # e.g., allocate_instance only touches remaining_instances
+    instance._previous_media = {}
+    if instance.pk:
+        instance._previous_media = Emote.objects.filter(pk=instance.pk).values(*MEDIA_FIELDS).first() or {}
+
+@receiver(post_save, sender=Emote)
+def update_emote_media_refs(sender, instance, **kwargs):
+    """ Retain newly referenced media files and release replaced ones. """
+    previous = getattr(instance, '_previous_media', None)
+    if previous is None:
+        return
+    for field in MEDIA_FIELDS:
+        old_name = previous.get(field) or ''
+        new_name = getattr(instance, field).name or ''
+        if old_name != new_name:
+            retain_media(new_name)
+            release_media(old_name)
+
+@receiver(post_delete, sender=Emote)
+def release_emote_media(sender, instance, **kwargs):
+    """ Release media files of a deleted emote; the GC removes them once unreferenced. """
+    for field in MEDIA_FIELDS:
+        release_media(getattr(instance, field).name)
+
+@receiver(post_save, sender=Emote)
+@receiver(post_delete, sender=Emote)
+def refresh_chat_matcher(sender, instance, update_fields=None, **kwargs):
+    """ Rebuild the chat token matcher when emote names change (not on allocation saves). """
+    if update_fields is not None and 'chat_display_name' not in update_fields:
+        return
+    invalidate_matcher()
+
+@receiver(post_save, sender=Emote)
+@receiver(post_delete, sender=Emote)
+def refresh_catalog_version(sender, instance, update_fields=None, **kwargs):
+    """ Invalidate the catalog (local copy and shared stamp) on any change except allocation-only saves. """
+    if update_fields is not None and set(update_fields) <= {'remaining_instances'}:
+        return
+    clear_catalog()
+    bump_catalog_version()
 
 @receiver(post_save, sender=Emote)
 def assign_new_emote(sender, instance, created, **kwargs):
     """ Assign new emote to eligible users based on its rarity. """
     if not created:
         return # Only trigger on creation, not updates
-    
-    # Pre-fetch first 100 users for earlydays (shared across logic if needed)
-    early_users = User.objects.order_by('date_created')[:100]
-    early_user_ids = {user.id for user in early_users}
-
-    # Assign pity emotes to all users
-    if instance.rarity == 'pity':
-        users = User.objects.all()
-        for user in users:
-            emotes_dict = user.get_emotes()
-            if instance.name not in emotes_dict or emotes_dict[instance.name] < 1:
-                if instance.allocate_instance():
-                    emotes_dict[instance.name] = 1
-                    user.set_emotes(emotes_dict)
-    
-    # Assign earlydays emotes to first 100 users
-    if instance.rarity == 'earlydays':
-        users = User.objects.filter(id__in=early_user_ids)  # Use pre-fetched IDs
-        for user in users:
-            emotes_dict = user.get_emotes()
-            if instance.name not in emotes_dict or emotes_dict[instance.name] < 1:
-                if instance.allocate_instance():
-                    emotes_dict[instance.name] = 1
-                    user.set_emotes(emotes_dict)
-    
-    # Assign role-based emotes (artist, developer, founder)
-    role_field_map = {
-        'artist': 'is_artist',
-        'developer':'is_developer',
-        'founder': 'is_founder',
-    }
-    role_field = role_field_map.get(instance.rarity)
-    if role_field:
-        users = User.objects.filter(**{role_field: True})
-        for user in users:
-            emotes_dict = user.get_emotes()
-            if instance.name not in emotes_dict or emotes_dict[instance.name] < 1:
-                if instance.allocate_instance():
-                    emotes_dict[instance.name] = 1
-                    user.set_emotes(emotes_dict)
\ No newline at end of file
+    with SIGNAL_FANOUT_SECONDS.time('assign_new_emote'):
+        assign_special_emotes([instance])
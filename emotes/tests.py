@@ -1,3 +1,206 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from users.models import User
+from .atlas import build_atlas, inventory_version
+from .catalog import VERSION_KEY, catalog_version, clear_catalog, get_catalog
+from .matcher import ChatMatcher, match_chat
+from .media import collect_orphaned_media, emote_media_storage, is_content_addressed
+from .models import Emote, EmoteAtlas, MediaBlob
 
-# Create your tests here.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CatalogTests(TestCase):
+    """ The per-process catalog and how often it looks at the shared version stamp. """
+
+    @classmethod
+    def setUpTestData(cls):
+        Emote.objects.bulk_create([
+            Emote(name=f"common{i}", chat_display_name=f"ER:common{i}", rarity='common', remaining_instances=1000)
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        clear_catalog()
+
+    @override_settings(EMOTE_CATALOG_VERSION_TTL=60)
+    def test_version_is_read_once_per_ttl(self):
+        catalog = get_catalog()
+        cache.set(VERSION_KEY, 'bumped-elsewhere')
+        with self.assertNumQueries(0):
+            self.assertIs(get_catalog(), catalog)
+        self.assertNotEqual(catalog_version(), 'bumped-elsewhere')
+
+    @override_settings(EMOTE_CATALOG_VERSION_TTL=0)
+    def test_other_process_edit_reloads(self):
+        catalog = get_catalog()
+        Emote.objects.filter(name='common0').update(rarity='rare')
+        cache.set(VERSION_KEY, 'bumped-elsewhere')
+        self.assertEqual(get_catalog().by_name['common0'].rarity, 'rare')
+        self.assertIsNot(get_catalog(), catalog)
+
+    @override_settings(EMOTE_CATALOG_VERSION_TTL=60)
+    def test_own_edit_is_seen_at_once(self):
+        get_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            emote = Emote.objects.get(name='common1')
+            emote.rarity = 'rare'
+            emote.save()
+        self.assertEqual(get_catalog().by_name['common1'].rarity, 'rare')
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AtlasTests(TestCase):
+    """ Atlas views serve the last built sheet and leave rebuilding to the background. """
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def test_view_schedules_instead_of_building(self):
+        with mock.patch('emotes.atlas.schedule_build') as schedule:
+            response = self.client.get('/emotes/atlas/rarity/mythic/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '2')
+        schedule.assert_called_once_with('rarity:mythic', [])
+        self.assertFalse(EmoteAtlas.objects.exists())
+
+    def test_last_built_atlas_is_served(self):
+        atlas = build_atlas('rarity:mythic', [])
+        self.assertEqual(atlas.version, inventory_version([]))
+        with mock.patch('emotes.atlas.schedule_build') as schedule:
+            response = self.client.get('/emotes/atlas/rarity/mythic/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], atlas.version)
+        schedule.assert_not_called()
+
+    def test_second_build_finds_work_done(self):
+        first = build_atlas('rarity:mythic', [])
+        with mock.patch('emotes.atlas.write_sheet') as write:
+            self.assertEqual(build_atlas('rarity:mythic', []), first)
+        write.assert_not_called()
+        self.assertEqual(EmoteAtlas.objects.count(), 1)
+
+@override_settings(CACHES=LOCAL_CACHE)
+class MediaTests(TestCase):
+    """ Identical uploads share one file, counted by the emote fields that use it and collected once unused. """
+
+    def setUp(self):
+        cache.clear()
+        clear_catalog()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), emote_media_storage.location)
+            for root, _, names in os.walk(emote_media_storage.location) for name in names
+        )
+
+    def emote(self, name, image):
+        emote = Emote(name=name, chat_display_name=f"ER:{name}", rarity='common', remaining_instances=1000)
+        emote.image.name = image
+        emote.save()
+        return emote
+
+    def ref_count(self, path):
+        return MediaBlob.objects.get(path=path).ref_count
+
+    def test_identical_content_is_stored_once(self):
+        first = emote_media_storage.save('emotes/first.PNG', ContentFile(b'same bytes'))
+        second = emote_media_storage.save('emotes/second.png', ContentFile(b'same bytes'))
+        other = emote_media_storage.save('emotes/first.png', ContentFile(b'other bytes'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(first.startswith('emotes/') and first.endswith('.png'))
+        self.assertTrue(is_content_addressed(first))
+        self.assertEqual(self.stored_files(), sorted([first, other]))
+
+    def test_refs_follow_emote_fields(self):
+        shared = emote_media_storage.save('emotes/a.png', ContentFile(b'shared'))
+        replacement = emote_media_storage.save('emotes/b.png', ContentFile(b'replacement'))
+        a = self.emote('a', shared)
+        self.emote('b', shared)
+        self.assertEqual(self.ref_count(shared), 2)
+
+        a.image.name = replacement
+        a.save()
+        self.assertEqual((self.ref_count(shared), self.ref_count(replacement)), (1, 1))
+        a.remaining_instances = 5
+        a.save(update_fields=['remaining_instances'])  # Not a media change
+        self.assertEqual(self.ref_count(replacement), 1)
+        a.delete()
+        self.assertEqual(self.ref_count(replacement), 0)
+
+    def test_gc_removes_only_old_orphans(self):
+        kept = emote_media_storage.save('emotes/kept.png', ContentFile(b'kept'))
+        orphan = emote_media_storage.save('emotes/orphan.png', ContentFile(b'orphan'))
+        recent = emote_media_storage.save('emotes/recent.png', ContentFile(b'recent'))
+        emote = self.emote('kept', kept)
+        self.emote('orphan', orphan).delete()
+        self.emote('recent', recent).delete()
+        past_grace = timezone.now() - timedelta(hours=2)
+        MediaBlob.objects.filter(path__in=[kept, orphan]).update(updated_at=past_grace)
+
+        self.assertEqual(collect_orphaned_media(dry_run=True), [orphan])
+        self.assertTrue(emote_media_storage.exists(orphan))
+        self.assertEqual(collect_orphaned_media(), [orphan])
+        self.assertFalse(emote_media_storage.exists(orphan))
+        self.assertEqual(sorted(MediaBlob.objects.values_list('path', flat=True)), sorted([kept, recent]))
+        self.assertEqual(self.stored_files(), sorted([kept, recent]))
+        self.assertEqual(self.ref_count(emote.image.name), 1)
+
+class ChatMatcherTests(SimpleTestCase):
+    """ Token matching and ownership bits on dense per-matcher positions. """
+
+    def setUp(self):
+        self.matcher = ChatMatcher([(900001, 'ER:pog'), (5, 'ER:pogger'), (700000, 'ER:kek')])
+
+    def test_bit_positions_follow_the_catalog_not_ids(self):
+        self.assertEqual(self.matcher.positions, {'ER:pogger': 0, 'ER:kek': 1, 'ER:pog': 2})
+        self.assertEqual(self.matcher.bitset({'pog': 2, 'kek': 0, 'gone': 1}), 0b100)
+        self.assertLess(self.matcher.bitset({'pog': 1, 'pogger': 1, 'kek': 1}), 1 << 3)
+
+    def test_batch_checks_ownership_per_token(self):
+        owned = {'ann': self.matcher.bitset({'pog': 1})}
+        results = self.matcher.match_batch([
+            ('ann', 'ER:pog! ER:pogger ER:pogs'),
+            ('bob', 'ER:kek'),
+            ('cat', 'no emotes here'),
+        ], owned)
+        self.assertEqual(results, [
+            ('ann', [('ER:pog', True), ('ER:pogger', False)]),
+            ('bob', [('ER:kek', False)]),
+        ])
+
+@override_settings(CACHES=LOCAL_CACHE)
+class MatchChatTests(TestCase):
+    """ Cached bitsets are re-parsed once the user's inventory changes. """
+
+    @classmethod
+    def setUpTestData(cls):
+        Emote.objects.bulk_create([
+            Emote(name=name, chat_display_name=f"ER:{name}", rarity='common', remaining_instances=1000) for name in ('pog', 'kek')
+        ])
+        cls.user = User.objects.create(username='ann', email='ann@example.com', twitch_id='1', twitch_channel_url='https://twitch.tv/ann')
+
+    def setUp(self):
+        cache.clear()  # New matcher version, so the matcher and its bitsets are rebuilt
+        clear_catalog()
+
+    def test_inventory_change_is_seen(self):
+        self.user.set_emotes({'pog': 1})
+        self.assertEqual(match_chat([('ann', 'ER:pog ER:kek')]), [('ann', [('ER:pog', True), ('ER:kek', False)])])
+        with self.assertNumQueries(1):  # Stamps only; the bitset is reused
+            match_chat([('ann', 'ER:kek')])
+        self.user.set_emotes({'kek': 2})
+        self.assertEqual(match_chat([('ann', 'ER:pog ER:kek')]), [('ann', [('ER:pog', False), ('ER:kek', True)])])
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'emotes'
+
+urlpatterns = [
+    path('atlas/user/<str:username>/', views.user_atlas, name='user_atlas'),
+    path('atlas/rarity/<str:rarity>/', views.rarity_atlas, name='rarity_atlas'),
+]
@@ -1,3 +1,89 @@
-from django.shortcuts import render
+import mimetypes
+import os
+import posixpath
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
+from django.views.static import was_modified_since
+from users.models import User
+from .atlas import current_rarity_atlas, current_user_atlas
+from .media import is_content_addressed
+from .models import Emote
 
-# Create your views here.
+def media_body(name):
+    """ Response carrying a stored file, sent by the front-end server when EMOTE_MEDIA_SENDFILE is set. """
+    if settings.EMOTE_MEDIA_SENDFILE is None:
+        return FileResponse(default_storage.open(name, 'rb'))
+    content_type, encoding = mimetypes.guess_type(name)
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if settings.EMOTE_MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = f"{settings.EMOTE_MEDIA_ACCEL_PREFIX}{name}"
+    else:
+        response['X-Sendfile'] = default_storage.path(name)
+    return response
+
+@require_GET
+def serve_media(request, path):
+    """ Serve emote media; content-addressed files get a strong ETag and are cached forever. """
+    name = posixpath.normpath(f"emotes/{path}")
+    if not name.startswith('emotes/') or not default_storage.exists(name):
+        raise Http404("Media not found")  # Checked before any 304, so a deleted file is never revalidated
+
+    if not is_content_addressed(name):
+        mtime = default_storage.get_modified_time(name).timestamp()
+        if not was_modified_since(request.headers.get('If-Modified-Since'), mtime):
+            response = HttpResponseNotModified()
+        else:
+            response = media_body(name)
+        response['Last-Modified'] = http_date(mtime)
+        patch_cache_control(response, public=True, max_age=settings.EMOTE_MEDIA_LEGACY_MAX_AGE)
+        return response
+
+    # The file name is the SHA-256 of its bytes, so it doubles as the ETag
+    etag = f'"{os.path.splitext(os.path.basename(name))[0]}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = media_body(name)
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.EMOTE_MEDIA_MAX_AGE, immutable=True)
+    return response
+
+def atlas_response(request, atlas):
+    """ JSON coordinate map for an atlas; the sheet URL is content-addressed and cached forever. """
+    if atlas is None:  # First build still running in the background
+        response = JsonResponse({'status': 'building'}, status=202)
+        response['Retry-After'] = '2'
+        patch_cache_control(response, no_store=True)
+        return response
+    etag = f'"{atlas.version}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse({
+            'version': atlas.version,
+            'sheet': f"{settings.MEDIA_URL}{atlas.sheet}" if atlas.sheet else None,
+            'frames': atlas.frames(),
+        })
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+@require_GET
+def user_atlas(request, username):
+    """ Sprite atlas of everything a user owns. """
+    user = get_object_or_404(User, username=username.lstrip('@'))
+    return atlas_response(request, current_user_atlas(user))
+
+@require_GET
+def rarity_atlas(request, rarity):
+    """ Sprite atlas of a whole rarity tier. """
+    if rarity not in dict(Emote.RARITY_CHOICES):
+        raise Http404("Unknown rarity")
+    return atlas_response(request, current_rarity_atlas(rarity))
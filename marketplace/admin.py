@@ -1,3 +1,36 @@
 from django.contrib import admin
+from .models import Listing, Order, OrderEvent, Trade
 
-# Register your models here.
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """ Order state is owned by the matching process; edits here would desync the books. """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(Order)
+class OrderAdmin(ReadOnlyAdmin):
+    list_display = ('id', 'user', 'emote', 'side', 'price', 'quantity', 'remaining', 'status', 'created_at')
+    list_filter = ('side', 'status')
+    list_select_related = ('user', 'emote')
+    raw_id_fields = ('user', 'emote')
+
+@admin.register(OrderEvent)
+class OrderEventAdmin(ReadOnlyAdmin):
+    list_display = ('sequence', 'order', 'kind', 'processed', 'created_at')
+    list_filter = ('kind', 'processed')
+    raw_id_fields = ('order',)
+
+@admin.register(Trade)
+class TradeAdmin(ReadOnlyAdmin):
+    list_display = ('id', 'emote', 'buyer', 'seller', 'price', 'quantity', 'timestamp')
+    list_select_related = ('emote', 'buyer', 'seller')
+    raw_id_fields = ('emote', 'buy_order', 'sell_order', 'buyer', 'seller', 'event')
+
+@admin.register(Listing)
+class ListingAdmin(ReadOnlyAdmin):
+    list_display = ('order', 'emote', 'seller', 'rarity', 'price', 'quantity', 'created_at')
+    list_filter = ('rarity',)
+    list_select_related = ('order', 'emote', 'seller')
@@ -0,0 +1,113 @@
+"""
+In-memory price-time-priority order books.
+
+Pure Python with no database access: prices are integer cents, each side of a book is a
+heap keyed on (price, sequence), and cancelled orders are dropped lazily when they reach
+the top. Fills execute at the resting (maker) order's price.
+"""
+import heapq
+from collections import namedtuple
+
+Fill = namedtuple('Fill', ['taker', 'maker', 'price', 'quantity'])
+
+class BookOrder:
+    __slots__ = ('id', 'user_id', 'emote_id', 'side', 'price', 'remaining', 'sequence', 'live')
+
+    def __init__(self, id, user_id, emote_id, side, price, remaining, sequence):
+        self.id = id
+        self.user_id = user_id
+        self.emote_id = emote_id
+        self.side = side
+        self.price = price  # Cents
+        self.remaining = remaining
+        self.sequence = sequence
+        self.live = True  # False once cancelled; `remaining` then keeps the unfilled quantity
+
+    def __repr__(self):
+        return f"BookOrder(#{self.id} {self.side} {self.remaining} @ {self.price}c)"
+
+class OrderBook:
+    """ Bids and asks for one emote. """
+
+    def __init__(self):
+        self.bids = []  # (-price, sequence, order): highest price first
+        self.asks = []  # (price, sequence, order): lowest price first
+
+    def rest(self, order):
+        if order.side == 'buy':
+            heapq.heappush(self.bids, (-order.price, order.sequence, order))
+        else:
+            heapq.heappush(self.asks, (order.price, order.sequence, order))
+
+    def best(self, heap):
+        while heap and not (heap[0][2].live and heap[0][2].remaining):
+            heapq.heappop(heap)  # Filled or cancelled
+        return heap[0][2] if heap else None
+
+    def match(self, taker):
+        """
+        Fill `taker` against the opposite side, then rest any remainder. Returns fills; a fill
+        with quantity 0 means the maker was the taker's own order and has been cancelled.
+        """
+        fills = []
+        heap = self.asks if taker.side == 'buy' else self.bids
+        while taker.remaining:
+            maker = self.best(heap)
+            if maker is None or (maker.price > taker.price if taker.side == 'buy' else maker.price < taker.price):
+                break
+            if maker.user_id == taker.user_id:
+                heapq.heappop(heap)  # Cancel the resting order rather than trade with yourself
+                maker.live = False
+                fills.append(Fill(taker, maker, maker.price, 0))
+                continue
+            quantity = min(taker.remaining, maker.remaining)
+            taker.remaining -= quantity
+            maker.remaining -= quantity
+            fills.append(Fill(taker, maker, maker.price, quantity))
+        if taker.remaining:
+            self.rest(taker)
+        return fills
+
+    def depth(self, levels=10):
+        """ Aggregated (price, quantity) levels per side, best first. """
+        def aggregate(heap, reverse):
+            totals = {}
+            for _, _, order in heap:
+                if order.live and order.remaining:
+                    totals[order.price] = totals.get(order.price, 0) + order.remaining
+            return sorted(totals.items(), reverse=reverse)[:levels]
+        return {'bids': aggregate(self.bids, True), 'asks': aggregate(self.asks, False)}
+
+class MatchingEngine:
+    """ One OrderBook per emote plus an index of live orders for cancellation. """
+
+    def __init__(self):
+        self.books = {}
+        self.orders = {}
+
+    def book(self, emote_id):
+        book = self.books.get(emote_id)
+        if book is None:
+            book = self.books[emote_id] = OrderBook()
+        return book
+
+    def rest(self, order):
+        """ Load an already-matched resting order (used when rebuilding). """
+        self.orders[order.id] = order
+        self.book(order.emote_id).rest(order)
+
+    def submit(self, order):
+        fills = self.book(order.emote_id).match(order)
+        for fill in fills:
+            if not (fill.maker.live and fill.maker.remaining):
+                self.orders.pop(fill.maker.id, None)
+        if order.remaining:
+            self.orders[order.id] = order
+        return fills
+
+    def cancel(self, order_id):
+        """ Returns the cancelled order, or None if it is no longer live. """
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            order.live = False
+        return order
@@ -0,0 +1,157 @@
+"""
+Listing search with keyset (cursor) pagination and cached per-rarity floor prices.
+
+Pages are addressed by the last row's (sort value, order id) rather than an OFFSET, so every
+page is an index range scan regardless of depth. The matching process writes Listing rows and
+refreshes the floor price cache for the rarities it touched; an emote's rarity change is copied
+to its listings by marketplace.signals.
+"""
+import base64
+import json
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Min, Q
+from django.utils.dateparse import parse_datetime
+from .models import Listing, Order
+
+FLOOR_CACHE_KEY = 'marketplace:floor_prices'
+SORTS = {
+    'price': ('price', 'order_id'),
+    '-price': ('-price', '-order_id'),
+    'newest': ('-created_at', '-order_id'),
+}
+
+def encode_cursor(sort, listing):
+    value = listing.created_at.isoformat() if sort == 'newest' else str(listing.price)
+    return base64.urlsafe_b64encode(json.dumps([value, listing.order_id]).encode()).decode()
+
+def decode_cursor(sort, cursor):
+    """ Returns (value, order_id); raises ValueError on a malformed cursor. """
+    try:
+        value, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        value = parse_datetime(value) if sort == 'newest' else Decimal(value)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if value is None or not isinstance(order_id, int):
+        raise ValueError("Invalid cursor")
+    return value, order_id
+
+def after_cursor(sort, value, order_id):
+    """ Rows strictly after (value, order_id) in the given sort order. """
+    field = 'created_at' if sort == 'newest' else 'price'
+    if sort == 'price':
+        return Q(**{f'{field}__gt': value}) | Q(**{field: value, 'order_id__gt': order_id})
+    return Q(**{f'{field}__lt': value}) | Q(**{field: value, 'order_id__lt': order_id})
+
+def search_listings(rarity=None, emote_id=None, min_price=None, max_price=None, listed_after=None,
+                    sort='price', cursor=None, limit=50):
+    """
+    One page of listings.
+    Returns:
+        tuple: (list of Listing, next cursor or None).
+    Raises:
+        ValueError: On an unknown sort or malformed cursor.
+    """
+    if sort not in SORTS:
+        raise ValueError(f"Sort must be one of {', '.join(SORTS)}")
+    listings = Listing.objects.all()
+    if rarity:
+        listings = listings.filter(rarity=rarity)
+    if emote_id:
+        listings = listings.filter(emote_id=emote_id)
+    if min_price is not None:
+        listings = listings.filter(price__gte=min_price)
+    if max_price is not None:
+        listings = listings.filter(price__lte=max_price)
+    if listed_after:
+        listings = listings.filter(created_at__gt=listed_after)
+    if cursor:
+        listings = listings.filter(after_cursor(sort, *decode_cursor(sort, cursor)))
+
+    page = list(listings.select_related('emote').order_by(*SORTS[sort])[:limit + 1])
+    next_cursor = encode_cursor(sort, page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+def cheapest_per_emote(emote_ids=None, rarity=None):
+    """ {emote_id: (floor price, listings)} from the (emote, price) index. """
+    listings = Listing.objects.all()
+    if emote_ids is not None:
+        listings = listings.filter(emote_id__in=emote_ids)
+    if rarity:
+        listings = listings.filter(rarity=rarity)
+    rows = listings.values('emote_id').annotate(floor=Min('price'), listings=Count('order_id'))
+    return {row['emote_id']: (row['floor'], row['listings']) for row in rows}
+
+def floor_prices(listings):
+    rows = listings.values('rarity').annotate(floor=Min('price'), listings=Count('order_id'))
+    return {row['rarity']: {'floor': f"{row['floor']:.2f}", 'listings': row['listings']} for row in rows}
+
+def refresh_floor_prices(rarities=None):
+    """ Recompute floors (all, or just `rarities`) and publish them to the shared cache. """
+    if rarities is None:
+        floors = floor_prices(Listing.objects.all())
+    else:
+        floors = {rarity: floor for rarity, floor in get_floor_prices().items() if rarity not in rarities}
+        floors.update(floor_prices(Listing.objects.filter(rarity__in=rarities)))
+    cache.set(FLOOR_CACHE_KEY, floors, None)
+    return floors
+
+def get_floor_prices():
+    floors = cache.get(FLOOR_CACHE_KEY)
+    if floors is None:
+        floors = floor_prices(Listing.objects.using(DEFAULT_DB_ALIAS))  # Cached until the next refresh, so never replica-lagged
+        cache.set(FLOOR_CACHE_KEY, floors, None)
+    return floors
+
+def sync_listings(book_orders, emote_rarities):
+    """
+    Mirror changed sell orders into Listing: upsert live ones, delete the rest.
+    Args:
+        book_orders (iterable): BookOrders touched by a settled batch.
+        emote_rarities (dict): emote_id -> rarity for every emote in `book_orders`.
+    Returns:
+        set: Rarities whose listings changed.
+    """
+    live, gone, rarities = [], [], set()
+    for book_order in book_orders:
+        if book_order.side != 'sell':
+            continue
+        rarities.add(emote_rarities[book_order.emote_id])
+        if book_order.live and book_order.remaining:
+            live.append(book_order)
+        else:
+            gone.append(book_order.id)
+    if gone:
+        Listing.objects.filter(order_id__in=gone).delete()
+    if live:
+        orders = Order.objects.in_bulk([o.id for o in live])
+        Listing.objects.bulk_create(
+            [
+                Listing(
+                    order_id=o.id, emote_id=o.emote_id, seller_id=o.user_id, rarity=emote_rarities[o.emote_id],
+                    price=orders[o.id].price, quantity=o.remaining, created_at=orders[o.id].created_at,
+                )
+                for o in live
+            ],
+            update_conflicts=True, unique_fields=['order'], update_fields=['quantity', 'rarity'],
+        )
+    return rarities
+
+@transaction.atomic
+def rebuild_listings():
+    """ Replace every Listing from the open sell orders. Returns the number of listings. """
+    Listing.objects.all().delete()
+    orders = Order.objects.filter(side='sell', status='open', remaining__gt=0).select_related('emote')
+    Listing.objects.bulk_create(
+        (
+            Listing(
+                order_id=order.id, emote_id=order.emote_id, seller_id=order.user_id, rarity=order.emote.rarity,
+                price=order.price, quantity=order.remaining, created_at=order.created_at,
+            )
+            for order in orders.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+    refresh_floor_prices()
+    return Listing.objects.count()
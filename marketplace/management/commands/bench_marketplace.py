@@ -0,0 +1,81 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from emotes.models import Emote
+from marketplace.engine import BookOrder, MatchingEngine
+from marketplace.models import Order, OrderEvent
+from marketplace.services import MarketProcessor, from_cents
+from users.models import User
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Benchmark order matching in memory and end to end with settlement (changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=20000, help='Orders submitted.')
+        parser.add_argument('--emotes', type=int, default=20, help='Distinct emotes traded.')
+        parser.add_argument('--traders', type=int, default=50, help='Distinct users trading.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Events settled per transaction.')
+        parser.add_argument('--engine-only', action='store_true', help='Skip the database round.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        flow = [
+            (rng.randrange(options['traders']), rng.randrange(options['emotes']),
+             'buy' if rng.random() < 0.5 else 'sell', rng.randint(95, 105), rng.randint(1, 5))
+            for _ in range(options['orders'])
+        ]
+
+        engine = MatchingEngine()
+        started = time.perf_counter()
+        fills = 0
+        for sequence, (trader, emote, side, price, quantity) in enumerate(flow):
+            fills += sum(1 for fill in engine.submit(BookOrder(sequence, trader, emote, side, price, quantity, sequence)) if fill.quantity)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Engine:       {len(flow) / elapsed:,.0f} orders/s, {fills / elapsed:,.0f} fills/s ({fills:,} fills)")
+
+        if not options['engine_only']:
+            self.run_settled(flow, options['batch_size'], options['traders'], options['emotes'])
+
+    def run_settled(self, flow, batch_size, traders, emote_count):
+        """ Log the same flow to the WAL, then match and settle it in batches inside a rolled-back transaction. """
+        users = list(User.objects.order_by('id')[:traders])
+        emotes = list(Emote.objects.exclude(rarity__in=('pity', 'earlydays', 'developer', 'artist', 'founder')).order_by('id')[:emote_count])
+        if not users or not emotes:
+            raise CommandError("Need at least one user and one non-special emote; use --engine-only otherwise.")
+        processor = MarketProcessor()
+        if not processor.lock():
+            raise CommandError("Stop run_marketplace first: the benchmark would apply its pending events too.")
+        try:
+            with transaction.atomic():
+                now = timezone.now()
+                orders = Order.objects.bulk_create([
+                    Order(
+                        user=users[trader % len(users)], emote=emotes[emote % len(emotes)], side=side,
+                        price=from_cents(price), quantity=quantity, remaining=quantity, created_at=now,
+                    )
+                    for trader, emote, side, price, quantity in flow
+                ])
+                OrderEvent.objects.bulk_create([OrderEvent(order=order, kind='place') for order in orders])
+
+                started = time.perf_counter()
+                applied = trades = 0
+                while True:
+                    events, settled = processor.process_pending(batch_size)
+                    if not events:
+                        break
+                    applied += events
+                    trades += settled
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(
+            f"Settled:      {applied / elapsed:,.0f} orders/s, {trades / elapsed:,.0f} trades/s "
+            f"({trades:,} trades, batches of {batch_size})"
+        )
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from marketplace.services import MarketProcessor
+
+class Command(BaseCommand):
+    help = 'Run the marketplace matching process (exactly one instance per deployment)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Events applied and settled per transaction.')
+        parser.add_argument('--poll-interval', type=float, default=0.2, help='Seconds to sleep when no events are pending.')
+        parser.add_argument('--once', action='store_true', help='Drain pending events and exit.')
+
+    def handle(self, *args, **options):
+        processor = MarketProcessor()
+        if not processor.lock():
+            raise CommandError('Another marketplace process is running against this database.')
+        resting = processor.rebuild()
+        self.stdout.write(f"Rebuilt order books with {resting} resting order(s).")
+        while True:
+            events, trades = processor.process_pending(options['batch_size'])
+            if events:
+                self.stdout.write(f"Applied {events} event(s), settled {trades} trade(s).")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
@@ -1,3 +1,97 @@
 from django.db import models
+from django.contrib.auth import get_user_model
+from emotes.models import Emote
 
-# Create your models here.
+User = get_user_model()
+
+class Order(models.Model):
+    """ A limit order to buy or sell instances of one emote. """
+    SIDES = (('buy', 'Buy'), ('sell', 'Sell'))
+    STATUSES = (('open', 'Open'), ('filled', 'Filled'), ('cancelled', 'Cancelled'))
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='market_orders', help_text="User who placed the order.")
+    emote = models.ForeignKey(Emote, on_delete=models.CASCADE, related_name='market_orders', help_text="Emote being traded.")
+    side = models.CharField(max_length=4, choices=SIDES, help_text="Buy or sell.")
+    price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Limit price per instance in USD.")
+    quantity = models.PositiveIntegerField(help_text="Instances ordered.")
+    remaining = models.PositiveIntegerField(help_text="Instances not yet filled.")
+    status = models.CharField(max_length=10, choices=STATUSES, default='open')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Reservation checks: a user's open orders on one side
+            models.Index(fields=['user', 'side', 'status'], name='idx_order_user_side_status'),
+            models.Index(fields=['emote', 'side', 'status', 'price'], name='idx_order_emote_side_price'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.side} {self.remaining}/{self.quantity} {self.emote} @ ${self.price} ({self.status})"
+
+class OrderEvent(models.Model):
+    """
+    Write-ahead log of order book commands. Events are appended by the web process and applied
+    in sequence order by the single matching process, which marks them processed in the same
+    transaction that settles their fills.
+    """
+    sequence = models.BigAutoField(primary_key=True)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=10, choices=(('place', 'Place'), ('cancel', 'Cancel')))
+    processed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed', 'sequence'], name='idx_orderevent_pending'),
+        ]
+
+    def __str__(self):
+        return f"#{self.sequence} {self.kind} order {self.order_id}"
+
+class Trade(models.Model):
+    """ One fill between a resting (maker) order and an incoming (taker) order. """
+    emote = models.ForeignKey(Emote, on_delete=models.CASCADE, related_name='trades')
+    buy_order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='buy_trades')
+    sell_order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='sell_trades')
+    buyer = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='purchases')
+    seller = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='sales')
+    price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Execution price per instance (the maker's price).")
+    quantity = models.PositiveIntegerField()
+    event = models.ForeignKey(OrderEvent, on_delete=models.CASCADE, related_name='trades', help_text="Taker event that produced the fill.")
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['emote', '-timestamp'], name='idx_trade_emote_time'),
+        ]
+
+    def __str__(self):
+        return f"{self.seller} -> {self.buyer}: {self.quantity} {self.emote} @ ${self.price}"
+
+class Listing(models.Model):
+    """
+    Read model of resting sell orders for browsing, kept in step by the matching process.
+    Rarity is denormalised from the emote so every filter is served by one composite index.
+    """
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='listing')
+    emote = models.ForeignKey(Emote, on_delete=models.CASCADE, related_name='listings')
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='listings')
+    rarity = models.CharField(max_length=20, help_text="Copied from the emote.")
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(help_text="Instances still for sale.")
+    created_at = models.DateTimeField(help_text="When the order was placed.")
+
+    class Meta:
+        indexes = [
+            # Keyset pagination: each index ends in the primary key used as the tiebreaker
+            models.Index(fields=['rarity', 'price', 'order'], name='idx_listing_rarity_price'),
+            models.Index(fields=['rarity', '-created_at', '-order'], name='idx_listing_rarity_recent'),
+            models.Index(fields=['-created_at', '-order'], name='idx_listing_recent'),
+            models.Index(fields=['price', 'order'], name='idx_listing_price'),
+            # Cheapest listing per emote is answered from the index alone (INCLUDE on PostgreSQL)
+            models.Index(fields=['emote', 'price', 'order'], include=['quantity', 'seller'], name='idx_listing_emote_floor'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} {self.emote} @ ${self.price}"
@@ -0,0 +1,272 @@
+"""
+Marketplace order entry and settlement.
+
+Web requests validate an order and append it to the OrderEvent write-ahead log; they never
+touch the in-memory books. A single `run_marketplace` process owns the MatchingEngine: it
+rebuilds the books from the database on start, applies pending events in sequence order and
+settles each batch's fills (trades, ledger entries, inventory moves, order state) in one
+transaction that also marks the batch processed. A crash before that commit simply leaves
+the batch pending, and it is re-applied to the rebuilt books on restart.
+"""
+import json
+from collections import defaultdict
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from analytics.leaderboards import record_holdings
+from emotes.catalog import catalog_version
+from emotes.models import Emote
+from payments.models import BalanceTransaction
+from users.inventory import invalidate_on_commit
+from users.models import User
+from .engine import BookOrder, MatchingEngine
+from .listings import rebuild_listings, refresh_floor_prices, sync_listings
+from .models import Order, OrderEvent, Trade
+
+CENT = Decimal('0.01')
+PROCESSOR_LOCK_ID = 0x454d4b54  # PostgreSQL advisory lock key held by the running MarketProcessor
+
+def to_cents(price):
+    return int((price / CENT).to_integral_value())
+
+def from_cents(cents):
+    return (Decimal(cents) * CENT).quantize(CENT)
+
+def calculate_sale_split(total):
+    """ Seller, EmoteRush and artist shares of a sale, mirroring the donation split. """
+    return total * Decimal('0.9'), total * Decimal('0.05'), total * Decimal('0.05')
+
+def available_balance(user):
+    """ Ledger balance minus funds reserved by the user's open buy orders and by payouts awaiting their gateway. """
+    balance = user.balance_transactions.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    reserved = Order.objects.filter(user=user, side='buy', status='open').aggregate(
+        total=Sum(F('price') * F('remaining'))
+    )['total'] or Decimal('0.00')
+    paying = user.payouts.filter(status='pending').aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    return balance - reserved - paying
+
+def available_instances(user, emote):
+    """ Instances the user owns minus those reserved by their open sell orders. """
+    reserved = Order.objects.filter(user=user, emote=emote, side='sell', status='open').aggregate(
+        total=Sum('remaining')
+    )['total'] or 0
+    return user.get_emotes().get(emote.name, 0) - reserved
+
+@transaction.atomic
+def place_order(user, emote, side, price, quantity):
+    """
+    Validate and log a limit order; matching happens asynchronously in the matching process.
+    Raises:
+        ValueError: If the order is invalid or not covered by the user's balance or inventory.
+    """
+    if side not in ('buy', 'sell'):
+        raise ValueError("Side must be 'buy' or 'sell'")
+    if emote.is_special():
+        raise ValueError("Special emotes cannot be traded")
+    if quantity < 1:
+        raise ValueError("Quantity must be at least 1")
+    if price < CENT or price != price.quantize(CENT):
+        raise ValueError("Price must be a positive amount in whole cents")
+
+    User.objects.select_for_update().filter(pk=user.pk).first()  # Serialise a user's reservations
+    if side == 'buy' and available_balance(user) < price * quantity:
+        raise ValueError("Insufficient balance")
+    if side == 'sell' and available_instances(user, emote) < quantity:
+        raise ValueError("Not enough instances of this emote")
+
+    order = Order.objects.create(user=user, emote=emote, side=side, price=price, quantity=quantity, remaining=quantity)
+    OrderEvent.objects.create(order=order, kind='place')
+    return order
+
+def cancel_order(order):
+    """ Log a cancel; the order stays open until the matching process applies it. """
+    if order.status != 'open':
+        raise ValueError("Order is not open")
+    return OrderEvent.objects.create(order=order, kind='cancel')
+
+class UncoveredSellOrders(Exception):
+    """ Sellers no longer hold what these sell orders promised, e.g., after a revoke or an admin edit. """
+
+    def __init__(self, order_ids):
+        super().__init__(f"Sell orders not covered by inventory: {sorted(order_ids)}")
+        self.order_ids = order_ids
+
+class ProcessorLockLost(Exception):
+    """ This processor's database session no longer holds PROCESSOR_LOCK_ID, so another may be running. """
+
+def trade_for(event, fill):
+    buy, sell = (fill.taker, fill.maker) if fill.taker.side == 'buy' else (fill.maker, fill.taker)
+    return Trade(
+        emote_id=fill.taker.emote_id, buy_order_id=buy.id, sell_order_id=sell.id,
+        buyer_id=buy.user_id, seller_id=sell.user_id,
+        price=from_cents(fill.price), quantity=fill.quantity, event=event,
+    )
+
+class MarketProcessor:
+    """ Owns the in-memory books; run exactly one per deployment. """
+
+    def __init__(self):
+        self.engine = MatchingEngine()
+        self.emotes = {}  # emote_id -> (name, artist_id, rarity)
+        self.emotes_version = None  # Catalog version self.emotes was loaded under
+
+    def lock(self):
+        """
+        Take the session-level advisory lock that keeps a second processor off the event log.
+        Returns False if another processor holds it. Other databases run a single process anyway.
+        """
+        if connection.vendor != 'postgresql':
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [PROCESSOR_LOCK_ID])
+            return cursor.fetchone()[0]
+
+    def check_lock(self):
+        """ Raise ProcessorLockLost unless this session still holds the lock, e.g., after a reconnect. """
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()"
+                " AND granted AND classid = 0 AND objid = %s AND objsubid = 1)",
+                [PROCESSOR_LOCK_ID],
+            )
+            if not cursor.fetchone()[0]:
+                raise ProcessorLockLost(f"Advisory lock {PROCESSOR_LOCK_ID} is not held by this session")
+
+    def book_order(self, order, sequence):
+        return BookOrder(order.id, order.user_id, order.emote_id, order.side, to_cents(order.price), order.remaining, sequence)
+
+    def rebuild(self):
+        """ Reload resting orders whose place event has already been applied, in time priority. """
+        self.engine = MatchingEngine()
+        resting = (
+            OrderEvent.objects.filter(kind='place', processed=True, order__status='open', order__remaining__gt=0)
+            .select_related('order').order_by('sequence')
+        )
+        for event in resting.iterator(chunk_size=2000):
+            self.engine.rest(self.book_order(event.order, event.sequence))
+        rebuild_listings()
+        return len(self.engine.orders)
+
+    def load_emotes(self, emote_ids):
+        version = catalog_version()
+        if version != self.emotes_version:
+            self.emotes, self.emotes_version = {}, version  # An emote was edited, e.g., its rarity changed
+        missing = set(emote_ids) - self.emotes.keys()
+        for emote in Emote.objects.filter(id__in=missing).only('id', 'name', 'artist_id', 'rarity'):
+            self.emotes[emote.id] = (emote.name, emote.artist_id, emote.rarity)
+
+    def process_pending(self, batch_size=1000):
+        """ Apply up to `batch_size` pending events and settle them. Returns (events, trades). """
+        events = list(
+            OrderEvent.objects.filter(processed=False).select_related('order').order_by('sequence')[:batch_size]
+        )
+        if not events:
+            return 0, 0
+        fills, touched = [], {}
+        for event in events:
+            if event.kind == 'place' and event.order.status != 'open':
+                continue  # Cancelled as uncovered before it was applied
+            if event.kind == 'place':
+                taker = self.book_order(event.order, event.sequence)
+                touched[taker.id] = taker
+                for fill in self.engine.submit(taker):
+                    touched[fill.maker.id] = fill.maker
+                    if fill.quantity:
+                        fills.append((event, fill))
+            else:
+                order = self.engine.cancel(event.order_id)
+                if order is not None:
+                    touched[order.id] = order
+        try:
+            trades = self.settle(events, fills, touched)
+        except UncoveredSellOrders as e:
+            # Cancel the uncovered orders and replay the same events against books rebuilt without them
+            Order.objects.filter(id__in=e.order_ids, status='open').update(status='cancelled', updated_at=timezone.now())
+            self.rebuild()
+            return self.process_pending(batch_size)
+        except Exception:
+            self.rebuild()  # The books ran ahead of the database; start again from what committed
+            raise
+        return len(events), trades
+
+    @transaction.atomic
+    def settle(self, events, fills, touched):
+        """ Persist a batch of fills and order changes in a single transaction. """
+        self.check_lock()
+        now = timezone.now()
+        trades = Trade.objects.bulk_create([trade_for(event, fill) for event, fill in fills])
+
+        # The books are authoritative for remaining quantities and liveness. Orders are grouped by
+        # their new state so a batch costs a handful of UPDATEs rather than a per-row CASE.
+        changes = defaultdict(list)
+        for book_order in touched.values():
+            status = 'cancelled' if not book_order.live else 'open' if book_order.remaining else 'filled'
+            changes[(book_order.remaining, status)].append(book_order.id)
+        for (remaining, status), order_ids in changes.items():
+            Order.objects.filter(id__in=order_ids).update(remaining=remaining, status=status, updated_at=now)
+
+        self.load_emotes(book_order.emote_id for book_order in touched.values())
+        if trades:
+            self.settle_trades(trades, now)
+        rarities = sync_listings(touched.values(), {emote_id: emote[2] for emote_id, emote in self.emotes.items()})
+        if rarities:
+            transaction.on_commit(lambda: refresh_floor_prices(rarities))
+        OrderEvent.objects.filter(sequence__in=[event.sequence for event in events]).update(processed=True)
+        return len(trades)
+
+    def settle_trades(self, trades, now):
+        """
+        Ledger entries and inventory moves for a batch of trades.
+        Raises:
+            UncoveredSellOrders: A seller holds fewer instances than they sold; nothing is written.
+        """
+        ledger = []
+        moves = defaultdict(lambda: defaultdict(int))
+        holdings = defaultdict(lambda: defaultdict(int))
+        for trade in trades:
+            name, artist_id, rarity = self.emotes[trade.emote_id]
+            total = trade.price * trade.quantity
+            seller_share, emoterush_share, artist_share = calculate_sale_split(total)
+            source = f"Trade #{trade.id}"
+            ledger += [
+                BalanceTransaction(user_id=trade.buyer_id, amount=-total, transaction_type='purchase', source=source),
+                BalanceTransaction(user_id=trade.seller_id, amount=seller_share, transaction_type='sale_seller', source=source),
+                BalanceTransaction(user_id=None, amount=emoterush_share, transaction_type='emoterush_cut', source=source),
+            ]
+            if artist_id:
+                ledger.append(BalanceTransaction(user_id=artist_id, amount=artist_share, transaction_type='sale_artist', source=source))
+            moves[trade.buyer_id][name] += trade.quantity
+            moves[trade.seller_id][name] -= trade.quantity
+            holdings[trade.buyer_id][rarity] += trade.quantity
+            holdings[trade.seller_id][rarity] -= trade.quantity
+
+        users = list(User.objects.select_for_update().filter(id__in=moves.keys()).order_by('id'))
+        inventories = {user.id: user.get_emotes() for user in users}
+        uncovered = {
+            (user_id, name) for user_id, deltas in moves.items()
+            for name, delta in deltas.items() if inventories.get(user_id, {}).get(name, 0) + delta < 0
+        }
+        if uncovered:
+            raise UncoveredSellOrders({
+                trade.sell_order_id for trade in trades if (trade.seller_id, self.emotes[trade.emote_id][0]) in uncovered
+            })
+        BalanceTransaction.objects.bulk_create(ledger)
+
+        for user in users:
+            emotes_dict = inventories[user.id]
+            for name, delta in moves[user.id].items():
+                count = emotes_dict.get(name, 0) + delta
+                if count > 0:
+                    emotes_dict[name] = count
+                else:
+                    emotes_dict.pop(name, None)
+            user.emotes = json.dumps(emotes_dict)
+            user.inventory_version = F('inventory_version') + 1
+            user.date_updated = now
+        User.objects.bulk_update(users, ['emotes', 'inventory_version', 'date_updated'])
+        invalidate_on_commit(moves.keys())
+        # Trades move holdings between collectors; daily and weekly scores only count new emotes
+        record_holdings(holdings, periods=('all',))
@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from emotes.models import Emote
+from .listings import refresh_floor_prices
+from .models import Listing
+
+@receiver(post_save, sender=Emote)
+def sync_listing_rarity(sender, instance, created, update_fields=None, **kwargs):
+    """ Copy a changed rarity to the emote's listings, which denormalise it for the browse indexes. """
+    if created or (update_fields is not None and 'rarity' not in update_fields):
+        return  # e.g., allocation saves only touch remaining_instances
+    moved = Listing.objects.filter(emote=instance).exclude(rarity=instance.rarity).update(rarity=instance.rarity)
+    if moved:
+        # The old rarity is not known here and the floors of both tiers change; recompute them all
+        transaction.on_commit(refresh_floor_prices)
@@ -1,3 +1,185 @@
-from django.test import TestCase
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from emotes.catalog import clear_catalog
+from emotes.models import Emote
+from payments.models import BalanceTransaction
+from users.models import User
+from .engine import BookOrder, MatchingEngine
+from .listings import search_listings
+from .models import Listing, Order, OrderEvent, Trade
+from .services import MarketProcessor, place_order
 
-# Create your tests here.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+class MatchingEngineTests(SimpleTestCase):
+    """ Price-time priority and partial fills in the in-memory books. """
+
+    def setUp(self):
+        self.engine = MatchingEngine()
+        self.sequence = 0
+
+    def submit(self, user_id, side, price, quantity):
+        self.sequence += 1
+        order = BookOrder(self.sequence, user_id, 1, side, price, quantity, self.sequence)
+        return order, self.engine.submit(order)
+
+    def test_price_then_time_priority(self):
+        first, _ = self.submit(1, 'sell', 100, 1)
+        second, _ = self.submit(2, 'sell', 100, 1)
+        cheapest, _ = self.submit(3, 'sell', 99, 1)
+        self.submit(4, 'sell', 101, 1)
+        _, fills = self.submit(5, 'buy', 100, 5)
+        self.assertEqual([(fill.maker, fill.price, fill.quantity) for fill in fills], [(cheapest, 99, 1), (first, 100, 1), (second, 100, 1)])
+        self.assertEqual(self.engine.books[1].depth(), {'bids': [(100, 2)], 'asks': [(101, 1)]})
+
+    def test_partial_fills(self):
+        maker, _ = self.submit(1, 'sell', 100, 5)
+        taker, fills = self.submit(2, 'buy', 100, 2)
+        self.assertEqual([(fill.maker, fill.quantity) for fill in fills], [(maker, 2)])
+        self.assertEqual((maker.remaining, taker.remaining), (3, 0))
+        self.assertIn(maker.id, self.engine.orders)
+
+        taker, fills = self.submit(3, 'buy', 105, 4)
+        self.assertEqual([(fill.price, fill.quantity) for fill in fills], [(100, 3)])
+        self.assertEqual(taker.remaining, 1)  # The rest of the order now bids
+        self.assertNotIn(maker.id, self.engine.orders)
+        self.assertEqual(self.engine.books[1].depth(), {'bids': [(105, 1)], 'asks': []})
+
+    def test_self_trade_cancels_resting_order(self):
+        maker, _ = self.submit(1, 'sell', 100, 2)
+        other, _ = self.submit(2, 'sell', 101, 1)
+        taker, fills = self.submit(1, 'buy', 101, 1)
+        self.assertEqual([(fill.maker, fill.quantity) for fill in fills], [(maker, 0), (other, 1)])
+        self.assertFalse(maker.live)
+
+@override_settings(CACHES=LOCAL_CACHE)
+class MarketProcessorTests(TestCase):
+    """ Settlement from the OrderEvent log, including the recovery paths. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.emote = Emote.objects.create(name='common0', chat_display_name='ER:common0', rarity='common', remaining_instances=100)
+        cls.seller = User.objects.create(
+            username='seller', email='seller@example.com', twitch_id='1', twitch_channel_url='https://twitch.tv/seller',
+            emotes=json.dumps({'common0': 3}),
+        )
+        cls.buyer = User.objects.create(username='buyer', email='buyer@example.com', twitch_id='2', twitch_channel_url='https://twitch.tv/buyer')
+        BalanceTransaction.objects.create(user=cls.buyer, amount=Decimal('10.00'), transaction_type='donation_streamer', source='test')
+
+    def setUp(self):
+        cache.clear()
+        clear_catalog()
+        self.processor = MarketProcessor()
+        self.processor.rebuild()
+
+    def holdings(self, user):
+        return User.objects.get(pk=user.pk).get_emotes().get('common0', 0)
+
+    def test_partial_fill_settles_at_maker_price(self):
+        sell = place_order(self.seller, self.emote, 'sell', Decimal('1.00'), 3)
+        buy = place_order(self.buyer, self.emote, 'buy', Decimal('1.50'), 2)
+        self.assertEqual(self.processor.process_pending(), (2, 1))
+
+        trade = Trade.objects.get()
+        self.assertEqual((trade.price, trade.quantity, trade.sell_order_id), (Decimal('1.00'), 2, sell.id))
+        self.assertEqual((self.holdings(self.seller), self.holdings(self.buyer)), (1, 2))
+        sell.refresh_from_db()
+        buy.refresh_from_db()
+        self.assertEqual((sell.status, sell.remaining), ('open', 1))
+        self.assertEqual((buy.status, buy.remaining), ('filled', 0))
+        self.assertEqual(self.buyer.balance, Decimal('8.00'))
+        self.assertFalse(OrderEvent.objects.filter(processed=False).exists())
+
+    def test_uncovered_sell_order_is_cancelled(self):
+        sell = place_order(self.seller, self.emote, 'sell', Decimal('1.00'), 2)
+        self.seller.set_emotes({})  # e.g., an admin edit after the order was placed
+        buy = place_order(self.buyer, self.emote, 'buy', Decimal('1.00'), 2)
+        self.assertEqual(self.processor.process_pending(), (2, 0))
+
+        self.assertFalse(Trade.objects.exists())
+        self.assertEqual(Order.objects.get(pk=sell.pk).status, 'cancelled')
+        self.assertEqual(Order.objects.get(pk=buy.pk).status, 'open')
+        self.assertEqual(self.holdings(self.buyer), 0)
+        self.assertEqual(self.processor.engine.books[self.emote.id].depth(), {'bids': [(100, 2)], 'asks': []})
+
+    def test_replay_after_crash(self):
+        place_order(self.seller, self.emote, 'sell', Decimal('1.00'), 1)
+        place_order(self.buyer, self.emote, 'buy', Decimal('1.00'), 1)
+        with mock.patch.object(MarketProcessor, 'settle_trades', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                self.processor.process_pending()
+        self.assertEqual(OrderEvent.objects.filter(processed=False).count(), 2)
+        self.assertFalse(Trade.objects.exists())
+
+        restarted = MarketProcessor()
+        self.assertEqual(restarted.rebuild(), 0)
+        self.assertEqual(restarted.process_pending(), (2, 1))
+        self.assertEqual(restarted.process_pending(), (0, 0))
+        self.assertEqual((self.holdings(self.seller), self.holdings(self.buyer)), (2, 1))
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ListingSearchTests(TestCase):
+    """ Keyset pages cover every listing once, in order, even when sort values tie across a page boundary. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.common = Emote.objects.create(name='common0', chat_display_name='ER:common0', rarity='common', remaining_instances=100)
+        cls.rare = Emote.objects.create(name='rare0', chat_display_name='ER:rare0', rarity='rare', remaining_instances=100)
+        seller = User.objects.create(username='seller', email='seller@example.com', twitch_id='1', twitch_channel_url='https://twitch.tv/seller')
+        prices = ['2.00', '1.00', '2.00', '2.00', '3.00', '1.00', '2.00']
+        orders = Order.objects.bulk_create([
+            Order(user=seller, emote=cls.rare if i % 3 == 0 else cls.common, side='sell', price=Decimal(price), quantity=1, remaining=1)
+            for i, price in enumerate(prices)
+        ])
+        start = datetime(2026, 1, 5, 12, 0, tzinfo=dt_timezone.utc)
+        Listing.objects.bulk_create([
+            Listing(
+                order=order, emote=order.emote, seller=seller, rarity=order.emote.rarity, price=order.price, quantity=1,
+                created_at=start + timedelta(minutes=i // 2),  # Pairs share a timestamp
+            )
+            for i, order in enumerate(orders)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, limit=2, **filters):
+        """ Follow next cursors to the end; returns the listings in the order they were served. """
+        served, cursor = [], None
+        while True:
+            page, cursor = search_listings(cursor=cursor, limit=limit, **filters)
+            served += page
+            if cursor is None:
+                return served
+
+    def test_pages_match_a_full_sort(self):
+        listings = list(Listing.objects.all())
+        expected = {
+            'price': sorted(listings, key=lambda l: (l.price, l.order_id)),
+            '-price': sorted(listings, key=lambda l: (l.price, l.order_id), reverse=True),
+            'newest': sorted(listings, key=lambda l: (l.created_at, l.order_id), reverse=True),
+        }
+        for sort, ordered in expected.items():
+            for limit in (1, 2, 3, 7):
+                with self.subTest(sort=sort, limit=limit):
+                    self.assertEqual([l.order_id for l in self.walk(limit=limit, sort=sort)], [l.order_id for l in ordered])
+
+    def test_filters_apply_to_every_page(self):
+        served = self.walk(limit=1, rarity='common', min_price=Decimal('1.50'))
+        self.assertEqual([(l.rarity, str(l.price)) for l in served], [('common', '2.00'), ('common', '3.00')])
+
+    def test_view_pages_and_rejects_bad_cursors(self):
+        first = self.client.get('/marketplace/listings/', {'limit': 3}).json()
+        self.assertEqual([r['price'] for r in first['results']], ['1.00', '1.00', '2.00'])
+        second = self.client.get('/marketplace/listings/', {'limit': 3, 'cursor': first['next']}).json()
+        self.assertEqual([r['price'] for r in second['results']], ['2.00', '2.00', '2.00'])
+        self.assertFalse({r['order_id'] for r in first['results']} & {r['order_id'] for r in second['results']})
+
+        response = self.client.get('/marketplace/listings/', {'cursor': 'not-a-cursor'})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid cursor'}))
+        with self.assertRaises(ValueError):
+            search_listings(sort='newest', cursor=first['next'])  # A price cursor carries no timestamp
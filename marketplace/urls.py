@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+app_name = 'marketplace'
+
+urlpatterns = [
+    path('listings/', views.listings, name='listings'),
+    path('floors/', views.floor_prices, name='floor_prices'),
+    path('orders/', views.create_order, name='create_order'),
+    path('orders/mine/', views.my_orders, name='my_orders'),
+    path('orders/<int:order_id>/cancel/', views.cancel, name='cancel_order'),
+]
@@ -1,3 +1,102 @@
-from django.shortcuts import render
+from decimal import Decimal, InvalidOperation
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET, require_POST
+from emotes.models import Emote
+from analytics.views import parse_bound
+from .listings import cheapest_per_emote, get_floor_prices, search_listings
+from .models import Order
+from .services import cancel_order, place_order
 
-# Create your views here.
+MAX_PAGE_SIZE = 100
+
+def optional_decimal(value):
+    return Decimal(value) if value else None
+
+@login_required
+@require_POST
+def create_order(request):
+    try:
+        emote = get_object_or_404(Emote, id=request.POST.get('emote_id'))
+        order = place_order(
+            request.user,
+            emote,
+            request.POST.get('side'),
+            Decimal(request.POST.get('price', '')),
+            int(request.POST.get('quantity', 1)),
+        )
+        return JsonResponse({'message': 'Order placed', 'order_id': order.id, 'status': order.status})
+    except (ValueError, InvalidOperation) as e:
+        return JsonResponse({'error': str(e) or 'Invalid price'}, status=400)
+
+@login_required
+@require_POST
+def cancel(request, order_id):
+    order = get_object_or_404(Order, id=order_id, user=request.user)
+    try:
+        cancel_order(order)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'message': 'Cancellation requested', 'order_id': order.id})
+
+@login_required
+@require_GET
+def my_orders(request):
+    orders = Order.objects.filter(user=request.user).select_related('emote').order_by('-created_at')[:100]
+    return JsonResponse({'orders': [
+        {
+            'id': order.id,
+            'emote': order.emote.name,
+            'side': order.side,
+            'price': f"{order.price:.2f}",
+            'quantity': order.quantity,
+            'remaining': order.remaining,
+            'status': order.status,
+        }
+        for order in orders
+    ]})
+
+@require_GET
+def listings(request):
+    """ Listings filtered by rarity, emote, price range and recency, e.g., ?rarity=mythic&sort=price&cursor=... """
+    try:
+        limit = min(max(int(request.GET.get('limit', 50)), 1), MAX_PAGE_SIZE)
+        page, next_cursor = search_listings(
+            rarity=request.GET.get('rarity'),
+            emote_id=request.GET.get('emote_id'),
+            min_price=optional_decimal(request.GET.get('min_price')),
+            max_price=optional_decimal(request.GET.get('max_price')),
+            listed_after=parse_bound(request.GET.get('listed_after')),
+            sort=request.GET.get('sort', 'price'),
+            cursor=request.GET.get('cursor'),
+            limit=limit,
+        )
+    except (ValueError, InvalidOperation) as e:
+        return JsonResponse({'error': str(e) or 'Invalid price'}, status=400)
+    return JsonResponse({
+        'results': [
+            {
+                'order_id': listing.order_id,
+                'emote': listing.emote.name,
+                'chat_display_name': listing.emote.chat_display_name,
+                'rarity': listing.rarity,
+                'price': f"{listing.price:.2f}",
+                'quantity': listing.quantity,
+                'listed_at': listing.created_at.isoformat(),
+            }
+            for listing in page
+        ],
+        'next': next_cursor,
+    })
+
+@require_GET
+def floor_prices(request):
+    """ Cached per-rarity floors, plus per-emote floors for ?rarity=. """
+    response = {'rarities': get_floor_prices()}
+    if request.GET.get('rarity'):
+        response['emotes'] = {
+            emote_id: {'floor': f"{floor:.2f}", 'listings': count}
+            for emote_id, (floor, count) in cheapest_per_emote(rarity=request.GET['rarity']).items()
+        }
+    return JsonResponse(response)
@@ -0,0 +1,134 @@
+"""
+Clients for PayPal and Stripe, loaded on first use.
+
+The async REST calls, used by the ASGI payment views, await on one pooled httpx client per event
+loop (so one per ASGI worker) instead of blocking a thread for the whole round trip as the SDKs
+do, so a single worker can hold hundreds of payments in flight. The SDKs behind the sync views are imported and configured here too,
+on first call: stripe alone takes about a second to import, which every process loading
+payments.models (commands, workers, tests) would otherwise pay.
+"""
+import asyncio
+import time
+import weakref
+from django.conf import settings
+
+class GatewayError(ValueError):
+    """ The gateway rejected the request (4xx/5xx); transport failures propagate as httpx errors. """
+
+_clients = weakref.WeakKeyDictionary()  # Event loop -> (client, its close_with_loop generator)
+_transport = None
+_paypal_token = (None, 0.0)
+_stripe = None
+_paypal = None
+
+def stripe_sdk():
+    """ The stripe module, configured with STRIPE_SECRET_KEY. """
+    global _stripe
+    if _stripe is None:
+        import stripe
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        _stripe = stripe
+    return _stripe
+
+def paypal_sdk():
+    """ The paypalrestsdk module, configured from the PAYPAL_* settings. """
+    global _paypal
+    if _paypal is None:
+        import paypalrestsdk
+        paypalrestsdk.configure({
+            "mode": settings.PAYPAL_MODE,
+            "client_id": settings.PAYPAL_CLIENT_ID,
+            "client_secret": settings.PAYPAL_SECRET
+        })
+        _paypal = paypalrestsdk
+    return _paypal
+
+def configure_client(transport=None):
+    """ Replace the transport behind the shared client, e.g., with httpx.MockTransport in benchmarks. """
+    global _transport
+    _transport = transport
+    _clients.clear()  # Each dropped client is closed on its loop by its generator's finalizer
+
+async def close_with_loop(client):
+    """
+    Closes `client` when its event loop shuts down: asyncio.run and async_to_sync call the loop's
+    shutdown_asyncgens() before closing it, which closes this generator once it has started.
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+        loop = asyncio.get_running_loop()
+        if _clients.get(loop, (None,))[0] is client:
+            del _clients[loop]  # The entry refers back to the loop through the generator, so it would never expire
+
+def get_client():
+    """ The shared client for the running event loop, closed along with the loop (e.g., one per async_to_sync call). """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None or entry[0].is_closed:
+        import httpx
+        client = httpx.AsyncClient(
+            transport=_transport,
+            timeout=settings.PAYMENT_GATEWAY_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=settings.PAYMENT_GATEWAY_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.PAYMENT_GATEWAY_MAX_CONNECTIONS,
+            ),
+        )
+        lifetime = close_with_loop(client)
+        loop.create_task(lifetime.asend(None))  # Start it, registering it with the loop
+        entry = _clients[loop] = (client, lifetime)
+    return entry[0]
+
+async def send(method, url, **kwargs):
+    """ Send one request and return its decoded JSON body; raise GatewayError with the gateway's message on rejection. """
+    response = await get_client().request(method, url, **kwargs)
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if response.is_error:
+        error = body.get('error')
+        if isinstance(error, dict):
+            error = error.get('message')
+        raise GatewayError(error or body.get('message') or f"Gateway returned HTTP {response.status_code}")
+    return body
+
+async def paypal_token():
+    """ OAuth access token for the REST API, reused until shortly before it expires. """
+    global _paypal_token
+    token, expires = _paypal_token
+    if token and time.monotonic() < expires:
+        return token
+    body = await send(
+        'POST', f"{settings.PAYPAL_API_BASE}/v1/oauth2/token",
+        auth=(settings.PAYPAL_CLIENT_ID or '', settings.PAYPAL_SECRET or ''),
+        data={'grant_type': 'client_credentials'},
+    )
+    _paypal_token = (body['access_token'], time.monotonic() + int(body.get('expires_in', 0)) - 60)
+    return body['access_token']
+
+async def paypal_post(path, payload):
+    token = await paypal_token()
+    return await send(
+        'POST', f"{settings.PAYPAL_API_BASE}{path}", json=payload, headers={'Authorization': f"Bearer {token}"},
+    )
+
+def form_encode(data, prefix=None):
+    """ Flatten nested dicts into Stripe's bracketed form fields, e.g., capabilities[transfers][requested]. """
+    fields = {}
+    for key, value in data.items():
+        name = f"{prefix}[{key}]" if prefix else key
+        if isinstance(value, dict):
+            fields.update(form_encode(value, name))
+        elif isinstance(value, bool):
+            fields[name] = 'true' if value else 'false'
+        else:
+            fields[name] = str(value)
+    return fields
+
+async def stripe_post(path, data):
+    return await send(
+        'POST', f"{settings.STRIPE_API_BASE}{path}", data=form_encode(data), auth=(settings.STRIPE_SECRET_KEY or '', ''),
+    )
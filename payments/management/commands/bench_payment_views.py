@@ -0,0 +1,127 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+import httpx
+import stripe
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.urls import path
+from payments import gateways, views
+from payments.models import Donation
+from users.models import User
+
+# Served as ROOT_URLCONF during the run so both implementations share one URL layout
+urlpatterns = [
+    path('sync/donate/', views.donate),
+    path('async/donate/', views.adonate),
+]
+
+class InFlight:
+    """ Counts concurrent gateway calls and remembers the peak. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.current -= 1
+
+class Command(BaseCommand):
+    help = (
+        'Compare concurrent Stripe donations through the sync view on a threaded WSGI worker and the async view '
+        'on the ASGI application, against a stubbed slow gateway (uses a throwaway test database)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Donations sent at once to each view.')
+        parser.add_argument('--delay', type=float, default=0.5, help='Seconds the stubbed gateway takes to answer.')
+        parser.add_argument('--threads', type=int, default=16, help='Worker threads serving the sync view, as in a gthread WSGI worker.')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            # The shared in-memory test database fails concurrent writers with "table is locked"; a file waits instead
+            handle, name = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            connection.settings_dict['TEST']['NAME'] = name
+            connection.settings_dict['OPTIONS']['timeout'] = 60
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(ROOT_URLCONF=__name__, QUERY_BUDGET_DEFAULT=10 ** 6):
+                donor = User.objects.create(username='bench_donor', email='donor@example.com', twitch_id='bench1', twitch_channel_url='https://twitch.tv/bench_donor')
+                streamer = User.objects.create(username='bench_streamer', email='streamer@example.com', twitch_id='bench2', twitch_channel_url='https://twitch.tv/bench_streamer')
+                client = Client()
+                client.force_login(donor)
+                cookies = {settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value}
+                data = {'streamer_id': streamer.id, 'amount': '1', 'payment_method': 'stripe', 'payment_token': 'tok_visa'}
+                self.report(f"sync ({options['threads']} threads)", *self.run_sync(data, cookies, options))
+                self.report('async', *self.run_async(data, cookies, options))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def run_sync(self, data, cookies, options):
+        from emoterush.wsgi import application
+        in_flight = InFlight()
+
+        def charge(**kwargs):
+            with in_flight:
+                time.sleep(options['delay'])
+            return SimpleNamespace(id=f"ch_{uuid.uuid4().hex}", status='succeeded')
+
+        client = httpx.Client(transport=httpx.WSGITransport(app=application), base_url='http://testserver', cookies=cookies)
+        with client, mock.patch.object(stripe.Charge, 'create', side_effect=charge), ThreadPoolExecutor(options['threads']) as pool:
+            started = time.perf_counter()
+            statuses = list(pool.map(lambda _: client.post('/sync/donate/', data=data).status_code, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+        return self.result(options['requests'], elapsed, in_flight, statuses)
+
+    def run_async(self, data, cookies, options):
+        in_flight = InFlight()
+
+        async def gateway(request):
+            with in_flight:
+                await asyncio.sleep(options['delay'])
+            return httpx.Response(200, json={'id': f"ch_{uuid.uuid4().hex}", 'status': 'succeeded'})
+
+        async def send():
+            from emoterush.asgi import application
+            transport = httpx.ASGITransport(app=application)
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver', cookies=cookies, timeout=None) as client:
+                responses = await asyncio.gather(*(client.post('/async/donate/', data=data) for _ in range(options['requests'])))
+            return [response.status_code for response in responses]
+
+        gateways.configure_client(httpx.MockTransport(gateway))
+        try:
+            started = time.perf_counter()
+            statuses = asyncio.run(send())
+            elapsed = time.perf_counter() - started
+        finally:
+            gateways.configure_client()
+        return self.result(options['requests'], elapsed, in_flight, statuses)
+
+    def result(self, count, elapsed, in_flight, statuses):
+        saved = Donation.objects.filter(status='completed').count()
+        Donation.objects.all().delete()
+        return count, elapsed, in_flight.peak, statuses.count(200), saved
+
+    def report(self, label, count, elapsed, peak, succeeded, saved):
+        self.stdout.write(
+            f"{label}: {count} donations in {elapsed:.2f}s ({count / elapsed:,.1f}/s), "
+            f"peak {peak} gateway calls in flight, {succeeded} succeeded, {saved} saved"
+        )
@@ -1,22 +1,26 @@
 from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from emotes.models import Emote
-from emotes.services import roll_emote
+from emotes.catalog import get_emote
+from emotes.services import roll_emotes
 from django.core.validators import MinValueValidator
 from decimal import Decimal
-import paypalrestsdk
-import stripe
-from django.conf import settings
+import time
+from asgiref.sync import sync_to_async
+from alerts.events import publish_donation
+from analytics.events import RollEventBuffer
+from analytics.earnings import apply_ledger_rows
+from analytics.leaderboards import record_scores
+from emoterush.metrics import record_gateway_call
+from . import gateways
 
 User = get_user_model()
 
-# Configure payment processors
-paypalrestsdk.configure({
-    "mode": settings.PAYPAL_MODE,
-    "client_id": settings.PAYPAL_CLIENT_ID,
-    "client_secret": settings.PAYPAL_SECRET
-})
-stripe.api_key = settings.STRIPE_SECRET_KEY
+class BalanceTransactionQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        apply_ledger_rows(objs)  # Keep daily earnings aggregates in step with the ledger
+        return objs
 
 class BalanceTransaction(models.Model):
     user = models.ForeignKey(
@@ -38,6 +42,7 @@ class BalanceTransaction(models.Model):
             ('donation_artist', 'Donation (Artist)'),
             ('sale_seller', 'Sale (Seller)'),
             ('sale_artist', 'Sale (Artist)'),
+            ('purchase', 'Purchase'),
             ('emoterush_cut', 'EmoteRush Cut'),
             ('payout', 'Payout'),
             ('payout_fee', 'Payout Fee')
@@ -50,6 +55,14 @@ class BalanceTransaction(models.Model):
     )
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    objects = BalanceTransactionQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        super().save(*args, **kwargs)
+        if created:
+            apply_ledger_rows([self])
+
     def __str__(self):
         return f"{self.user or 'EmoteRush'}: {self.transaction_type} ${self.amount} ({self.source})"
 
@@ -118,63 +131,115 @@ class Donation(models.Model):
         artist_share = net_amount * Decimal('0.05')
         return streamer_share, emoterush_share, artist_share
     
+    def charge_total(self):
+        """ Amount charged to the donor; the fee is fixed before the charge rather than at first save. """
+        if self.pk is None:
+            self.transaction_fee = self.calculate_fees()
+        return self.amount + self.transaction_fee
+
+    def check_payment_method(self):
+        """ Reject unknown methods before the gateway is timed, so they never count as gateway failures. """
+        if self.payment_method not in ('paypal', 'stripe'):
+            raise ValueError("Unsupported payment method")
+
+    def paypal_payment(self, total_charge):
+        """ PayPal payment request body, shared by the SDK and async REST paths. """
+        return {
+            "intent": "sale",
+            "payer": {"payment_method": "paypal"},
+            "transactions": [{
+                "amount": {
+                    "total": f"{total_charge:.2f}",
+                    "currency": "USD",
+                    "details": {"subtotal": f"{self.amount:.2f}", "fee": f"{self.transaction_fee:.2f}"}
+                },
+                "description": f"Donation to {self.streamer.username}"
+            }],
+            "redirect_urls": {
+                "return_url": "http://localhost:8000/payments/success/",
+                "cancel_url": "http://localhost:8000/payments/cancel/"
+            }
+        }
+
     @transaction.atomic
     def process_payment(self, payment_token):
         """ Process payment and update status. """
-        total_charge = self.amount + self.transaction_fee
-
-        if self.payment_method == 'paypal':
-            payment = paypalrestsdk.Payment({
-                "intent": "sale",
-                "payer": {"payment_method": "paypal"},
-                "transactions": [{
-                    "amount": {
-                        "total": f"{total_charge:.2f}",
-                        "currency": "USD",
-                        "details": {"subtotal": f"{self.amount:.2f}", "fee": f"{self.transaction_fee:.2f}"}
-                    },
-                    "description": f"Donation to {self.streamer.username}"
-                }],
-                "redirect_urls": {
-                    "return_url": "http://localhost:8000/payments/success/",
-                    "cancel_url": "http://localhost:8000/payments/cancel/"
-                }
-            })
-            if payment.create():
-                self.payment_id = payment.id
-                # Simulate execution (replace with redirect in production)
-                payment.execute({"payer_id": "dummy_payer_id"})
-                self.status = 'completed'
-            else:
-                self.status = 'failed'
-                raise ValueError(payment.error)
+        self.check_payment_method()
+        total_charge = self.charge_total()
+        sdk = gateways.paypal_sdk() if self.payment_method == 'paypal' else gateways.stripe_sdk()  # First call imports it
+
+        started = time.perf_counter()
+        try:
+            if self.payment_method == 'paypal':
+                payment = sdk.Payment(self.paypal_payment(total_charge))
+                if payment.create():
+                    self.payment_id = payment.id
+                    # Simulate execution (replace with redirect in production)
+                    payment.execute({"payer_id": "dummy_payer_id"})
+                    self.status = 'completed'
+                else:
+                    self.status = 'failed'
+                    raise ValueError(payment.error)
             
-        elif self.payment_method == 'stripe':
-            charge = stripe.Charge.create(
-                amount=int(total_charge * 100),  # Convert to cents
-                currency="usd",
-                source=payment_token,
-                description=f"Donation to {self.streamer.username}"
-            )
-            self.payment_id = charge.id
-            self.status = 'completed' if charge.status == 'succeeded' else 'failed'
-            if charge.status != 'succeeded':
-                raise ValueError("Stripe payment failed")
+            elif self.payment_method == 'stripe':
+                charge = sdk.Charge.create(
+                    amount=int(total_charge * 100),  # Convert to cents
+                    currency="usd",
+                    source=payment_token,
+                    description=f"Donation to {self.streamer.username}"
+                )
+                self.payment_id = charge.id
+                self.status = 'completed' if charge.status == 'succeeded' else 'failed'
+                if charge.status != 'succeeded':
+                    raise ValueError("Stripe payment failed")
+        finally:
+            record_gateway_call('payment', self.payment_method, self.status == 'completed', time.perf_counter() - started)
 
         self.save()
 
+    async def aprocess_payment(self, payment_token):
+        """ process_payment for async views: awaits the gateway over HTTP and only offloads the final save. """
+        self.check_payment_method()
+        total_charge = self.charge_total()
+
+        started = time.perf_counter()
+        try:
+            if self.payment_method == 'paypal':
+                try:
+                    payment = await gateways.paypal_post('/v1/payments/payment', self.paypal_payment(total_charge))
+                except gateways.GatewayError:
+                    self.status = 'failed'
+                    raise
+                self.payment_id = payment['id']
+                # Simulate execution (replace with redirect in production)
+                await gateways.paypal_post(f"/v1/payments/payment/{payment['id']}/execute", {"payer_id": "dummy_payer_id"})
+                self.status = 'completed'
+
+            elif self.payment_method == 'stripe':
+                charge = await gateways.stripe_post('/v1/charges', {
+                    "amount": int(total_charge * 100),  # Convert to cents
+                    "currency": "usd",
+                    "source": payment_token,
+                    "description": f"Donation to {self.streamer.username}",
+                })
+                self.payment_id = charge['id']
+                self.status = 'completed' if charge['status'] == 'succeeded' else 'failed'
+                if charge['status'] != 'succeeded':
+                    raise ValueError("Stripe payment failed")
+        finally:
+            record_gateway_call('payment', self.payment_method, self.status == 'completed', time.perf_counter() - started)
+
+        await self.asave()
+
     @transaction.atomic
     def unlock_emotes(self):
         """ Unlock emotes based on donation amount (1 per $1). """
-        emote_count = int(self.amount)
-        unlocked_emotes = []
-        for _ in range(emote_count):
-            emote_name = roll_emote(self.donor)
-            if emote_name:
-                unlocked_emotes.append(emote_name)
+        with RollEventBuffer(donation=self) as events:
+            unlocked_emotes = roll_emotes(self.donor, int(self.amount), events=events)
         if unlocked_emotes:
-            self.emote_unlocked = Emote.objects.get(name=unlocked_emotes[0])
+            self.emote_unlocked_id = get_emote(name=unlocked_emotes[0]).id
             self.save()
+        self._unlocked_emotes = unlocked_emotes
         return unlocked_emotes
 
     @transaction.atomic
@@ -194,6 +259,9 @@ class Donation(models.Model):
                     transaction_type='donation_artist',
                     source=source
                 )
+            record_scores('donors', {self.donor_id: self.amount})
+            # Overlays are notified only after the ledger rows commit
+            publish_donation(self, getattr(self, '_unlocked_emotes', []))
 
     def save(self, *args, **kwargs):
         if self.pk is None:  # On creation
@@ -250,58 +318,45 @@ class Payout(models.Model):
         """ Calculate amount user receives after fees. """
         return self.amount - self.calculate_payout_fee()
 
-    @transaction.atomic
-    def process_payout(self):
-        """ Process the payout, deduct from balance, and charge fees to recipient. """
-        if self.amount > self.user.balance:
+    def check_payout(self):
+        """
+        Validate the payout against the user's available balance, terms and payout details.
+        Locks the user row, so call it inside the transaction that records the payout.
+        """
+        from marketplace.services import available_balance
+        if self.method not in ('paypal', 'bank'):
+            raise ValueError("Unsupported payout method")
+        User.objects.select_for_update().filter(pk=self.user_id).first()  # Serialise with order placement and other payouts
+        if self.amount > available_balance(self.user):
             raise ValueError("Insufficient balance")
         if self.amount < Decimal('1.00'):
             raise ValueError("Minimum payout is $1.00")
         if not self.user.agreed_to_terms:
             raise ValueError("User must agree to terms and conditions")
-        
-        source = f"Payout #{self.id}"
-        payout_fee = self.calculate_payout_fee()
-        net_amount = self.net_amount()
+        if self.method == 'paypal' and not self.user.paypal_email:
+            raise ValueError("PayPal email required for payout")
+        if self.method == 'bank' and not self.user.stripe_account_id:
+            raise ValueError("Stripe account ID required for bank payout")
 
-        if self.method == 'paypal':
-            if not self.user.paypal_email:
-                raise ValueError("PayPal email required for payout")
-            payout = paypalrestsdk.Payout({
-                "sender_batch_header": {
-                    "email_subject": "EmoteRush Payout",
-                    "email_message": f"You're receiving ${net_amount:.2f} after a ${payout_fee:.2f} fee."
-                },
-                "items": [{
-                    "recipient_type": "EMAIL",
-                    "amount": {"value": f"{self.amount:.2f}", "currency": "USD"},
-                    "receiver": self.user.paypal_email,
-                    "note": f"Payout of ${net_amount:.2f} after ${payout_fee:.2f} fee."
-                }]
-            })
-            if payout.create():
-                self.payment_id = payout.batch_header.payout_batch_id
-                self.status = 'completed'
-            else:
-                self.status = 'failed'
-                raise ValueError(payout.error)
-        
-        elif self.method == 'bank':
-            if not self.user.stripe_account_id:
-                raise ValueError("Stripe account ID required for bank payout")
-            try:
-                transfer = stripe.Transfer.create(
-                    amount=int(net_amount * 100),  # Convert to cents
-                    currency="usd",
-                    destination=self.user.stripe_account_id,
-                    description=f"Payout of ${net_amount:.2f} after ${payout_fee:.2f} fee."
-                )
-                self.payment_id = transfer.id
-                self.status = 'completed'
-            except stripe.error.StripeError as e:
-                self.status = 'failed'
-                raise ValueError(f"Stripe transfer failed: {str(e)}")
+    def paypal_payout(self, net_amount, payout_fee):
+        """ PayPal payout request body, shared by the SDK and async REST paths. """
+        return {
+            "sender_batch_header": {
+                "email_subject": "EmoteRush Payout",
+                "email_message": f"You're receiving ${net_amount:.2f} after a ${payout_fee:.2f} fee."
+            },
+            "items": [{
+                "recipient_type": "EMAIL",
+                "amount": {"value": f"{self.amount:.2f}", "currency": "USD"},
+                "receiver": self.user.paypal_email,
+                "note": f"Payout of ${net_amount:.2f} after ${payout_fee:.2f} fee."
+            }]
+        }
 
+    @transaction.atomic
+    def record_payout(self, payout_fee):
+        """ Write the ledger rows for a completed payout and save it. """
+        source = f"Payout #{self.id}"
         if self.status == 'completed':
             BalanceTransaction.objects.bulk_create([
                 BalanceTransaction(user=self.user, amount=-self.amount, transaction_type='payout', source=source),
@@ -309,5 +364,90 @@ class Payout(models.Model):
             ])
         self.save()
 
+    @transaction.atomic
+    def reserve_payout(self):
+        """ Check the payout and save it as pending, which holds its amount out of available_balance until recorded. """
+        self.check_payout()
+        self.status = 'pending'
+        self.save()
+
+    @transaction.atomic
+    def process_payout(self):
+        """ Process the payout, deduct from balance, and charge fees to recipient. """
+        self.check_payout()
+        payout_fee = self.calculate_payout_fee()
+        net_amount = self.net_amount()
+        sdk = gateways.paypal_sdk() if self.method == 'paypal' else gateways.stripe_sdk()  # First call imports it
+
+        started = time.perf_counter()
+        try:
+            if self.method == 'paypal':
+                payout = sdk.Payout(self.paypal_payout(net_amount, payout_fee))
+                if payout.create():
+                    self.payment_id = payout.batch_header.payout_batch_id
+                    self.status = 'completed'
+                else:
+                    self.status = 'failed'
+                    raise ValueError(payout.error)
+        
+            elif self.method == 'bank':
+                try:
+                    transfer = sdk.Transfer.create(
+                        amount=int(net_amount * 100),  # Convert to cents
+                        currency="usd",
+                        destination=self.user.stripe_account_id,
+                        description=f"Payout of ${net_amount:.2f} after ${payout_fee:.2f} fee."
+                    )
+                    self.payment_id = transfer.id
+                    self.status = 'completed'
+                except sdk.error.StripeError as e:
+                    self.status = 'failed'
+                    raise ValueError(f"Stripe transfer failed: {str(e)}")
+        finally:
+            record_gateway_call('payout', self.method, self.status == 'completed', time.perf_counter() - started)
+
+        self.record_payout(payout_fee)
+
+    async def aprocess_payout(self):
+        """
+        process_payout for async views: the balance check and ledger write run on a worker thread, the
+        gateway call does not. No lock is held across the await, so the payout is reserved first.
+        """
+        await sync_to_async(self.reserve_payout)()
+        payout_fee = self.calculate_payout_fee()
+        net_amount = self.net_amount()
+
+        started = time.perf_counter()
+        try:
+            if self.method == 'paypal':
+                try:
+                    payout = await gateways.paypal_post('/v1/payments/payouts', self.paypal_payout(net_amount, payout_fee))
+                except gateways.GatewayError:
+                    self.status = 'failed'
+                    raise
+                self.payment_id = payout['batch_header']['payout_batch_id']
+                self.status = 'completed'
+
+            elif self.method == 'bank':
+                try:
+                    transfer = await gateways.stripe_post('/v1/transfers', {
+                        "amount": int(net_amount * 100),  # Convert to cents
+                        "currency": "usd",
+                        "destination": self.user.stripe_account_id,
+                        "description": f"Payout of ${net_amount:.2f} after ${payout_fee:.2f} fee.",
+                    })
+                except gateways.GatewayError as e:
+                    self.status = 'failed'
+                    raise ValueError(f"Stripe transfer failed: {str(e)}")
+                self.payment_id = transfer['id']
+                self.status = 'completed'
+        finally:
+            record_gateway_call('payout', self.method, self.status == 'completed', time.perf_counter() - started)
+            if self.status == 'failed':
+                # Rejected, so release the reservation; a transport error leaves it pending, as the transfer may have gone out
+                await sync_to_async(self.save)(update_fields=['status'])
+
+        await sync_to_async(self.record_payout)(payout_fee)
+
     def __str__(self):
         return f"{self.user}: ${self.amount} via {self.method} ({self.status})"
\ No newline at end of file
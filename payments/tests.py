@@ -1,3 +1,71 @@
-from django.test import TestCase
+from decimal import Decimal
+import httpx
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from emoterush.testing import QueryBudgetMixin
+from emotes.catalog import clear_catalog
+from emotes.models import Emote
+from users.models import User
+from . import gateways
+from .models import BalanceTransaction, Donation
 
-# Create your tests here.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+def fake_gateway(request):
+    """ Accept every charge and payout, as the Stripe and PayPal REST APIs would. """
+    path = request.url.path
+    if path.endswith('/oauth2/token'):
+        return httpx.Response(200, json={'access_token': 'token', 'expires_in': 3600})
+    if path == '/v1/charges':
+        return httpx.Response(200, json={'id': f"ch_{id(request)}", 'status': 'succeeded'})
+    if path == '/v1/transfers':
+        return httpx.Response(200, json={'id': f"tr_{id(request)}"})
+    return httpx.Response(201, json={'id': f"PAY-{id(request)}", 'batch_header': {'payout_batch_id': f"B-{id(request)}"}})
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PaymentQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """ The donation and payout paths stay within QUERY_BUDGETS however much is donated. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = User.objects.create(username='donor', email='donor@example.com', twitch_id='1', twitch_channel_url='https://twitch.tv/donor')
+        cls.streamer = User.objects.create(
+            username='streamer', email='streamer@example.com', twitch_id='2', twitch_channel_url='https://twitch.tv/streamer',
+            agreed_to_terms=True, paypal_email='streamer@example.com', stripe_account_id='acct_streamer',
+        )
+        Emote.objects.bulk_create([
+            Emote(name=f"{rarity}{i}", chat_display_name=f"ER:{rarity}{i}", rarity=rarity, remaining_instances=Emote.RARITY_MAX_INSTANCES[rarity])
+            for rarity, chance in Emote.RARITY_CHANCES.items() if chance for i in range(5)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        clear_catalog()  # Emotes came from bulk_create, which leaves the catalog version alone
+        gateways.configure_client(httpx.MockTransport(fake_gateway))
+        self.addCleanup(gateways.configure_client)
+
+    def donate(self, path, **data):
+        self.client.force_login(self.donor)
+        response = self.assertWithinQueryBudget('post', path, data={'payment_method': 'stripe', 'payment_token': 'tok_visa', **data})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_donate(self):
+        for amount in (1, 100):
+            body = self.donate('/payments/donate/', streamer_id=self.streamer.id, amount=amount)
+            self.assertEqual(len(body['unlocked_emotes']), amount)
+        self.assertEqual(sum(User.objects.get(pk=self.donor.pk).get_emotes().values()), 101)
+
+    def test_donate_to_username(self):
+        for amount in (1, 100):
+            body = self.donate('/payments/donate/@streamer/', amount=amount)
+            self.assertEqual(len(body['unlocked_emotes']), amount)
+        self.assertEqual(Donation.objects.filter(streamer=self.streamer, status='completed').count(), 2)
+
+    def test_request_payout(self):
+        BalanceTransaction.objects.create(user=self.streamer, amount=Decimal('50.00'), transaction_type='donation_streamer', source='test')
+        self.client.force_login(self.streamer)
+        response = self.assertWithinQueryBudget('post', '/payments/payout/', data={'amount': '20', 'method': 'bank'})
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.assertWithinQueryBudget('post', '/payments/payout/', data={'amount': '40', 'method': 'bank'})
+        self.assertEqual(response.json(), {'error': 'Insufficient balance'})
@@ -1,17 +1,20 @@
+from django.conf import settings
 from django.urls import path, re_path
 from . import views
 from django.http import JsonResponse
 
+ASYNC = settings.PAYMENT_ASYNC_VIEWS
+
 urlpatterns = [
-    path('donate/', views.donate, name='donate'),
-    path('payout/', views.request_payout, name='request_payout'),
+    path('donate/', views.adonate if ASYNC else views.donate, name='donate'),
+    path('payout/', views.arequest_payout if ASYNC else views.request_payout, name='request_payout'),
     path('connect-paypal/', views.connect_paypal, name='connect_paypal'),
-    path('connect-stripe/', views.connect_stripe, name='connect_stripe'),
+    path('connect-stripe/', views.aconnect_stripe if ASYNC else views.connect_stripe, name='connect_stripe'),
     path('set-preferred-payout/', views.set_preferred_payout, name='set_preferred_payout'),
     path('agree-to-terms/', views.agree_to_terms, name='agree_to_terms'),
     path('get-donation-link/', views.get_donation_link, name='get_donation_link'),
     path('success/', lambda request: JsonResponse({'message': 'Payment successful'}), name='success'),
     path('cancel/', lambda request: JsonResponse({'message': 'Payment cancelled'}, status=400), name='cancel'),
     path('refresh/', lambda request: JsonResponse({'message': 'Refreshed'}), name='refresh'),
-    re_path(r'^donate/@(?P<username>[\w.@+-]+)/$', views.donate_to_username, name='donate_to_username'),
+    re_path(r'^donate/@(?P<username>[\w.@+-]+)/$', views.adonate_to_username if ASYNC else views.donate_to_username, name='donate_to_username'),
 ]
\ No newline at end of file
@@ -1,12 +1,13 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST, require_GET
 from .models import Donation, Payout
 from decimal import Decimal
-import stripe
-from django.shortcuts import get_object_or_404
 from users.models import User
+from users.profiles import aget_payment_profile, get_payment_profile
+from . import gateways
 
 @csrf_exempt
 @require_POST
@@ -84,7 +85,7 @@ def connect_paypal(request):
         if not paypal_email:
             return JsonResponse({'error': 'PayPal email required'}, status=400)
         request.user.paypal_email = paypal_email
-        request.user.save()
+        request.user.save(update_fields=['paypal_email', 'date_updated'])
         donation_link = request.user.donation_link
         return JsonResponse({
             'message': 'PayPal account connected',
@@ -96,6 +97,7 @@ def connect_paypal(request):
 @login_required
 @require_POST
 def connect_stripe(request):
+    stripe = gateways.stripe_sdk()
     try:
         account = stripe.Account.create(
             type="express",
@@ -103,7 +105,7 @@ def connect_stripe(request):
             capabilities={"transfers": {"requested": True}},
         )
         request.user.stripe_account_id = account.id
-        request.user.save()
+        request.user.save(update_fields=['stripe_account_id', 'date_updated'])
         account_link = stripe.AccountLink.create(
             account=account.id,
             refresh_url="http://localhost:8000/payments/refresh/",
@@ -132,7 +134,7 @@ def set_preferred_payout(request):
         if method == 'bank' and not request.user.stripe_account_id:
             return JsonResponse({'error': 'Connect bank account via Stripe first'}, status=400)
         request.user.preferred_payout_method = method
-        request.user.save()
+        request.user.save(update_fields=['preferred_payout_method', 'date_updated'])
         return JsonResponse({'message': f"Preferred payout method set to {method}"})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -145,7 +147,7 @@ def agree_to_terms(request):
         if not agreed:
             return JsonResponse({'error': 'You must agree to the terms'}, status=400)
         request.user.agreed_to_terms = True
-        request.user.save()
+        request.user.save(update_fields=['agreed_to_terms', 'date_updated'])
         return JsonResponse({'message': 'Terms agreed'})
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
@@ -166,10 +168,12 @@ def get_donation_link(request):
 def donate_to_username(request, username):
     """ Handle donations via a custom link. """
     try:
-        streamer = get_object_or_404(User, username = username.lstrip('@'))
-        if not streamer.donation_link:
+        profile = get_payment_profile(username.lstrip('@'))
+        if profile is None:
+            return JsonResponse({'error': 'User not found'}, status=404)
+        if not profile.eligible:
             return JsonResponse({'error': 'This user is not accepting donations'}, status=400)
-        if request.user == streamer:
+        if request.user.id == profile.user_id:
             return JsonResponse({'error': 'Cannot donate to yourself'}, status=400)
         
         amount = request.POST.get('amount')
@@ -181,7 +185,7 @@ def donate_to_username(request, username):
         
         donation = Donation(
             donor=request.user,
-            streamer=streamer,
+            streamer=profile.as_user(),
             amount=Decimal(amount),
             payment_method=payment_method,
             payment_id="temp"
@@ -199,4 +203,152 @@ def donate_to_username(request, username):
     except ValueError as e:
         return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({'error': str(e)}, status=500)
+
+# Async counterparts served under ASGI. A payment spends most of its time waiting on the gateway,
+# which these views await over HTTP instead of holding a thread; only the short DB steps are offloaded.
+# payments/urls.py routes the sync views above instead under WSGI (PAYMENT_ASYNC_VIEWS).
+
+def settle_donation(donation):
+    """ Roll the unlocked emotes and write the ledger rows for a processed donation. """
+    unlocked_emotes = donation.unlock_emotes()
+    donation.distribute_funds()
+    return unlocked_emotes
+
+@csrf_exempt
+@require_POST
+@login_required
+async def adonate(request):
+    try:
+        donor = await request.auser()
+        streamer_id = request.POST.get('streamer_id')
+        amount = request.POST.get('amount')
+        payment_method = request.POST.get('payment_method')
+        payment_token = request.POST.get('payment_token')
+
+        if not all([streamer_id, amount, payment_method, payment_token]):
+            return JsonResponse({'error': 'Missing required fields'}, status=400)
+
+        streamer = await User.objects.aget(id=streamer_id)
+        if streamer == donor:
+            return JsonResponse({'error': 'Cannot donate to yourself'}, status=400)
+
+        donation = Donation(
+            donor=donor,
+            streamer=streamer,
+            amount=Decimal(amount),
+            payment_method=payment_method,
+            payment_id="temp"
+        )
+        await donation.aprocess_payment(payment_token)
+        unlocked_emotes = await sync_to_async(settle_donation)(donation)
+
+        return JsonResponse({
+            'message': 'Donation successful',
+            'unlocked_emotes': unlocked_emotes,
+            'donation_id': donation.id
+        })
+
+    except User.DoesNotExist:
+        return JsonResponse({'error': 'Streamer not found'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required
+@require_POST
+async def arequest_payout(request):
+    try:
+        user = await request.auser()
+        amount = request.POST.get('amount')
+        method = request.POST.get('method')
+
+        if not all([amount, method]):
+            return JsonResponse({'error': 'Missing required fields'}, status=400)
+
+        payout = Payout(user=user, amount=Decimal(amount), method=method)
+        await payout.aprocess_payout()
+
+        return JsonResponse({
+            'message': 'Payout requested',
+            'payout_id': payout.id,
+            'net_amount': f"{payout.net_amount():.2f}",
+            'fee': f"{payout.calculate_payout_fee():.2f}"
+        })
+
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@login_required
+@require_POST
+async def aconnect_stripe(request):
+    try:
+        user = await request.auser()
+        account = await gateways.stripe_post('/v1/accounts', {
+            "type": "express",
+            "email": user.email,
+            "capabilities": {"transfers": {"requested": True}},
+        })
+        user.stripe_account_id = account['id']
+        await user.asave(update_fields=['stripe_account_id', 'date_updated'])
+        account_link = await gateways.stripe_post('/v1/account_links', {
+            "account": account['id'],
+            "refresh_url": "http://localhost:8000/payments/refresh/",
+            "return_url": "http://localhost:8000/payments/success/",
+            "type": "account_onboarding",
+        })
+        donation_link = user.donation_link
+        return JsonResponse({
+            'url': account_link['url'],
+            'donation_link': donation_link if donation_link else 'Complete setup to get your donation link'
+        })
+    except gateways.GatewayError as e:
+        return JsonResponse({'error': f"Stripe error: {str(e)}"}, status=500)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_POST
+@login_required
+async def adonate_to_username(request, username):
+    """ Handle donations via a custom link. """
+    try:
+        profile = await aget_payment_profile(username.lstrip('@'))
+        if profile is None:
+            return JsonResponse({'error': 'User not found'}, status=404)
+        if not profile.eligible:
+            return JsonResponse({'error': 'This user is not accepting donations'}, status=400)
+        donor = await request.auser()
+        if donor.id == profile.user_id:
+            return JsonResponse({'error': 'Cannot donate to yourself'}, status=400)
+
+        amount = request.POST.get('amount')
+        payment_method = request.POST.get('payment_method')
+        payment_token = request.POST.get('payment_token')
+
+        if not all([amount, payment_method, payment_token]):
+            return JsonResponse({'error': 'Missing required fields'}, status=400)
+
+        donation = Donation(
+            donor=donor,
+            streamer=profile.as_user(),
+            amount=Decimal(amount),
+            payment_method=payment_method,
+            payment_id="temp"
+        )
+        await donation.aprocess_payment(payment_token)
+        unlocked_emotes = await sync_to_async(settle_donation)(donation)
+
+        return JsonResponse({
+            'message': f"Donation to {username} successful",
+            'unlocked_emotes': unlocked_emotes,
+            'donation_id': donation.id
+        })
+
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
@@ -1,8 +1,16 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django import forms
+from django.core.exceptions import ValidationError
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from decimal import Decimal
 import json
 from .models import User, AdminUser
+from emotes.catalog import get_emote
 from emotes.models import Emote
+from emotes.services import SPECIAL_ROLE_FIELDS, grant_emote, revoke_emote, set_role
+from payments.models import BalanceTransaction
 
 class UserEmoteForm(forms.ModelForm):
     emotes = forms.CharField(
@@ -21,22 +29,46 @@ class UserEmoteForm(forms.ModelForm):
             return self.instance.emotes
         try:
             emotes_dict = json.loads(emotes_str)
-            for emote_name, count in emotes_dict.items():
-                emote = Emote.objects.get(name=emote_name)
-                if emote.is_special() and count > 1:
-                    raise forms.ValidationError(f"Special emote '{emote_name}' cannot exceed 1 instance unless set by superuser.")
-            return emotes_str
         except json.JSONDecodeError:
             raise forms.ValidationError("Invalid JSON format.")
-        except Emote.DoesNotExist:
-            raise forms.ValidationError(f"Emote '{emote_name}' does not exist.")
+        for emote_name, count in emotes_dict.items():
+            emote = get_emote(name=emote_name)
+            if emote is None:
+                raise forms.ValidationError(f"Emote '{emote_name}' does not exist.")
+            if emote.is_special() and count > 1:
+                raise forms.ValidationError(f"Special emote '{emote_name}' cannot exceed 1 instance unless set by superuser.")
+        return emotes_str
+
+class InventoryActionForm(ActionForm):
+    emote = forms.ModelChoiceField(
+        queryset=Emote.objects.order_by('name'),
+        required=False,
+        help_text="Emote for the grant/revoke actions.",
+    )
+
+def role_action(rarity, value):
+    """ Admin action setting (or clearing) one role for the selected users. """
+    verb = "Set" if value else "Clear"
+
+    def action(modeladmin, request, queryset):
+        changed, granted = set_role(queryset, rarity, value)
+        modeladmin.message_user(request, f"{verb} {rarity} role on {changed} users; granted {granted} {rarity} emotes.")
+
+    action.__name__ = f"{verb.lower()}_{rarity}_role"
+    return admin.action(description=f"{verb} {rarity} role", permissions=['superuser'])(action)
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'display_name', 'email', 'twitch_id', 'balance_display', 'preferred_payout_method', 'agreed_to_terms', 'donation_link_display', 'is_staff', 'is_superuser')
     list_filter = ('is_staff', 'is_superuser')
-    search_fields = ('username', 'display_name', 'email', 'twitch_id')
+    search_fields = ('username', 'display_name', 'email', '^twitch_id')  # Indexed in User.Meta
     readonly_fields = ('twitch_id', 'balance_display', 'donation_link_display', 'changes_log', 'date_joined', 'last_login')
+    action_form = InventoryActionForm
+    actions = [
+        'grant_selected_emote',
+        'revoke_selected_emote',
+        *(role_action(rarity, value) for rarity in SPECIAL_ROLE_FIELDS for value in (True, False)),
+    ]
     fieldsets = (
         (None, {'fields': ('username', 'display_name', 'email', 'twitch_id', 'paypal_email', 'stripe_account_id')}),
         ('Payout Preferences', {'fields': ('preferred_payout_method', 'agreed_to_terms')}),
@@ -53,46 +85,82 @@ class UserAdmin(admin.ModelAdmin):
         ('Dates', {'fields': ('date_joined', 'last_login')}),
     )
 
+    def has_superuser_permission(self, request):
+        return request.user.is_superuser
+
+    def action_emote(self, request):
+        try:
+            emote = self.action_form.base_fields['emote'].clean(request.POST.get('emote'))
+        except ValidationError:
+            emote = None
+        if emote is None:
+            self.message_user(request, "Choose an emote for this action.", messages.WARNING)
+        return emote
+
+    @admin.action(description="Grant chosen emote", permissions=['superuser'])
+    def grant_selected_emote(self, request, queryset):
+        emote = self.action_emote(request)
+        if emote is None:
+            return
+        try:
+            granted = grant_emote(emote, queryset)
+        except ValueError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, f"Granted {emote.name} to {granted} users.")
+
+    @admin.action(description="Revoke chosen emote", permissions=['superuser'])
+    def revoke_selected_emote(self, request, queryset):
+        emote = self.action_emote(request)
+        if emote is None:
+            return
+        changed, revoked = revoke_emote(emote, queryset)
+        self.message_user(request, f"Revoked {revoked} {emote.name} from {changed} users.")
+
+    def get_queryset(self, request):
+        # One correlated subquery per page instead of a ledger query per row in balance_display
+        totals = (
+            BalanceTransaction.objects.filter(user=OuterRef('pk')).order_by()
+            .values('user').annotate(total=Sum('amount')).values('total')
+        )
+        return super().get_queryset(request).annotate(balance_total=Coalesce(
+            Subquery(totals), Value(Decimal('0.00')), output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+
     def balance_display(self, obj):
-        return f"{obj.balance:.2f}"
+        balance = obj.balance_total if hasattr(obj, 'balance_total') else obj.balance
+        return f"{balance:.2f}"
     balance_display.short_description = "Balance"
+    balance_display.admin_order_field = 'balance_total'
 
     def donation_link_display(self, obj):
         return obj.donation_link or "Not available (requiures payment setup and terms agreement)"
     donation_link_display.short_description = "Donation Link"
 
     def save_model(self, request, obj, form, change):
+        role_fields = SPECIAL_ROLE_FIELDS.values()
+        # Roles as stored before this edit, fetched once
+        if change:
+            original = User.objects.filter(pk=obj.pk).values(*role_fields).get()
+        else:
+            original = dict.fromkeys(role_fields, False)
+
         if not request.user.is_superuser:
             # Non-superusers can't edit roles
-            obj.is_artist = obj._original_is_artist if hasattr(obj, '_original_is_artist') else False
-            obj.is_developer = obj._original_is_developer if hasattr(obj, '_original_is_developer') else False
-            obj.is_founder = obj._original_is_founder if hasattr(obj, '_original_is_founder') else False
+            for field, value in original.items():
+                setattr(obj, field, value)
         else:
-            # Store original values for comparison
-            if not change:
-                obj._original_is_artist = False
-                obj._original_is_developer = False
-                obj._original_is_founder = False
-            else:
-                obj._original_is_artist = User.objects.get(pk=obj.pk).is_artist
-                obj._original_is_developer = User.objects.get(pk=obj.pk).is_developer
-                obj._original_is_founder = User.objects.get(pk=obj.pk).is_founder
-
             # Assign emotes if roles changed
-            if obj.is_artist and not obj._original_is_artist:
-                obj.assign_role_emotes('is_artist', 'artist')
-            if obj.is_developer and not obj._original_is_developer:
-                obj.assign_role_emotes('is_developer', 'developer')
-            if obj.is_founder and not obj._original_is_founder:
-                obj.assign_role_emotes('is_founder', 'founder')
+            for rarity, field in SPECIAL_ROLE_FIELDS.items():
+                if getattr(obj, field) and not original[field]:
+                    obj.assign_role_emotes(field, rarity)
 
         if request.user.is_superuser and form.cleaned_data['emotes']:
             obj.set_emotes(json.loads(form.cleaned_data['emotes']))
         elif form.cleaned_data['emotes']:
             emotes_dict = json.loads(form.cleaned_data['emotes'])
             for emote_name, count in emotes_dict.items():
-                emote = Emote.objects.get(name=emote_name)
-                if emote.is_special() and count > 1:
+                if get_emote(name=emote_name).is_special() and count > 1:
                     emotes_dict[emote_name] = 1
             obj.set_emotes(emotes_dict)
 
@@ -6,4 +6,7 @@ class UsersConfig(AppConfig):
     name = 'users'
 
     def ready(self):
-        import users.signals
\ No newline at end of file
+        import users.signals
+        from django.db.models.signals import pre_migrate
+        from emoterush.search import create_trigram_extension
+        pre_migrate.connect(create_trigram_extension, sender=self)
\ No newline at end of file
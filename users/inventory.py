@@ -0,0 +1,142 @@
+"""
+Versioned per-user inventory read cache.
+
+User.emotes is JSON keyed by emote name; readers that only need "who owns what" get the same
+data from the shared cache as a compact blob: (emote ID delta, count) pairs in ascending ID
+order, each written as an unsigned LEB128 varint, so a typical entry costs 2-3 bytes. Every
+change to User.emotes bumps User.inventory_version and, once committed, starts a new cache
+generation for the user. Entries are stamped with the generation read before the database, so
+a fill racing a commit lands under the old generation and is never served; the next read
+reloads it in one query.
+"""
+import json
+import uuid
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+CACHE_PREFIX = 'inventory:'
+GENERATION_PREFIX = 'inventory_generation:'
+
+def write_varint(out, value):
+    while value > 0x7f:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode_inventory(counts):
+    """ {emote_id: count} -> bytes. Zero and negative counts are dropped. """
+    out = bytearray()
+    previous = 0
+    for emote_id in sorted(counts):
+        count = counts[emote_id]
+        if count > 0:
+            write_varint(out, emote_id - previous)
+            write_varint(out, count)
+            previous = emote_id
+    return bytes(out)
+
+def decode_inventory(blob):
+    """ bytes -> {emote_id: count}. """
+    values = []
+    value = shift = 0
+    for byte in blob:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    counts = {}
+    emote_id = 0
+    for i in range(0, len(values), 2):
+        emote_id += values[i]
+        counts[emote_id] = values[i + 1]
+    return counts
+
+def inventory_from_json(emotes_json, catalog):
+    """ Name-keyed User.emotes JSON -> {emote_id: count}; names no longer in the catalog are skipped. """
+    by_name = catalog.by_name
+    return {by_name[name].id: count for name, count in json.loads(emotes_json or '{}').items() if name in by_name}
+
+class Inventory(namedtuple('Inventory', ['user_id', 'version', 'blob'])):
+    """ A user's holdings at `version`; `blob` is the compact encoding. """
+    __slots__ = ()
+
+    def counts(self):
+        return decode_inventory(self.blob)
+
+    def by_name(self):
+        from emotes.catalog import get_catalog
+        by_id = get_catalog().by_id
+        return {by_id[emote_id].name: count for emote_id, count in self.counts().items() if emote_id in by_id}
+
+def cache_key(user_id):
+    return f"{CACHE_PREFIX}{user_id}"
+
+def generation_key(user_id):
+    return f"{GENERATION_PREFIX}{user_id}"
+
+def new_generation():
+    return uuid.uuid4().hex[:12]
+
+def load_inventories(generations):
+    """
+    Build inventories from the primary in one query and cache each under the user's generation
+    (user_id -> generation, read before this query); a lagging replica would cache old holdings.
+    """
+    from emotes.catalog import get_catalog
+    from .models import User
+    catalog = get_catalog()
+    inventories = {
+        user_id: Inventory(user_id, version, encode_inventory(inventory_from_json(emotes, catalog)))
+        for user_id, version, emotes in User.objects.using(DEFAULT_DB_ALIAS).filter(id__in=generations).values_list('id', 'inventory_version', 'emotes')
+    }
+    if inventories:
+        cache.set_many(
+            {cache_key(user_id): (generations[user_id], inventory.version, inventory.blob) for user_id, inventory in inventories.items()},
+            settings.INVENTORY_CACHE_TIMEOUT,
+        )
+    return inventories
+
+def get_many(user_ids, versions=None):
+    """
+    {user_id: Inventory} for every existing user in `user_ids`: one cache round trip plus one
+    query for the misses.
+    Args:
+        versions (dict): Optional user_id -> current inventory_version; cached entries at any
+            other version are treated as misses.
+    """
+    user_ids = set(user_ids)
+    cached = cache.get_many([key for user_id in user_ids for key in (cache_key(user_id), generation_key(user_id))])
+    inventories = {}
+    generations = {}
+    for user_id in user_ids:
+        generation = cached.get(generation_key(user_id))
+        entry = cached.get(cache_key(user_id))
+        if generation is not None and entry is not None and entry[0] == generation and (versions is None or versions.get(user_id) == entry[1]):
+            inventories[user_id] = Inventory(user_id, *entry[1:])
+        else:
+            generations[user_id] = generation
+    unstamped = {user_id: new_generation() for user_id, generation in generations.items() if generation is None}
+    if unstamped:
+        # Overwriting a concurrent stamp is safe: any token stored after a commit outdates fills begun before it
+        cache.set_many({generation_key(user_id): generation for user_id, generation in unstamped.items()}, settings.INVENTORY_CACHE_TIMEOUT)
+        generations.update(unstamped)
+    if generations:
+        inventories.update(load_inventories(generations))
+    return inventories
+
+def get_inventory(user_id):
+    """ One user's Inventory, or None if the user does not exist. """
+    return get_many([user_id]).get(user_id)
+
+def invalidate_inventories(user_ids):
+    """ Start a new generation: cached entries, including fills still in flight from older reads, stop matching. """
+    cache.set_many({generation_key(user_id): new_generation() for user_id in user_ids}, settings.INVENTORY_CACHE_TIMEOUT)
+
+def invalidate_on_commit(user_ids):
+    """ Evict cached inventories once the transaction that changed them commits. """
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: invalidate_inventories(user_ids))
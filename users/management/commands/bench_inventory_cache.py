@@ -0,0 +1,66 @@
+import json
+import pickle
+import random
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from emotes.catalog import EmoteCatalog
+from users.inventory import decode_inventory, encode_inventory, inventory_from_json
+
+class Command(BaseCommand):
+    help = 'Compare memory and decode cost of name-keyed JSON inventories against the compact cache encoding'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Inventories to build.')
+        parser.add_argument('--catalog', type=int, default=5000, help='Emotes in the synthetic catalog.')
+        parser.add_argument('--per-user', type=int, default=40, help='Distinct emotes held per user.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        catalog = EmoteCatalog(
+            (i, f"emote{i}", f"ER:emote{i}", 'common', None) for i in range(1, options['catalog'] + 1)
+        )
+        names = list(catalog.by_name)
+        documents = [
+            json.dumps({name: rng.randint(1, 5) for name in rng.sample(names, options['per_user'])})
+            for _ in range(options['users'])
+        ]
+
+        parsed, parse_seconds = self.measure(lambda: [json.loads(document) for document in documents])
+        blobs, encode_seconds = self.measure(lambda: [encode_inventory(inventory_from_json(document, catalog)) for document in documents])
+        _, decode_seconds = self.measure(lambda: [decode_inventory(blob) for blob in blobs])
+
+        users = options['users']
+        rows = [
+            ('JSON text (cached as-is)', self.footprint(lambda: [document.encode().decode() for document in documents]),
+             sum(len(pickle.dumps(document)) for document in documents)),
+            ('Parsed name-keyed dicts', self.footprint(lambda: [json.loads(document) for document in documents]), None),
+            ('Compact blobs', self.footprint(lambda: [bytes(bytearray(blob)) for blob in blobs]),
+             sum(len(pickle.dumps((1, blob))) for blob in blobs)),
+        ]
+        self.stdout.write(f"{users:,} users x {options['per_user']} emotes from a {options['catalog']:,}-emote catalog")
+        self.stdout.write(f"{'Representation':<26}{'Heap/user':>12}{'Cached/user':>14}")
+        for label, heap, cached in rows:
+            cached_text = f"{cached / users:,.0f} B" if cached is not None else '-'
+            self.stdout.write(f"{label:<26}{heap / users:>10,.0f} B{cached_text:>14}")
+        self.stdout.write(f"json.loads:    {parse_seconds / users * 1e6:,.1f} us/user")
+        self.stdout.write(f"encode:        {encode_seconds / users * 1e6:,.1f} us/user (on cache fill only)")
+        self.stdout.write(f"decode:        {decode_seconds / users * 1e6:,.1f} us/user")
+
+    def measure(self, build):
+        started = time.perf_counter()
+        result = build()
+        return result, time.perf_counter() - started
+
+    def footprint(self, build):
+        """ Bytes still allocated by the objects `build` returns. """
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            result = build()
+            size = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        del result
+        return size
@@ -0,0 +1,92 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter per sample: this process has already paid for django.setup()
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+setup = time.perf_counter() - started
+if sys.argv[1] == 'urls':
+    from django.urls import get_resolver
+    get_resolver().url_patterns  # Imports ROOT_URLCONF and every views module it names
+print(json.dumps({'setup': setup, 'total': time.perf_counter() - started}))
+'''
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+# Loaded on first use; showing up here means a module-level import crept back in
+LAZY_MODULES = ('stripe', 'paypalrestsdk', 'PIL', 'httpx')
+
+class Command(BaseCommand):
+    help = 'Measure cold django.setup() time in fresh processes, with a per-module import breakdown'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh processes to sample; medians are reported.')
+        parser.add_argument('--top', type=int, default=15, help='Rows in each breakdown.')
+        parser.add_argument('--urls', action='store_true', help='Also import the URLconf and views, as a worker does before its first request.')
+
+    def handle(self, *args, **options):
+        samples = [self.sample(options['urls']) for _ in range(options['runs'])]
+        setups = [timing['setup'] for timing, _ in samples]
+        totals = [timing['total'] for timing, _ in samples]
+        self.stdout.write(
+            f"django.setup(): median {statistics.median(setups) * 1000:.0f}ms "
+            f"(min {min(setups) * 1000:.0f}ms, max {max(setups) * 1000:.0f}ms) over {len(samples)} runs"
+        )
+        if options['urls']:
+            self.stdout.write(f"setup + URLconf: median {statistics.median(totals) * 1000:.0f}ms")
+
+        packages = self.medians([self.package_self_times(imports) for _, imports in samples])
+        self.table('Self time by top-level package', packages, options['top'])
+        cumulative = self.medians([
+            {name: cumulative for name, (_, cumulative, depth) in imports.items() if depth == 0}
+            for _, imports in samples
+        ])
+        self.table('Cumulative time of outermost imports', cumulative, options['top'])
+
+        loaded = self.medians([{name: cumulative for name, (_, cumulative, _) in imports.items()} for _, imports in samples])
+        self.stdout.write('\nLazily loaded modules:')
+        for name in LAZY_MODULES:
+            if name in loaded:
+                self.stdout.write(self.style.WARNING(f"  {name:<20} imported at startup ({loaded[name] / 1000:.1f}ms)"))
+            else:
+                self.stdout.write(f"  {name:<20} not imported")
+
+    def sample(self, urls):
+        """ One fresh interpreter: its timings and {module: (self us, cumulative us, depth)}. """
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE, 'urls' if urls else 'setup'],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True, check=True,
+        )
+        imports = {}
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if match:
+                self_us, cumulative_us, indent, name = match.groups()
+                imports[name] = (int(self_us), int(cumulative_us), (len(indent) - 1) // 2)
+        return json.loads(result.stdout.strip().splitlines()[-1]), imports
+
+    def package_self_times(self, imports):
+        totals = defaultdict(int)
+        for name, (self_us, _, _) in imports.items():
+            totals[name.split('.')[0]] += self_us
+        return totals
+
+    def medians(self, runs):
+        """ Per-key median across runs, counting a key missing from a run as zero. """
+        keys = set().union(*runs)
+        return {key: statistics.median(run.get(key, 0) for run in runs) for key in keys}
+
+    def table(self, title, times, top):
+        self.stdout.write(f"\n{title}:")
+        for name, us in sorted(times.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"  {name:<40} {us / 1000:8.1f}ms")
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser, AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
 import json
@@ -6,6 +7,9 @@ from django.db.utils import OperationalError
 from django.apps import apps
 from decimal import Decimal
 from django.conf import settings
+from emoterush.search import postgres_indexes, prefix_index, trigram_index
+from .inventory import invalidate_on_commit
+from . import profiles
 
 class User(AbstractUser):
     # Core fields from Twitch
@@ -29,6 +33,7 @@ class User(AbstractUser):
 
     # EmoteRush-specific fields
     emotes = models.TextField(default='{}', help_text="JSON of emote counts, e.g., {'pity1': 1, 'common1': 3}")     # JSON: {"ER:pity1": 1}
+    inventory_version = models.PositiveIntegerField(default=0, editable=False, help_text="Bumped on every change to emotes")
 
     # Roll designations
     is_artist = models.BooleanField(default=False, help_text="User is an Artist, gets all artist emotes")
@@ -46,7 +51,60 @@ class User(AbstractUser):
     class Meta:
         indexes = [
             models.Index(fields=['date_created'], name='idx_date_created'),
-        ]
+        ] + postgres_indexes(
+            # Admin search and the emote artist autocomplete (UserAdmin.search_fields)
+            trigram_index('username', 'idx_user_username_trgm'),
+            trigram_index('display_name', 'idx_user_display_name_trgm'),
+            trigram_index('email', 'idx_user_email_trgm'),
+            prefix_index('twitch_id', 'idx_user_twitch_id_prefix'),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_emotes = instance.__dict__.get('emotes')
+        instance._loaded_profile = instance.profile_values()
+        return instance
+
+    def profile_values(self):
+        """ Loaded values of the fields cached in the payment profile (None for deferred fields). """
+        return tuple(self.__dict__.get(field) for field in profiles.PROFILE_FIELDS)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        emotes_changed = (
+            'emotes' not in self.get_deferred_fields()
+            and (update_fields is None or 'emotes' in update_fields)
+            and self.emotes != getattr(self, '_loaded_emotes', None)
+        )
+        bump_version = emotes_changed and not self._state.adding
+        if bump_version:
+            # Incremented in SQL: a number computed from a stale instance could go backwards
+            self.inventory_version = F('inventory_version') + 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'inventory_version'}
+        elif update_fields is None and not self._state.adding:
+            # Only the F() bump writes inventory_version and only a changed inventory writes emotes,
+            # so a full save of a stale instance cannot roll back either
+            skipped = {'emotes', 'inventory_version'} | self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields if not field.primary_key and field.attname not in skipped
+            ]
+        loaded_profile = getattr(self, '_loaded_profile', None)
+        profile_changed = self.profile_values() != loaded_profile and (
+            update_fields is None or not set(profiles.PROFILE_FIELDS).isdisjoint(update_fields)
+        )
+        super().save(*args, **kwargs)
+        if bump_version:
+            self.refresh_from_db(fields=['inventory_version'])
+        if emotes_changed:
+            self._loaded_emotes = self.emotes
+            invalidate_on_commit([self.pk])
+        if profile_changed:
+            # Evict the old username too after a rename, and any cached miss for a new user's name
+            usernames = {self.username, loaded_profile[0] if loaded_profile else None} - {None}
+            profiles.invalidate_on_commit(usernames)
+            self._loaded_profile = self.profile_values()
 
     @property
     def balance(self):
@@ -65,39 +123,86 @@ class User(AbstractUser):
         return json.loads(self.emotes)
     
     def set_emotes(self, emotes_dict):
-        self.emotes = json.dumps(emotes_dict)
-        self.save()
+        """ Replace the inventory with `emotes_dict`. """
+        def replace(stored):
+            stored.clear()
+            stored.update(emotes_dict)
+        self.update_emotes(replace)
+
+    def update_emotes(self, edit):
+        """
+        Apply `edit` to the stored inventory and save the result if it changed. The row is re-read
+        under a lock and written with an UPDATE of the inventory alone, so edits made meanwhile by
+        other requests or the marketplace are neither lost nor overwritten.
+        Args:
+            edit (callable): Takes the emotes dict and changes it in place.
+        Returns:
+            bool: Whether the inventory changed.
+        """
+        if self._state.adding:
+            emotes_dict = self.get_emotes()
+            edit(emotes_dict)
+            self.emotes = json.dumps(emotes_dict)
+            self.save()
+            return True
+        with transaction.atomic():
+            stored = User.objects.select_for_update().values_list('emotes', flat=True).get(pk=self.pk)
+            emotes_dict = json.loads(stored)
+            edit(emotes_dict)
+            changed = emotes_dict != json.loads(stored)
+            if changed:
+                User.objects.filter(pk=self.pk).update(
+                    emotes=json.dumps(emotes_dict), inventory_version=F('inventory_version') + 1, date_updated=timezone.now(),
+                )
+                invalidate_on_commit([self.pk])
+                self.inventory_version, self.date_updated = (
+                    User.objects.values_list('inventory_version', 'date_updated').get(pk=self.pk)
+                )
+        self.emotes = self._loaded_emotes = json.dumps(emotes_dict) if changed else stored
+        return changed
 
     def add_emote(self, emote_name, count=1, force_special=False):
         """ Add an emote instance, respecting special emote limits unless forced. """
-        emotes_dict = self.get_emotes()
-        try:
-            Emote = apps.get_model('emotes', 'Emote')
-            emote = Emote.objects.get(name=emote_name)
+        from analytics.events import RollEventBuffer
+        from emotes.catalog import get_emote
+        granted = []
+        def add(emotes_dict):
+            emote = get_emote(name=emote_name)
+            if emote is None:
+                return # Skip unknown emotes
             current_count = emotes_dict.get(emote_name, 0)
             if emote.is_special() and current_count >=1 and not force_special:
                 return # Not duplicates for special emotes unless forced
-            if emote.allocate_instance(count):
+            if emote.allocate(count):
                 emotes_dict[emote_name] = current_count + count
-                self.set_emotes(emotes_dict)
-        except (Emote.DoesNotExist, OperationalError):
-            pass # Skip if emote or table doesn't exist
+                granted.extend([emote] * count)
+        try:
+            with transaction.atomic(), RollEventBuffer(kind='grant') as events:
+                self.update_emotes(add)
+                for emote in granted:
+                    events.add(self, emote)
+        except OperationalError:
+            pass # Skip if table doesn't exist
 
     def assign_role_emotes(self, role_field, rarity):
         """ Assign all emotes of a given rarity if the role is enabled. """
+        from analytics.events import RollEventBuffer
         if getattr(self, role_field):
-            emotes_dict = self.get_emotes()
             try:
                 Emote = apps.get_model('emotes', 'Emote')
-                role_emotes = Emote.objects.filter(rarity=rarity)
-                for emote in role_emotes:
-                    if emote.name not in emotes_dict or emotes_dict[emote.name] < 1:
-                        emotes_dict[emote.name] = 1
-                self.set_emotes(emotes_dict)
+                role_emotes = list(Emote.objects.filter(rarity=rarity))
+                granted = []
+                def assign(emotes_dict):
+                    for emote in role_emotes:
+                        if emote.name not in emotes_dict or emotes_dict[emote.name] < 1:
+                            emotes_dict[emote.name] = 1
+                            granted.append(emote)
+                with transaction.atomic(), RollEventBuffer(kind='grant') as events:
+                    self.update_emotes(assign)
+                    for emote in granted:
+                        events.add(self, emote)
             except OperationalError:
                 pass # Table doesn't exist yet, skip silently
-            except Emote.DoesNotExist:
-                pass # No emotes of this rarity, skip
 
     def update_from_twitch(self, twitch_data):
         """
@@ -132,7 +237,7 @@ class User(AbstractUser):
             timestamp = timezone.now().strftime("%d %B %Y %H:%M %Z")
             new_log = "\n".join([f"{timezone.now()}: {entry}" for entry in log_entries])
             self.changes_log = f"{current_log}\n{new_log}".strip()
-            self.save()
+            self.save(update_fields=[*fields_to_update, 'twitch_channel_url', 'changes_log', 'date_updated'])
 
     def __str__(self):
         return self.email or self.twitch_id
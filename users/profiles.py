@@ -0,0 +1,96 @@
+"""
+Cached streamer payment profiles for /donate/@username/ links.
+
+A raid sends thousands of donations at one streamer's link within seconds; each used to look the
+streamer up by username and recompute User.donation_link. The profile keeps what that path needs
+(user ID, username, donation link, enabled payout methods) in the shared cache, keyed by username.
+Unknown usernames are cached too, briefly. Each entry is stamped with its username's generation,
+read before the database; User.save starts a new generation once a change to the username,
+payment or terms fields commits. A reader that loaded the old row before that commit may still
+write its entry afterwards, but under the old generation, so it is never served.
+"""
+import uuid
+from collections import namedtuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+
+CACHE_PREFIX = 'payment_profile:'
+GENERATION_PREFIX = 'payment_profile_generation:'
+PROFILE_FIELDS = ('username', 'agreed_to_terms', 'paypal_email', 'stripe_account_id')
+MISSING = ()
+
+class PaymentProfile(namedtuple('PaymentProfile', ['user_id', 'username', 'donation_link', 'payout_methods'])):
+    """ What a donation link needs to know about its streamer. """
+    __slots__ = ()
+
+    @property
+    def eligible(self):
+        """ Accepting donations: terms agreed and at least one payout method set (see User.donation_link). """
+        return self.donation_link is not None
+
+    def as_user(self):
+        """ A User with only the ID and username loaded, enough to attach to a Donation; other fields load on access. """
+        from .models import User
+        return User.from_db(router.db_for_read(User), ['id', 'username'], [self.user_id, self.username])
+
+def cache_key(username):
+    return f"{CACHE_PREFIX}{username}"
+
+def generation_key(username):
+    return f"{GENERATION_PREFIX}{username}"
+
+def new_generation():
+    return uuid.uuid4().hex[:12]
+
+def load_profile(username, generation):
+    """ Build the profile from the database in one query and cache it (or the miss) under `generation`. """
+    from .models import User
+    user = User.objects.only('id', *PROFILE_FIELDS).filter(username=username).first()
+    if user is None:
+        cache.set(cache_key(username), (generation, MISSING), settings.PAYMENT_PROFILE_MISSING_TIMEOUT)
+        return None
+    methods = tuple(method for method, account in (('paypal', user.paypal_email), ('bank', user.stripe_account_id)) if account)
+    profile = PaymentProfile(user.id, user.username, user.donation_link, methods)
+    cache.set(cache_key(username), (generation, tuple(profile)), settings.PAYMENT_PROFILE_CACHE_TIMEOUT)
+    return profile
+
+def current_entry(username, found):
+    """ (generation, cached profile tuple or None) from one get_many of the entry and generation keys. """
+    generation = found.get(generation_key(username))
+    entry = found.get(cache_key(username))
+    if generation is not None and entry is not None and entry[0] == generation:
+        return generation, entry[1]
+    return generation, None
+
+def from_entry(entry):
+    return PaymentProfile(*entry) if entry else None
+
+def get_payment_profile(username):
+    """ The streamer's PaymentProfile, or None if no user has this username. """
+    generation, entry = current_entry(username, cache.get_many([cache_key(username), generation_key(username)]))
+    if entry is not None:
+        return from_entry(entry)
+    if generation is None:
+        cache.add(generation_key(username), new_generation(), settings.PAYMENT_PROFILE_CACHE_TIMEOUT)
+        generation = cache.get(generation_key(username))
+    return load_profile(username, generation)
+
+async def aget_payment_profile(username):
+    generation, entry = current_entry(username, await cache.aget_many([cache_key(username), generation_key(username)]))
+    if entry is not None:
+        return from_entry(entry)
+    if generation is None:
+        await cache.aadd(generation_key(username), new_generation(), settings.PAYMENT_PROFILE_CACHE_TIMEOUT)
+        generation = await cache.aget(generation_key(username))
+    return await sync_to_async(load_profile)(username, generation)
+
+def invalidate_profiles(usernames):
+    """ Start a new generation: cached profiles, including fills still in flight from older reads, stop matching. """
+    cache.set_many({generation_key(username): new_generation() for username in usernames}, settings.PAYMENT_PROFILE_CACHE_TIMEOUT)
+
+def invalidate_on_commit(usernames):
+    """ Evict cached profiles once the transaction that changed them commits. """
+    usernames = list(usernames)
+    transaction.on_commit(lambda: invalidate_profiles(usernames))
@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from .models import User
-from emotes.models import Emote
+from analytics.events import RollEventBuffer
+from emotes.catalog import get_catalog
+from . import profiles
 
 @receiver(post_save, sender=User)
 def assign_existing_emotes(sender, instance, created, **kwargs):
@@ -9,39 +12,52 @@ def assign_existing_emotes(sender, instance, created, **kwargs):
     if not created:
         return # Only trigger on user creation
     
-    emotes_dict = instance.get_emotes()
-
-    # Assign all pity emotes
-    pity_emotes = Emote.objects.filter(rarity='pity')
-    for emote in pity_emotes:
-        if emote.name not in emotes_dict or emotes_dict[emote.name] < 1:
-            if instance.allocate_instance():
-                emotes_dict[emote.name] = 1
-
-    # Assign earlydays emotes if user is in first 100
+    catalog = get_catalog()
     early_users = User.objects.order_by('date_created')[:100]
     early_user_id = {user.id for user in early_users}
-    if instance.id in early_user_id:
-        earlydays_emotes = Emote.objects.filter(rarity='earlydays')
-        for emote in earlydays_emotes:
-            if emote.name not in emotes_dict or emotes_dict[emote.name] < 1:
-                if instance.allocate_instance():
-                    emotes_dict[emote.name] = 1
-
-    # Assign role-based emotes (artist, developer, founder)
     role_field_map = {
         'is_artist': 'artist',
         'is_developer': 'developer',
         'is_founder': 'founder',
     }
-    for role_field, rarity in role_field_map.items():
-        if getattr(instance, role_field):
-            role_emotes = Emote.objects.filter(rarity=rarity)
-            for emote in role_emotes:
+    granted = []
+
+    def assign(emotes_dict):
+        # Assign all pity emotes
+        pity_emotes = catalog.by_rarity.get('pity', [])
+        for emote in pity_emotes:
+            if emote.name not in emotes_dict or emotes_dict[emote.name] < 1:
+                if emote.allocate():
+                    emotes_dict[emote.name] = 1
+                    granted.append(emote)
+
+        # Assign earlydays emotes if user is in first 100
+        if instance.id in early_user_id:
+            earlydays_emotes = catalog.by_rarity.get('earlydays', [])
+            for emote in earlydays_emotes:
                 if emote.name not in emotes_dict or emotes_dict[emote.name] < 1:
-                    if instance.allocate_instance():
+                    if emote.allocate():
                         emotes_dict[emote.name] = 1
+                        granted.append(emote)
+
+        # Assign role-based emotes (artist, developer, founder)
+        for role_field, rarity in role_field_map.items():
+            if getattr(instance, role_field):
+                role_emotes = catalog.by_rarity.get(rarity, [])
+                for emote in role_emotes:
+                    if emote.name not in emotes_dict or emotes_dict[emote.name] < 1:
+                        if emote.allocate():
+                            emotes_dict[emote.name] = 1
+                            granted.append(emote)
+                        granted.append(emote)
+
+    # Save updated emotes (only written if changed) and log the grants with them
+    with transaction.atomic(), RollEventBuffer(kind='grant') as events:
+        instance.update_emotes(assign)
+        for emote in granted:
+            events.add(instance, emote)
 
-    # Save updated emotes
-    if emotes_dict != instance.get_emotes(): # Only save if changed
-        instance.set_emotes(emotes_dict)
\ No newline at end of file
+@receiver(post_delete, sender=User)
+def evict_payment_profile(sender, instance, **kwargs):
+    """ A deleted streamer's donation link stops resolving once the delete commits. """
+    profiles.invalidate_on_commit([instance.username])
@@ -1,3 +1,117 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from emoterush.testing import QueryBudgetMixin
+from emotes.catalog import clear_catalog
+from emotes.models import Emote
+from payments.models import BalanceTransaction
+from .inventory import decode_inventory, encode_inventory, generation_key, get_inventory, invalidate_inventories, load_inventories
+from .models import AdminUser, User
 
-# Create your tests here.
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+@override_settings(CACHES=LOCAL_CACHE)
+class AdminQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """ Admin pages stay within the '/admin/' budget with a full page of rows. """
+
+    @classmethod
+    def setUpTestData(cls):
+        Emote.objects.bulk_create([
+            Emote(name=f"common{i}", chat_display_name=f"ER:common{i}", rarity='common', remaining_instances=1000)
+            for i in range(120)
+        ])
+        users = User.objects.bulk_create([
+            User(
+                username=f"user{i}", email=f"user{i}@example.com", twitch_id=str(i), twitch_channel_url=f"https://twitch.tv/user{i}",
+                agreed_to_terms=True, paypal_email=f"user{i}@example.com", emotes=json.dumps({f"common{i}": 1}),
+            )
+            for i in range(120)
+        ])
+        BalanceTransaction.objects.bulk_create([
+            BalanceTransaction(user=user, amount=Decimal('5.00'), transaction_type='donation_streamer', source='test')
+            for user in users for _ in range(3)
+        ])
+        cls.admin = AdminUser.objects.create_superuser('admin', 'password')
+
+    def setUp(self):
+        cache.clear()
+        clear_catalog()
+        self.client.force_login(self.admin)
+
+    def test_user_changelist(self):
+        for path in ('/admin/users/user/', '/admin/users/user/?q=user1', '/admin/users/user/?is_staff__exact=0'):
+            with self.subTest(path=path):
+                response = self.assertWithinQueryBudget('get', path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_user_change_form(self):
+        user = User.objects.get(username='user7')
+        response = self.assertWithinQueryBudget('get', f'/admin/users/user/{user.pk}/change/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_emote_changelist(self):
+        response = self.assertWithinQueryBudget('get', '/admin/emotes/emote/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_emote_actions(self):
+        emote = Emote.objects.get(name='common0')
+        selected = list(User.objects.values_list('pk', flat=True))
+        for action in ('grant_selected_emote', 'revoke_selected_emote'):
+            with self.subTest(action=action):
+                response = self.assertWithinQueryBudget('post', '/admin/users/user/', data={
+                    'action': action, 'emote': emote.pk, '_selected_action': selected,
+                })
+                self.assertEqual(response.status_code, 302)
+        self.assertFalse(User.objects.filter(emotes__contains='"common0"').exists())
+
+@override_settings(CACHES=LOCAL_CACHE)
+class InventoryCacheTests(TestCase):
+    """ The compact inventory encoding and the generation-stamped cache in front of it. """
+
+    @classmethod
+    def setUpTestData(cls):
+        Emote.objects.bulk_create([
+            Emote(name=f"common{i}", chat_display_name=f"ER:common{i}", rarity='common', remaining_instances=1000)
+            for i in range(3)
+        ])
+        cls.user = User.objects.create(username='holder', email='holder@example.com', twitch_id='1', twitch_channel_url='https://twitch.tv/holder')
+
+    def setUp(self):
+        cache.clear()
+        clear_catalog()
+
+    def test_varint_round_trip(self):
+        counts = {1: 1, 2: 127, 130: 128, 20000: 3, 2 ** 40: 2 ** 20}
+        blob = encode_inventory({**counts, 7: 0, 9: -1})
+        self.assertEqual(decode_inventory(blob), counts)
+        self.assertEqual(len(encode_inventory({1: 1, 2: 5})), 4)  # One byte per small delta and count
+        self.assertEqual(decode_inventory(b''), {})
+
+    def test_change_starts_new_generation(self):
+        emote = Emote.objects.get(name='common1')
+        self.assertEqual(get_inventory(self.user.id).counts(), {})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_emotes({'common1': 2})
+        inventory = get_inventory(self.user.id)
+        self.assertEqual(inventory.counts(), {emote.id: 2})
+        self.assertEqual(inventory.version, User.objects.get(pk=self.user.pk).inventory_version)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_inventory(self.user.id).by_name(), {'common1': 2})
+
+    def test_fill_racing_a_commit_is_never_served(self):
+        get_inventory(self.user.id)
+        stale_generation = cache.get(generation_key(self.user.id))
+        User.objects.filter(pk=self.user.pk).update(emotes=json.dumps({'common0': 1}))
+        invalidate_inventories([self.user.id])
+        load_inventories({self.user.id: stale_generation})  # A reader that started before the commit finishes late
+        self.assertEqual(get_inventory(self.user.id).by_name(), {'common0': 1})
+
+    def test_stale_save_keeps_inventory_version(self):
+        stale = User.objects.get(pk=self.user.pk)
+        self.user.set_emotes({'common0': 1})
+        self.user.set_emotes({'common0': 2})
+        self.assertEqual(self.user.inventory_version, 2)
+        stale.display_name = 'Holder'
+        stale.save()
+        self.assertEqual(User.objects.values_list('inventory_version', flat=True).get(pk=self.user.pk), 2)